@@ -1,10 +1,13 @@
 from playwright.sync_api import sync_playwright
 import pandas as pd
+import atexit
 import time
 import os
 import pyotp
 import re
 import json
+from datetime import datetime
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 #FILENAME = 'populated_output.csv'
 #CLIENT = 'NewBaltimo'
@@ -23,6 +26,27 @@ print("🔐 Using credentials:"
       f"\nUSERNAME: {USERNAME}")
 #USER_DATA_DIR = os.path.abspath("chrome_profile")
 
+# === Upload profiles ===
+# debug: visible, slowed-down Chrome for watching a run
+# lean:  headless, no slow-mo, non-essential requests blocked, one warm
+#        browser reused across uploads in this process, trace kept on failure
+UPLOAD_PROFILE = os.getenv("UPLOAD_PROFILE", "debug")
+PROFILES = {
+    "debug": {"headless": False, "slow_mo": 50, "block": False, "persistent": False, "trace_on_failure": False},
+    "lean": {"headless": True, "slow_mo": 0, "block": True, "persistent": True, "trace_on_failure": True},
+}
+BROWSER_PROFILE_DIR = os.getenv("UPLOAD_BROWSER_PROFILE", os.path.abspath(os.path.join("Data", "browser_profile")))
+TRACE_DIR = os.path.abspath(os.path.join("Data", "logs", "traces"))
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+AO_HOME = "https://www.accountantsoffice.com/AoCommon/"
+
+# Nothing the upload reads or clicks depends on these
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "hotjar.com", "clarity.ms",
+    "facebook.net", "nr-data.net", "newrelic.com", "fullstory.com", "segment.io", "intercom.io",
+)
+
 def login_and_navigate(page):
     print("🔐 Logging in...")
     page.goto("https://login.accountantsoffice.com/")
@@ -41,10 +65,12 @@ def login_and_navigate(page):
     page.fill('input[name="Code"]', code)
     page.click('text=Submit')
 
-    page.wait_for_url("https://www.accountantsoffice.com/AoCommon/")
+    page.wait_for_url(AO_HOME)
     page.wait_for_load_state("networkidle")
     page.wait_for_timeout(3000)
+    open_payroll_relief(page)
 
+def open_payroll_relief(page):
     payroll_link = page.query_selector('a[title="Payroll Relief"]')
     page.evaluate("el => el.click()", payroll_link)
     page.wait_for_url(re.compile(r".*payrollrelief\.com.*"))
@@ -95,6 +121,7 @@ def upload_csv(page, file_path):
     ok_button.click()
     page.wait_for_load_state("networkidle")
     page.wait_for_timeout(10000)
+    return True
 
 def trigger_review(page):
     print("🖱️ Clicking Review button...")
@@ -102,6 +129,7 @@ def trigger_review(page):
     print("✅ Review triggered. Waiting 10 seconds...")
     page.wait_for_load_state("networkidle")
     page.wait_for_timeout(10000)
+    return True
 
 """def fill_federal_and_ny_tax_info(page, file_path):
     print("💰 Filling Federal and New York tax info...")
@@ -193,36 +221,122 @@ def fill_federal_and_ny_tax_info(page, file_path):
     print("✅ Saved all tax entries.")
 
 
+# === Browser sessions ===
+_sessions = {}  # profile name -> warm session (lean profile only)
+
+def block_nonessential(route, request, stats):
+    host = urlparse(request.url).hostname or ""
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or host.endswith(BLOCKED_HOSTS):
+        stats["blocked"] += 1
+        return route.abort()
+    return route.continue_()
+
+def open_session(profile_name):
+    if profile_name in _sessions:
+        return _sessions[profile_name]
+    profile = PROFILES[profile_name]
+    playwright = sync_playwright().start()
+    launch_args = ["--disable-blink-features=AutomationControlled"]
+    context_options = {"user_agent": USER_AGENT, "locale": "en-US"}
+    if profile["headless"]:
+        context_options["viewport"] = {"width": 1920, "height": 1080}
+    else:
+        launch_args.append("--start-maximized")
+        context_options["viewport"] = None
+
+    browser = None
+    if profile["persistent"]:
+        # Cache and cookies survive between processes; the login is reused within one
+        context = playwright.chromium.launch_persistent_context(
+            BROWSER_PROFILE_DIR, channel="chrome", headless=profile["headless"], slow_mo=profile["slow_mo"],
+            args=launch_args, **context_options
+        )
+    else:
+        browser = playwright.chromium.launch(
+            channel="chrome", headless=profile["headless"], slow_mo=profile["slow_mo"], args=launch_args
+        )
+        context = browser.new_context(**context_options)
+    context.set_extra_http_headers({"Accept-Language": "en-US,en;q=0.9"})
+
+    session = {"playwright": playwright, "browser": browser, "context": context, "logged_in": False,
+               "stats": {"blocked": 0}}
+    if profile["block"]:
+        context.route("**/*", lambda route, request: block_nonessential(route, request, session["stats"]))
+    if profile["trace_on_failure"]:
+        context.tracing.start(screenshots=True, snapshots=True)
+    session["page"] = context.pages[0] if context.pages else context.new_page()
+    if profile["persistent"]:
+        _sessions[profile_name] = session
+    return session
+
+def close_session(session):
+    for profile_name, warm in list(_sessions.items()):
+        if warm is session:
+            del _sessions[profile_name]
+    try:
+        session["context"].close()
+        if session["browser"] is not None:
+            session["browser"].close()
+    finally:
+        session["playwright"].stop()
+
+atexit.register(lambda: [close_session(s) for s in list(_sessions.values())])
+
+def ensure_payroll_relief(page, session):
+    # A warm session skips the login + TOTP round trip until the portal logs us out
+    if session["logged_in"]:
+        page.goto(AO_HOME)
+        page.wait_for_load_state("networkidle")
+        if page.url.startswith(AO_HOME):
+            open_payroll_relief(page)
+            return
+    login_and_navigate(page)
+    session["logged_in"] = True
+
+
 # === Main Bot Runner ===
-def run_upload_bot():
+def run_upload_bot(profile_name=None):
     FILENAME = os.environ["FILENAME"]
     CLIENT = os.environ["CLIENT"]
     PAY_PERIOD = os.environ["PAY_PERIOD"]
     PAY_DATE = os.environ["PAY_DATE"]
     FILE_PATH = os.environ["FILE_PATH"]
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            channel="chrome", headless=False, slow_mo=50,
-            args=["--start-maximized", "--disable-blink-features=AutomationControlled"]
-        )
-        context = browser.new_context(
-            viewport=None,
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-            locale="en-US"
-        )
-        context.set_extra_http_headers({"Accept-Language": "en-US,en;q=0.9"})
-        page = context.new_page()
-
-        login_and_navigate(page)
+    profile_name = profile_name or UPLOAD_PROFILE
+    profile = PROFILES[profile_name]
+    session = open_session(profile_name)
+    context, page = session["context"], session["page"]
+    blocked_before = session["stats"]["blocked"]
+    started = time.perf_counter()
+    if profile["trace_on_failure"]:
+        context.tracing.start_chunk()
+    uploaded = False  # True only once the CSV went up and the review ran
+    try:
+        ensure_payroll_relief(page, session)
         #select_client(page, CLIENT)
         #fill_payroll_period(page, PAY_PERIOD, PAY_DATE)
-        #upload_csv(page, FILE_PATH)
-        #trigger_review(page)
+        #uploaded = upload_csv(page, FILE_PATH) and trigger_review(page)
         #fill_federal_and_ny_tax_info(page, FILE_PATH)
         #print(f"✅ Completed run for client {CLIENT}")
+    except Exception:
+        if profile["trace_on_failure"]:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            trace_path = os.path.join(
+                TRACE_DIR, f"{CLIENT}-{PAY_DATE.replace('/', '-')}-{datetime.now():%Y%m%d-%H%M%S}.zip"
+            )
+            context.tracing.stop_chunk(path=trace_path)
+            print(f"🧵 Trace saved → {trace_path} (playwright show-trace {trace_path})")
+        close_session(session)  # the next upload starts from a fresh browser
+        raise
+    if profile["trace_on_failure"]:
+        context.tracing.stop_chunk()  # discarded: nothing to look at when it worked
+
+    print(f"⏱️ Upload run took {time.perf_counter() - started:.1f}s ({profile_name} profile, "
+          f"{session['stats']['blocked'] - blocked_before} requests blocked)")
+    if not profile["persistent"]:
         time.sleep(3)
-        context.close()
-        browser.close()
+        close_session(session)
+    return uploaded
+
 if __name__ == "__main__":
     run_upload_bot()
\ No newline at end of file
@@ -0,0 +1,495 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Only the standard library is imported up here. pandas, playwright, the
+# Google SDKs, openpyxl and requests are imported inside the subcommand that
+# needs them, so `--help` and `status` start in well under a second.
+BASE_FOLDER = "Extracted"
+HEAVY_MODULES = ("pandas", "numpy", "playwright", "google.generativeai", "google.genai", "openpyxl", "requests")
+STARTUP_BUDGET_MS = 300
+
+
+# === chunk ===
+def cmd_chunk(args):
+    path = args.path
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".xlsx" and args.split:
+        from src.register_splitter import split_workbook
+
+        # One chunk file per company / pay group; extract each with `extract --chunks`
+        split_workbook(path, args.client)
+        return 0
+    if ext == ".xlsx":
+        from src.excel_raw_text_chunk import extract_employee_chunks
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        output_path = args.out or os.path.join("Data", "raw_chunks", f"{stem}.json")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        extract_employee_chunks(path, output_path=output_path)
+        return 0
+    if ext in (".rtf", ".pdf"):
+        from src.register_splitter import chunk_rtf_sections
+        from ingest_daemon import infer_client
+
+        stem = os.path.splitext(path)[0]
+        client = infer_client(path, args.client)
+        if not client:
+            print("❌ Could not tell the client from the file name; pass --client")
+            return 1
+        # A combined register gives one folder per company / pay group
+        folders = chunk_rtf_sections(stem + ".rtf", args.pdf or stem + ".pdf", client, BASE_FOLDER)
+        if len(folders) > 1:
+            print(f"➡️ cli.py extract {' '.join(folders)}")
+        return 0
+    print(f"❌ Unsupported register type: {ext}")
+    return 1
+
+
+# === extract ===
+def cmd_extract(args):
+    if args.chunks:
+        from src.send_chunk_llm import extract_payroll_with_gemini
+
+        stem = os.path.splitext(os.path.basename(args.chunks))[0]
+        extract_payroll_with_gemini(
+            chunks_path=args.chunks,
+            success_path=args.out or os.path.join("Data", "output", "LLM", f"{stem}.json"),
+            failed_path=os.path.join("Data", "logs", f"{stem}_failed_chunks.json"),
+            delay_seconds=args.delay,
+        )
+        return 0
+
+    import lets_do_this
+
+    if not args.folders:
+        lets_do_this.main()
+        return 0
+    # Given folders share one worker pool, in the order given
+    lets_do_this.process_backlog([os.path.basename(folder.rstrip("/")) for folder in args.folders])
+    return 0
+
+
+# === stream: chunk → extract → populate an .xlsx register in one pass ===
+def cmd_stream(args):
+    from src.streaming_pipeline import run_streaming_pipeline
+    from generate_populated_csv import find_matching_template
+    from ingest_daemon import infer_client
+
+    client = infer_client(args.path, args.client)
+    template_path = args.template or (find_matching_template(client) if client else None)
+    if not template_path:
+        print("❌ No CSV template found; pass --template or --client")
+        return 1
+    stem = os.path.splitext(os.path.basename(args.path))[0]
+    extracted_path = os.path.join("Data", "output", "LLM", f"{stem}.json")
+    csv_path = args.out or os.path.join("Data", "output", "populated_files", f"{stem}.csv")
+    failed_path = os.path.join("Data", "logs", f"{stem}_failed_chunks.json")
+    for path in (extracted_path, csv_path, failed_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    result = run_streaming_pipeline(
+        args.path, template_path, extracted_path, csv_path, failed_path,
+        workers=args.workers, queue_size=args.queue_size, delay_seconds=args.delay,
+    )
+    return 1 if result["failed"] else 0
+
+
+# === batch: offline extraction of a whole backlog through the batch API ===
+def cmd_batch(args):
+    from src import batch_extract
+
+    if args.action == "status":
+        manifests = batch_extract.list_batches()
+        pending = [m for m in manifests if m["batch"] and not m["batch"].startswith("batches/local-")
+                   and m["state"] not in batch_extract.TERMINAL | {"COLLECTED"}]
+        if pending:
+            backend = batch_extract.make_backend()
+            for m in pending:
+                batch_extract.poll_batch(backend, m["tag"])
+            manifests = batch_extract.list_batches()
+        print(batch_extract.format_batches(manifests))
+        return 0
+
+    backend = batch_extract.make_backend(local=args.local)
+    if args.action == "submit":
+        tag = batch_extract.submit_backlog(backend, args.folders, force=args.force, model_name=args.model)
+        if tag and args.wait:
+            batch_extract.wait_for_batch(backend, tag, args.poll)
+            batch_extract.collect_batch(backend, tag)
+        return 0
+
+    tag = args.tag or (batch_extract.list_batches() or [{}])[-1].get("tag")
+    if not tag:
+        print("❌ No batch jobs yet; run `batch submit` first")
+        return 1
+    if args.action == "wait":
+        manifest = batch_extract.wait_for_batch(backend, tag, args.poll)
+        print(f"📦 Batch {tag}: {manifest['state']}")
+        return 0 if manifest["state"] in batch_extract.SUCCEEDED | {"NO_REQUESTS", "COLLECTED"} else 1
+    batch_extract.collect_batch(backend, tag)
+    return 0
+
+
+# === populate ===
+def cmd_populate(args):
+    if args.json:
+        from src.populate_csv_template import populate_csv_from_json
+
+        if not (args.template and args.out):
+            print("❌ --json needs --template and --out")
+            return 1
+        populate_csv_from_json(csv_path=args.template, json_path=args.json, output_csv=args.out)
+        return 0
+
+    import generate_populated_csv
+
+    if not args.folders:
+        generate_populated_csv.main()
+        return 0
+    status = 0
+    for folder in args.folders:
+        folder = os.path.basename(folder.rstrip("/"))
+        if not generate_populated_csv.should_process_folder(folder):
+            print(f"⏭️ Skipped {folder} (failed_chunks.json exists)")
+            status = 1
+            continue
+        generate_populated_csv.populate_csv(folder)
+    return status
+
+
+# === reconcile: extracted records vs. the register's own totals ===
+def cmd_reconcile(args):
+    from src.reconciliation import reconcile_folder, format_reconciliation
+
+    folders = [os.path.basename(f.rstrip("/")) for f in args.folders] or sorted(os.listdir(BASE_FOLDER))
+    status = 0
+    for folder in folders:
+        folder_path = os.path.join(BASE_FOLDER, folder)
+        if not os.path.exists(os.path.join(folder_path, "parsed_employee_data.json")):
+            continue
+        report = reconcile_folder(folder_path, write=True)
+        print(format_reconciliation(report))
+        status |= 0 if report["ok"] else 1
+    return status
+
+
+# === validate: populated CSVs vs. their template's import layout ===
+def cmd_validate(args):
+    from src.csv_validator import validate_folder, format_validation
+
+    folders = [os.path.basename(f.rstrip("/")) for f in args.folders] or sorted(os.listdir(BASE_FOLDER))
+    status = 0
+    for folder in folders:
+        folder_path = os.path.join(BASE_FOLDER, folder)
+        if not os.path.exists(os.path.join(folder_path, "populated_output.csv")):
+            continue
+        report = validate_folder(folder_path)
+        print(format_validation(report))
+        status |= 0 if report["ok"] else 1
+    return status
+
+
+# === upload ===
+def invalid(records):
+    # Records whose CSV the portal would reject or pay wrongly
+    from src.csv_validator import validate_folder, format_validation
+
+    blocked = []
+    for r in records:
+        report = validate_folder(os.path.dirname(r["FILE_PATH"]))
+        if not report["ok"]:
+            print(format_validation(report))
+            blocked.append(r)
+    return blocked
+
+
+def unreconciled(records):
+    # Records whose folder does not balance against its register totals
+    from src.reconciliation import reconcile_folder, format_reconciliation
+
+    blocked = []
+    for r in records:
+        report = reconcile_folder(os.path.dirname(r["FILE_PATH"]))
+        if not report["ok"]:
+            print(format_reconciliation(report))
+            blocked.append(r)
+    return blocked
+
+
+def cmd_upload(args):
+    import to_run_files
+    from src.scheduler import order_records
+
+    records = to_run_files.get_records_to_run()
+    if args.pay_date:
+        records = [r for r in records if r["PAY_DATE"] in args.pay_date]
+    if not args.no_reconcile:
+        blocked = unreconciled(records)
+        if blocked:
+            print(f"⛔ Holding back {len(blocked)} record(s) that do not reconcile (--no-reconcile to upload anyway)")
+            records = [r for r in records if r not in blocked]
+    if not args.no_validate:
+        blocked = invalid(records)
+        if blocked:
+            print(f"⛔ Holding back {len(blocked)} record(s) whose CSV fails validation (--no-validate to upload anyway)")
+            records = [r for r in records if r not in blocked]
+    records = order_records(records)  # the order run_uploads will use
+    if args.dry_run or not records:
+        from src.upload_ledger import UploadLedger
+
+        ledger = UploadLedger()
+        if ledger.is_empty() and not args.force:
+            print("⚠️ The upload ledger is empty: a real run uploads nothing until the periods already "
+                  "submitted are recorded (cli.py uploads --mark-uploaded MM/DD/YYYY)")
+        records, skipped = ledger.plan(records, force=args.force, record=False)
+        for r in skipped:
+            print(f"⏭️ {r['CLIENT']} | {r['PAY_PERIOD']} → {r['PAY_DATE']} | {r['REASON']}")
+        for r in records:
+            changed = " (changed since the last upload)" if r.get("CHANGED") else ""
+            print(f"📤 {r['CLIENT']} | {r['PAY_PERIOD']} → {r['PAY_DATE']} | {r['FILE_PATH']}{changed}")
+        print(f"{len(records)} record(s) to upload, {len(skipped)} skipped by the upload ledger")
+        return 0
+    to_run_files.run_uploads(records, args.profile, force=args.force)
+    return 0
+
+
+# === uploads: the upload ledger ===
+def cmd_uploads(args):
+    import to_run_files
+    from src.upload_ledger import UploadLedger, format_ledger
+
+    ledger = UploadLedger()
+    if args.retry_failed:
+        print(f"🔁 {ledger.retry_failed(args.pay_date)} failed upload(s) queued again")
+    for pay_date in args.mark_uploaded or []:
+        records = [r for r in to_run_files.get_records_to_run() if r["PAY_DATE"] == pay_date]
+        if not records:
+            print(f"⚠️ No populated CSV for pay date {pay_date}")
+        for r in records:
+            r = ledger.mark_uploaded(r)
+            print(f"✅ Marked uploaded: {r['PAY_PERIOD']} → {r['PAY_DATE']} ({r['HASH'][:10]})")
+    print(format_ledger(ledger.rows()))
+    return 0
+
+
+# === bench: extractor backends scored against the golden set ===
+def cmd_bench(args):
+    from src.benchmark import run_benchmark
+
+    run_benchmark(args.backend, mode=args.mode, model_name=args.model, limit=args.limit)
+    return 0
+
+
+# === status ===
+def folder_status(folder_path):
+    def count(name):
+        path = os.path.join(folder_path, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return len(json.load(f))
+
+    return {
+        "employees": count("employee_data.json"),
+        "parsed": count("parsed_employee_data.json"),
+        "failed": count("failed_chunks.json"),
+        "csv": os.path.exists(os.path.join(folder_path, "populated_output.csv")),
+    }
+
+
+def cmd_status(args):
+    if os.path.isdir(BASE_FOLDER):
+        print(f"📂 {BASE_FOLDER}/")
+        for folder in sorted(os.listdir(BASE_FOLDER)):
+            folder_path = os.path.join(BASE_FOLDER, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            s = folder_status(folder_path)
+            parsed = "—" if s["parsed"] is None else s["parsed"]
+            flags = ("⚠️ failed " + str(s["failed"]) + " " if s["failed"] else "") + ("📄 csv" if s["csv"] else "")
+            print(f"   {folder}: {parsed}/{s['employees'] or 0} parsed {flags}".rstrip())
+
+    if os.path.isdir(os.path.join("Data", "queue", "pending")):
+        from src.job_queue import JobQueue
+
+        print(f"📥 Ingest queue: {JobQueue(os.path.join('Data', 'queue')).counts()}")
+
+    from src.task_queue import DEFAULT_DB, TaskQueue, format_status
+
+    db = os.getenv("TASK_QUEUE_DB", DEFAULT_DB)
+    if os.path.exists(db):
+        print(format_status(TaskQueue(db).status()))
+
+    from src.upload_ledger import DEFAULT_DB as UPLOADS_DB, UploadLedger, format_ledger
+
+    if os.path.exists(UPLOADS_DB):
+        print(format_ledger(UploadLedger(UPLOADS_DB).rows()).splitlines()[-1])
+    return 0
+
+
+# === bench-startup: startup-time regression check ===
+STARTUP_PROBES = [
+    ["--help"],
+    ["chunk", "--help"],
+    ["extract", "--help"],
+    ["stream", "--help"],
+    ["batch", "--help"],
+    ["populate", "--help"],
+    ["upload", "--help"],
+    ["uploads", "--help"],
+    ["reconcile", "--help"],
+    ["validate", "--help"],
+    ["status"],
+]
+
+HEAVY_PROBE = (
+    "import sys, contextlib, io, cli\n"
+    "with contextlib.redirect_stdout(io.StringIO()):\n"
+    "    cli.main(['status'])\n"
+    "print(','.join(m for m in cli.HEAVY_MODULES if m in sys.modules))\n"
+)
+
+
+def cmd_bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    failed = False
+    for probe in STARTUP_PROBES:
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(here, "cli.py"), *probe], cwd=here,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - started) * 1000)
+        median = statistics.median(timings)
+        over = median > args.budget_ms
+        failed |= over
+        print(f"{'❌' if over else '✅'} cli.py {' '.join(probe):<18} median {median:7.1f} ms (budget {args.budget_ms} ms)")
+
+    heavy = subprocess.run([sys.executable, "-c", HEAVY_PROBE], cwd=here, capture_output=True, text=True)
+    loaded = heavy.stdout.strip().splitlines()[-1] if heavy.stdout.strip() else ""
+    if heavy.returncode != 0 or loaded:
+        failed = True
+        print(f"❌ Heavy modules imported by `status`: {loaded or heavy.stderr.strip()}")
+    else:
+        print("✅ `status` imports none of: " + ", ".join(HEAVY_MODULES))
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Payroll register pipeline")
+    # Before the command: `cli.py --profile-stages extract ...`
+    parser.add_argument("--profile-stages", action="store_true",
+                        help="profile every pipeline stage (cProfile, sampled stacks, tracemalloc)")
+    parser.add_argument("--profile-mode", choices=["all", "cpu", "memory"], default="all",
+                        help="cpu: no tracemalloc, for undistorted timings; memory: allocations only")
+    parser.add_argument("--profile-dir", help="where profiles go (default: Data/logs/profiles/<timestamp>)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    chunk = sub.add_parser("chunk", help="split a register into employee blocks")
+    chunk.add_argument("path", help=".xlsx register, or the .rtf/.pdf of an RTF/PDF pair")
+    chunk.add_argument("--pdf", help="PDF with the pay dates (default: next to the RTF)")
+    chunk.add_argument("--client", help="client name (default: inferred from the file name)")
+    chunk.add_argument("--out", help="output JSON for .xlsx chunks")
+    chunk.add_argument("--split", action="store_true",
+                       help=".xlsx: one chunk file per company / pay group (every sheet) instead of one flat file")
+    chunk.set_defaults(func=cmd_chunk)
+
+    extract = sub.add_parser("extract", help="extract structured JSON from employee blocks")
+    extract.add_argument("folders", nargs="*", help=f"folders under {BASE_FOLDER}/ (default: all)")
+    extract.add_argument("--chunks", help="flat chunk file from `chunk x.xlsx` instead of folders")
+    extract.add_argument("--out", help="output JSON for --chunks")
+    extract.add_argument("--delay", type=float, default=7, help="seconds between calls for --chunks")
+    extract.set_defaults(func=cmd_extract)
+
+    stream = sub.add_parser("stream", help="chunk, extract and populate an .xlsx register in one streaming pass")
+    stream.add_argument("path", help=".xlsx register")
+    stream.add_argument("--client", help="client name (default: inferred from the file name)")
+    stream.add_argument("--template", help="CSV template (default: the client's template)")
+    stream.add_argument("--out", help="output CSV")
+    stream.add_argument("--workers", type=int, default=4, help="concurrent extraction calls")
+    stream.add_argument("--queue-size", type=int, default=8, help="bound on chunks/records waiting between stages")
+    stream.add_argument("--delay", type=float, default=0, help="seconds each worker waits between calls")
+    stream.set_defaults(func=cmd_stream)
+
+    batch = sub.add_parser("batch", help="extract a backlog offline through the Gemini batch API")
+    batch.add_argument("action", choices=["submit", "status", "wait", "collect"])
+    batch.add_argument("folders", nargs="*", help=f"submit: folders under {BASE_FOLDER}/ (default: all unparsed)")
+    batch.add_argument("--tag", help="wait/collect: batch tag (default: the latest)")
+    batch.add_argument("--force", action="store_true", help="submit: include folders that were already parsed")
+    batch.add_argument("--wait", action="store_true", help="submit: wait for the job and collect it")
+    batch.add_argument("--model", default="gemini-2.0-flash-lite")
+    batch.add_argument("--poll", type=float, default=60, help="seconds between status checks")
+    batch.add_argument("--local", action="store_true", help="use the local stand-in instead of the API (outputs stay under Data/batch/<tag>/)")
+    batch.set_defaults(func=cmd_batch)
+
+    populate = sub.add_parser("populate", help="fill the client CSV template")
+    populate.add_argument("folders", nargs="*", help=f"folders under {BASE_FOLDER}/ (default: all)")
+    populate.add_argument("--json", help="extracted JSON (file mode)")
+    populate.add_argument("--template", help="CSV template (file mode)")
+    populate.add_argument("--out", help="output CSV (file mode)")
+    populate.set_defaults(func=cmd_populate)
+
+    upload = sub.add_parser("upload", help="upload populated CSVs with the browser bot")
+    upload.add_argument("--pay-date", action="append", help="only this pay date (MM/DD/YYYY); repeatable")
+    upload.add_argument("--dry-run", action="store_true", help="list what would be uploaded")
+    upload.add_argument("--profile", choices=["debug", "lean"],
+                        help="browser profile: visible debug run, or headless lean run (default: $UPLOAD_PROFILE or debug)")
+    upload.add_argument("--no-reconcile", action="store_true", help="upload even if totals do not reconcile")
+    upload.add_argument("--no-validate", action="store_true", help="upload even if the CSV fails validation")
+    upload.add_argument("--force", action="store_true", help="upload even what the upload ledger says already went up")
+    upload.set_defaults(func=cmd_upload)
+
+    uploads = sub.add_parser("uploads", help="show the upload ledger; re-queue failures")
+    uploads.add_argument("--retry-failed", action="store_true", help="give failed uploads a fresh set of attempts")
+    uploads.add_argument("--pay-date", help="--retry-failed: only this pay date (MM/DD/YYYY)")
+    uploads.add_argument("--mark-uploaded", action="append", metavar="PAY_DATE",
+                         help="record the current CSV for this pay date as uploaded (submitted by hand); repeatable")
+    uploads.set_defaults(func=cmd_uploads)
+
+    reconcile = sub.add_parser("reconcile", help="check extracted records against register totals")
+    reconcile.add_argument("folders", nargs="*", help=f"folders under {BASE_FOLDER}/ (default: all)")
+    reconcile.set_defaults(func=cmd_reconcile)
+
+    validate = sub.add_parser("validate", help="check populated CSVs against the template's import layout")
+    validate.add_argument("folders", nargs="*", help=f"folders under {BASE_FOLDER}/ (default: all)")
+    validate.set_defaults(func=cmd_validate)
+
+    status = sub.add_parser("status", help="folder progress and queue depth")
+    status.set_defaults(func=cmd_status)
+
+    bench_extract = sub.add_parser("bench", help="compare extractor backends on accuracy, time, requests and tokens")
+    bench_extract.add_argument("--backend", action="append",
+                               choices=["grammar", "grammar+llm", "llm", "llm-pruned", "llm-batched"],
+                               help="repeatable (default: all)")
+    bench_extract.add_argument("--mode", choices=["replay", "record", "auto"], default="replay",
+                               help="replay recorded model responses, record new ones, or both")
+    bench_extract.add_argument("--model", default="gemini-2.0-flash-lite")
+    bench_extract.add_argument("--limit", type=int, help="only the first N golden employees")
+    bench_extract.set_defaults(func=cmd_bench)
+
+    bench = sub.add_parser("bench-startup", help="fail if CLI startup exceeds its budget")
+    bench.add_argument("--runs", type=int, default=5)
+    bench.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    bench.set_defaults(func=cmd_bench_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.profile_stages:
+        return args.func(args)
+    from src import profiling
+
+    profile_dir = profiling.enable(args.profile_mode, args.profile_dir)
+    try:
+        return args.func(args)
+    finally:
+        print(f"⏱️ Stage profiles ({args.profile_mode}) → {profile_dir}/ (summary.txt; *.collapsed for flame graphs)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
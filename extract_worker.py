@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from src.task_queue import TaskQueue, DEFAULT_DB, format_status, worker_identity
+
+# === Config ===
+BASE_FOLDER = "Extracted"  # must be on the volume every node sees
+QUEUE_DB = os.getenv("TASK_QUEUE_DB", DEFAULT_DB)
+THREADS = 8
+IDLE_POLL_SECONDS = 2.0
+
+
+# === enqueue: one task per employee of every folder that still needs parsing ===
+def enqueue_folders(queue, folders=None, force=False, logger=print):
+    folders = folders or sorted(os.listdir(BASE_FOLDER))
+    total = 0
+    for folder in folders:
+        folder_path = os.path.join(BASE_FOLDER, folder)
+        input_json = os.path.join(folder_path, "employee_data.json")
+        if not os.path.exists(input_json):
+            continue
+        if os.path.exists(os.path.join(folder_path, "parsed_employee_data.json")) and not force:
+            logger(f"⏭️ {folder} already parsed (use --force to queue it again)")
+            continue
+        with open(input_json, "r", encoding="utf-8") as f:
+            added = queue.enqueue(folder, json.load(f), force=force)
+        total += added
+        logger(f"📥 {folder}: {added} new task(s)")
+    logger(f"✅ Queued {total} task(s) → {queue.path}")
+    return total
+
+
+# === Folder outputs, written once every employee has a final state ===
+def write_json_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def assemble_folder(queue, folder, logger=print):
+    results = queue.folder_results(folder)
+    folder_path = os.path.join(BASE_FOLDER, folder)
+    write_json_atomic(os.path.join(folder_path, "parsed_employee_data.json"), results["success"])
+    for name, key in (("failed_chunks.json", "failed"), ("skipped_chunks.json", "skipped")):
+        path = os.path.join(folder_path, name)
+        if results[key]:
+            write_json_atomic(path, results[key])
+        elif os.path.exists(path):
+            os.remove(path)  # stale from an earlier run
+    if results["routing"]:
+        from src.model_router import ModelRouter
+
+        write_json_atomic(os.path.join(folder_path, "routing_log.json"), results["routing"])
+        logger(ModelRouter.summarize(results["routing"]))
+    logger(
+        f"💾 {folder}: {len(results['success'])} parsed, {len(results['failed'])} failed, "
+        f"{len(results['skipped'])} skipped"
+    )
+
+
+# === work: claim → extract → commit, with a heartbeat keeping leases alive ===
+def run_worker(queue, threads=THREADS, drain=False, logger=print):
+    from lets_do_this import process_employee, make_router, USE_LAYOUT_GRAMMAR
+    from src.layout_induction import load_grammar
+    from generate_populated_csv import extract_payroll_dates_from_folder
+
+    worker_id = worker_identity()
+    queue.register_worker(worker_id)
+    stop_event = threading.Event()
+    clients = {}
+    grammars = {}
+    routers = {}
+    grammar_lock = threading.Lock()
+
+    def client_for(folder):
+        with grammar_lock:
+            if folder not in clients:
+                try:
+                    clients[folder] = extract_payroll_dates_from_folder(folder)["ClientName"]
+                except ValueError:
+                    clients[folder] = None
+            return clients[folder]
+
+    def grammar_for(folder):
+        if not USE_LAYOUT_GRAMMAR:
+            return None
+        client = client_for(folder)
+        with grammar_lock:
+            if folder not in grammars:
+                grammars[folder] = load_grammar(client) if client else None
+            return grammars[folder]
+
+    def router_for(client):
+        # One router per client, so its output-token ceiling is learned per client
+        with grammar_lock:
+            if client not in routers:
+                routers[client] = make_router(client)
+            return routers[client]
+
+    def heartbeat_loop():
+        while not stop_event.wait(queue.lease_seconds / 3):
+            queue.heartbeat(worker_id)
+
+    def work_loop():
+        while not stop_event.is_set():
+            tasks = queue.claim(worker_id)
+            if not tasks:
+                status = queue.status()
+                if drain and status["pending"] == 0 and status["leased"] + status["expired_leases"] == 0:
+                    return
+                stop_event.wait(IDLE_POLL_SECONDS)
+                continue
+
+            for task in tasks:
+                folder, emp_id = task["folder"], task["Emp#"]
+                client = client_for(folder)
+                router = router_for(client)
+                result = process_employee(task, grammar_for(folder), router, client)
+                if router is not None:
+                    router.reset()  # the decision travels with the result instead (see assemble_folder)
+                if result["status"] == "failed":
+                    queue.release(worker_id, folder, emp_id, result["data"]["error"])
+                    logger(f"⚠️ {folder} #{emp_id} failed (attempt {task['attempt']}): {result['data']['error']}")
+                    continue
+                landed = queue.commit(
+                    worker_id, folder, emp_id, result["status"], result["data"], result.get("source"), result.get("routing")
+                )
+                if not landed:
+                    logger(f"🔁 {folder} #{emp_id} was already committed by another attempt")
+                if queue.folder_complete(folder):
+                    assemble_folder(queue, folder, logger)
+
+    heartbeat = threading.Thread(target=heartbeat_loop, daemon=True)
+    heartbeat.start()
+    workers = [threading.Thread(target=work_loop) for _ in range(threads)]
+    logger(f"👷 Worker {worker_id} started with {threads} thread(s) on {queue.path}")
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(timeout=1.0)
+    except KeyboardInterrupt:
+        logger("🛑 Stopping; in-flight tasks finish, unclaimed leases expire on their own")
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+    stop_event.set()
+    logger(f"👋 Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared extraction queue: enqueue folders, run workers, check status")
+    parser.add_argument("--db", default=QUEUE_DB, help="SQLite queue file (on a volume all nodes share)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="queue every employee of folders under Extracted/")
+    enqueue.add_argument("folders", nargs="*")
+    enqueue.add_argument("--force", action="store_true", help="also queue folders that were already parsed")
+
+    work = sub.add_parser("work", help="run a worker process")
+    work.add_argument("--threads", type=int, default=THREADS)
+    work.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+
+    status = sub.add_parser("status", help="queue depth, throughput and live workers")
+    status.add_argument("--watch", type=float, default=0, help="refresh every N seconds")
+
+    retry = sub.add_parser("retry-failed", help="put given-up tasks back in the queue")
+    retry.add_argument("folder", nargs="?")
+
+    args = parser.parse_args()
+    queue = TaskQueue(args.db)
+
+    if args.command == "enqueue":
+        enqueue_folders(queue, args.folders, force=args.force)
+    elif args.command == "work":
+        run_worker(queue, threads=args.threads, drain=args.drain)
+    elif args.command == "status":
+        while True:
+            print(format_status(queue.status()))
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+            print()
+    elif args.command == "retry-failed":
+        print(f"♻️ Re-queued {queue.requeue_failed(args.folder)} task(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,67 @@
 import csv
-import json
 import os
 import re
 
 from datetime import datetime
 
+from src.profiling import profiled_stage
+from src.records import load_records
+
 BASE_DIR = "Extracted"
 TEMPLATE_DIR = "Data/CSV_Templates"
+HEADER_ROWS = (8, 9)
+FIRST_EMPLOYEE_ROW = 10
+
+# Template column (merged header rows) -> skeleton key
+COLUMN_TO_JSON_KEY = {
+    "Emp Num": "Emp#",
+    #"Employee Name": "Name",
+    "Regular Hours": "RegHrs",
+    "Regular Amount": "RegAmt",
+    "Vacation Hours": "VacHrs",
+    "Vacation Amount": "VacAmt",
+    "Holiday Hours": "HolHrs",
+    "Holiday Amount": "HolAmt",
+    "Reimbursement Amount": "ReimbAmt",
+    "Overtime Hours": "OTHrs",
+    "Overtime Amount": "OTAmt",
+    "Sick Hours": "SickHrs",
+    "Sick Amount": "SickAmt",
+    "Personal Hours": "PersonalHrs",
+    "Personal Amount": "PersonalAmt",
+    "Deputy Clerk 1410 Hours": "Deputy Hrs",
+    "Deputy Clerk 1410 Amount": "Deputy Amt",
+    "Records 1460 Hours": "Recor Hrs",
+    "Records 1460 Amount": "Recor Amt",
+    "Comp Time Hours": "Comp Hrs",
+    "Comp Time Amount": "Comp Amt",
+    "Office worker Hours": "Clerk Hrs",
+    "Office worker Amount": "Clerk Amt",
+    "Jury Duty Hours": "Jury Hrs",
+    "Jury Duty Amount": "Jury Amt",
+    "Emergency Mgmt Amount": "Emergency Mgmt Amt",
+    "Bereavement Hours": "BRV Hrs",
+    "Bereavement Amount": "BRV Amt",
+    "Federal Tax": "FWT",
+    "Soc.Sec. Tax": "SS W/H",
+    "Medicare Tax": "MC W/H",
+    "NY State Tax": "NY State Tax",
+    "NY SDI Tax": "NY SDI",
+    "414(H) Amount": "414(h)",
+    "457(b) Amount": "457(b)",
+    "Aflac Amount": "Aflac",
+    "Aflac Pre-Tax Amount": "Aflac Pre-Tax",
+    "Dental Ins Amount": "Dental Ins",
+    "Dental Insurance Amount": "Dental Insurance",
+    "Loan Repayment Amount": "Loan Repayment",
+    "Medical Ins Amount": "Medical Ins",
+    "Medical Insurance Amount": "Medical Insurance",
+    "Pre Tax SCP Amount": "Pre Tax SCP",
+    "Union Dues Amount": "Union Dues",
+    "Vision Ins Amount": "Vision Ins",
+    "Vision Insurance Amount": "Vision Insurance",
+    "Net Amount": "Net Pay"
+}
 
 
 def extract_payroll_dates_from_folder(folder_name):
@@ -30,12 +85,30 @@ def extract_payroll_dates_from_folder(folder_name):
         "PayDate": pay_date,
         "PaySchedule": "Prior"
     }
+def csv_value(record, key):
+    # Numbers as plain floats ("1316.48", "40.0"); anything else as written
+    number = record.number(key)
+    if number is not None and key not in (record.extra or {}):
+        return str(float(number))
+    val = record.get(key)
+    if val is None:
+        return None
+    try:
+        return str(float(str(val).replace(",", "").strip()))
+    except ValueError:
+        return str(val)
+
+def merge_headers(rows):
+    # Template header rows 8 and 9 read as one: "Regular" + "Hours" -> "Regular Hours"
+    return [f"{h1.strip()} {h2.strip()}".strip() for h1, h2 in zip(rows[HEADER_ROWS[0]], rows[HEADER_ROWS[1]])]
+
 def find_matching_template(client_name):
     for f in os.listdir(TEMPLATE_DIR):
         if f.lower().startswith(client_name.lower()) and f.endswith(".csv"):
             return os.path.join(TEMPLATE_DIR, f)
     return None
 
+@profiled_stage("populate")
 def populate_csv(folder_name):
     folder_path = os.path.join(BASE_DIR, folder_name)
     json_path = os.path.join(folder_path, "parsed_employee_data.json")
@@ -46,10 +119,8 @@ def populate_csv(folder_name):
     if not template_csv:
         raise FileNotFoundError(f"❌ No CSV template found for client '{pay_info['ClientName']}' in {TEMPLATE_DIR}")
 
-    # Load JSON
-    with open(json_path, "r", encoding="utf-8") as f:
-        json_data = json.load(f)
-    json_map = {emp["Emp#"]: emp for emp in json_data}
+    # Load typed records (numbers already parsed, validated against the field registry)
+    json_map = {record.emp_id: record for record in load_records(json_path)}
 
     # Load CSV template
     with open(template_csv, newline='', encoding='utf-8') as f:
@@ -64,77 +135,21 @@ def populate_csv(folder_name):
         elif "Pay Date:" in row[0]:
             row[2] = pay_info["PayDate"]
 
-    header_row_1 = reader[8]
-    header_row_2 = reader[9]
-    final_headers = [f"{h1.strip()} {h2.strip()}".strip() for h1, h2 in zip(header_row_1, header_row_2)]
-    header_index_map = {col: i for i, col in enumerate(final_headers)}
-
-    column_to_json_key = {
-        "Emp Num": "Emp#",
-        #"Employee Name": "Name",
-        "Regular Hours": "RegHrs",
-        "Regular Amount": "RegAmt",
-        "Vacation Hours": "VacHrs",
-        "Vacation Amount": "VacAmt",
-        "Holiday Hours": "HolHrs",
-        "Holiday Amount": "HolAmt",
-        "Reimbursement Amount": "ReimbAmt",
-        "Overtime Hours": "OTHrs",
-        "Overtime Amount": "OTAmt",
-        "Sick Hours": "SickHrs",
-        "Sick Amount": "SickAmt",
-        "Personal Hours": "PersonalHrs",
-        "Personal Amount": "PersonalAmt",
-        "Deputy Clerk 1410 Hours": "Deputy Hrs",
-        "Deputy Clerk 1410 Amount": "Deputy Amt",
-        "Records 1460 Hours": "Recor Hrs",
-        "Records 1460 Amount": "Recor Amt",
-        "Comp Time Hours": "Comp Hrs",
-        "Comp Time Amount": "Comp Amt",
-        "Office worker Hours": "Clerk Hrs",
-        "Office worker Amount": "Clerk Amt",
-        "Jury Duty Hours": "Jury Hrs",
-        "Jury Duty Amount": "Jury Amt",
-        "Emergency Mgmt Amount": "Emergency Mgmt Amt",
-        "Bereavement Hours": "BRV Hrs",
-        "Bereavement Amount": "BRV Amt",
-        "Federal Tax": "FWT",
-        "Soc.Sec. Tax": "SS W/H",
-        "Medicare Tax": "MC W/H",
-        "NY State Tax": "NY State Tax",
-        "NY SDI Tax": "NY SDI",
-        "414(H) Amount": "414(h)",
-        "457(b) Amount": "457(b)",
-        "Aflac Amount": "Aflac",
-        "Aflac Pre-Tax Amount": "Aflac Pre-Tax",
-        "Dental Ins Amount": "Dental Ins",
-        "Dental Insurance Amount": "Dental Insurance",
-        "Loan Repayment Amount": "Loan Repayment",
-        "Medical Ins Amount": "Medical Ins",
-        "Medical Insurance Amount": "Medical Insurance",
-        "Pre Tax SCP Amount": "Pre Tax SCP",
-        "Union Dues Amount": "Union Dues",
-        "Vision Ins Amount": "Vision Ins",
-        "Vision Insurance Amount": "Vision Insurance",
-        "Net Amount": "Net Pay"
-    }
+    header_index_map = {col: i for i, col in enumerate(merge_headers(reader))}
+
+
+    # Template columns this client has, resolved once rather than per employee
+    columns = [(header_index_map[col], key) for col, key in COLUMN_TO_JSON_KEY.items() if col in header_index_map]
 
-    for i in range(10, len(reader)):
+    for i in range(FIRST_EMPLOYEE_ROW, len(reader)):
         row = reader[i]
         emp_num = row[0].strip()
         if emp_num.isdigit() and emp_num in json_map:
-            emp_json = json_map[emp_num]
-            for col_name, json_key in column_to_json_key.items():
-                col_idx = header_index_map.get(col_name)
-                if col_idx is not None and json_key in emp_json:
-                    val = emp_json[json_key]
-                    if val is not None:
-                        try:
-                            # Clean comma and convert to float
-                            cleaned_val = float(str(val).replace(",", "").strip())
-                            row[col_idx] = str(cleaned_val)
-                        except ValueError:
-                            row[col_idx] = str(val)
+            record = json_map[emp_num]
+            for col_idx, json_key in columns:
+                val = csv_value(record, json_key)
+                if val is not None:
+                    row[col_idx] = val
 
     # Save
     with open(output_csv, "w", newline='', encoding='utf-8') as f:
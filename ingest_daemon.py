@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import re
+import signal
+import threading
+from datetime import datetime
+
+from src.job_queue import JobQueue
+from src.folder_watcher import StableFileScanner, make_wakeup
+from src.scheduler import rtf_pay_date
+from src.profiling import PROFILE_ENV, profile_dir
+
+# === Config ===
+# Folder -> client name (None: infer from the file name / INGEST_DEFAULT_CLIENT)
+WATCH_DIRS = {
+    "Data/input_files": None,
+    "Extract_data_from_rtf/rtfpdffilesfornewbaltimore": "NewBaltimore",
+}
+QUEUE_DIR = "Data/queue"
+BASE_FOLDER = "Extracted"
+TEMPLATE_DIR = "Data/CSV_Templates"
+WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+SETTLE_SECONDS = float(os.getenv("INGEST_SETTLE_SECONDS", "3"))
+POLL_SECONDS = 2.0
+XLSX_DELAY_SECONDS = 7
+XLSX_STREAMING = os.getenv("INGEST_STREAMING", "0") == "1"  # chunk → extract → CSV through bounded queues
+DEFAULT_CLIENT = os.getenv("INGEST_DEFAULT_CLIENT")
+# Files already in the drop folders at start are left alone (they were extracted
+# before the daemon existed); INGEST_SKIP_EXISTING=0 queues them as a backfill
+SKIP_EXISTING = os.getenv("INGEST_SKIP_EXISTING", "1") != "0"
+
+_print_lock = threading.Lock()
+
+
+def log(msg):
+    with _print_lock:
+        print(f"{datetime.now():%H:%M:%S} {msg}")
+
+
+# === Registers → jobs ===
+def file_fingerprint(*paths):
+    h = hashlib.sha1()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+def template_clients(template_dir=TEMPLATE_DIR):
+    # "NewBaltimore 1-11-2025 to 1-24-2025.csv" -> "NewBaltimore"
+    return sorted({f.split(" ")[0] for f in os.listdir(template_dir) if f.endswith(".csv")})
+
+
+def infer_client(path, client=None):
+    if client:
+        return client
+    compact = re.sub(r"[^a-z0-9]", "", os.path.basename(path).lower())
+    for name in template_clients():
+        if name.lower() in compact:
+            return name
+    return DEFAULT_CLIENT
+
+
+def job_for(path, client):
+    # Returns (job_id, payload) for a settled file, or None if its pair is not ready yet
+    stem, ext = os.path.splitext(path)
+    ext = ext.lower()
+    if ext == ".xlsx":
+        return file_fingerprint(path), {"kind": "xlsx", "source": path, "client": infer_client(path, client)}
+
+    # RTF/PDF registers arrive as a pair: blocks come from the RTF, pay dates from the PDF
+    rtf_path, pdf_path = stem + ".rtf", stem + ".pdf"
+    if not (os.path.exists(rtf_path) and os.path.exists(pdf_path)):
+        return None
+    pay_date = rtf_pay_date(rtf_path)  # exports are named after the pay date; orders the queue
+    return file_fingerprint(rtf_path, pdf_path), {
+        "kind": "rtf", "source": rtf_path, "pdf": pdf_path, "client": infer_client(rtf_path, client),
+        "pay_date": pay_date.isoformat() if pay_date else None,
+    }
+
+
+# === Pipelines (heavy imports stay inside the job) ===
+def run_rtf_job(job, logger, on_result=None, grammars=None):
+    from src.register_splitter import chunk_rtf_sections
+    from lets_do_this import process_backlog
+    from generate_populated_csv import populate_csv, should_process_folder
+    from src.reconciliation import reconcile_folder, format_reconciliation
+
+    if not job["client"]:
+        raise ValueError("❌ No client configured for this drop folder")
+    # A combined register gives one folder per company / pay group, extracted on one pool
+    folders = chunk_rtf_sections(job["source"], job["pdf"], job["client"], BASE_FOLDER, logger=logger)
+    counts = process_backlog(folders, base_folder=BASE_FOLDER, logger=logger, on_result=on_result, grammars=grammars)
+    failed = [folder for folder in folders if not should_process_folder(folder)]
+    if failed:
+        raise RuntimeError(f"❌ Employees failed; see failed_chunks.json in {', '.join(failed)}")
+    results = []
+    for folder in folders:
+        populate_csv(folder)
+        report = reconcile_folder(os.path.join(BASE_FOLDER, folder), write=True)
+        logger(format_reconciliation(report))
+        results.append({
+            "folder": folder,
+            "json": os.path.join(BASE_FOLDER, folder, "parsed_employee_data.json"),
+            "csv": os.path.join(BASE_FOLDER, folder, "populated_output.csv"),
+            "reconciled": report["ok"],
+            **(counts.get(folder) or {}),
+        })
+    if len(results) == 1:
+        return results[0]
+    return {"folders": results, "reconciled": all(r["reconciled"] for r in results)}
+
+
+def run_xlsx_job(job, logger):
+    from src.send_chunk_llm import extract_payroll_with_gemini
+    from src.populate_csv_template import populate_csv_from_json
+    from generate_populated_csv import find_matching_template
+
+    if "chunks" not in job:
+        # Whole workbook: one sub-job per company / pay group when it combines several
+        from src.register_splitter import split_workbook
+
+        sections = split_workbook(job["source"], job["client"], logger=logger)
+        if len(sections) > 1:
+            return {"split": sections}
+        if not sections:
+            raise ValueError(f"❌ No employees in {job['source']} could be routed to a template")
+        job = dict(job, chunks=sections[0]["chunks"], client=sections[0]["client"])
+
+    template_path = find_matching_template(job["client"]) if job["client"] else None
+    if not template_path:
+        raise FileNotFoundError(f"❌ No CSV template for client '{job['client']}' in {TEMPLATE_DIR}")
+
+    stem = job.get("section") or os.path.splitext(os.path.basename(job["source"]))[0]
+    extracted_path = os.path.join("Data", "output", "LLM", f"{stem}.json")
+    failed_path = os.path.join("Data", "logs", f"{stem}_failed_chunks.json")
+    csv_path = os.path.join("Data", "output", "populated_files", f"{stem}.csv")
+    for path in (extracted_path, failed_path, csv_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if XLSX_STREAMING:
+        from src.streaming_pipeline import run_streaming_pipeline
+
+        with open(job["chunks"], "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        return run_streaming_pipeline(
+            job["source"], template_path, extracted_path, csv_path, failed_path,
+            delay_seconds=XLSX_DELAY_SECONDS, chunks=chunks, client=job["client"], logger=logger,
+        )
+
+    extract_payroll_with_gemini(
+        chunks_path=job["chunks"],
+        success_path=extracted_path,
+        failed_path=failed_path,
+        delay_seconds=XLSX_DELAY_SECONDS,
+        logger=logger,
+        client=job["client"],
+    )
+    populate_csv_from_json(csv_path=template_path, json_path=extracted_path, output_csv=csv_path)
+    return {"json": extracted_path, "csv": csv_path}
+
+
+PIPELINES = {"rtf": run_rtf_job, "xlsx": run_xlsx_job}
+
+
+# === Worker pool ===
+def worker_loop(name, queue, stop_event):
+    while not stop_event.is_set():
+        job = queue.wait_for_job(stop_event)
+        if job is None:
+            return
+        logger = lambda msg, job_id=job["id"]: log(f"[{name} {job_id}] {msg}")
+        logger(f"🚚 Started {job['kind']} job: {job['source']} (attempt {job['attempts']})")
+        try:
+            result = PIPELINES[job["kind"]](job, logger)
+        except Exception as e:
+            queue.fail(job, str(e))
+            logger(f"❌ Job failed: {e}")
+            continue
+        queue.complete(job, result)
+        if "split" in result:
+            # Sections of a combined register: each is its own job, free for any worker
+            for n, section in enumerate(result["split"], 1):
+                sub_job = dict(job, **section)
+                for key in ("id", "created", "attempts", "started", "error"):
+                    sub_job.pop(key, None)
+                if queue.enqueue(f"{job['id']}-{n}", sub_job):
+                    logger(f"📥 Queued section {section['section']} ({section['employees']} employees)")
+            continue
+        outputs = [r["csv"] for r in result["folders"]] if "folders" in result else [result.get("csv")]
+        logger(f"🎉 Job done → {', '.join(map(str, outputs))}")
+
+
+# === Daemon ===
+def main():
+    queue = JobQueue(QUEUE_DIR)
+    recovered = queue.recover()
+    if recovered:
+        log(f"♻️ Re-queued {recovered} job(s) left running by a previous daemon")
+
+    for folder in WATCH_DIRS:
+        os.makedirs(folder, exist_ok=True)
+    scanner = StableFileScanner(WATCH_DIRS, (".xlsx", ".rtf", ".pdf"), settle_seconds=SETTLE_SECONDS)
+    if SKIP_EXISTING:
+        scanner.skip_existing()
+        log("⏭️ Leaving files already in the drop folders alone (INGEST_SKIP_EXISTING=0 queues them)")
+    wakeup = make_wakeup(list(WATCH_DIRS), logger=log)
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    workers = [
+        threading.Thread(target=worker_loop, args=(f"w{i + 1}", queue, stop_event), name=f"ingest-w{i + 1}")
+        for i in range(WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    log(f"🟢 Ingestion daemon up with {WORKERS} worker(s); queue: {queue.counts()}")
+    if profile_dir():
+        log(f"⏱️ Profiling every stage ({PROFILE_ENV}) → {profile_dir()}/")
+
+    try:
+        while not stop_event.is_set():
+            for path in scanner.scan():
+                client = WATCH_DIRS.get(os.path.dirname(path))
+                partner = os.path.splitext(path)[0] + (".pdf" if path.lower().endswith(".rtf") else ".rtf")
+                if not path.lower().endswith(".xlsx") and not scanner.is_stable(partner):
+                    continue  # wait until both halves of the pair have settled
+                found = job_for(path, client)
+                if found and queue.enqueue(*found):
+                    log(f"📥 Queued {found[1]['kind']} register: {found[1]['source']}")
+            # Wake early on file events, but rescan at least every POLL_SECONDS to finish debouncing
+            wakeup.wait(min(POLL_SECONDS, SETTLE_SECONDS))
+    finally:
+        stop_event.set()
+        wakeup.close()
+        log("🛑 Stopping; waiting for running jobs to finish...")
+        for worker in workers:
+            worker.join()
+        log(f"👋 Daemon stopped; queue: {queue.counts()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.profiling import PROFILE_ENV, profile_dir
+
+# === Config ===
+HOST = os.getenv("JOB_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("JOB_SERVER_PORT", "8765"))
+MAX_CONCURRENT_JOBS = int(os.getenv("JOB_SERVER_JOBS", "4"))
+UPLOAD_DIR = os.path.join("Data", "input_files", "uploads")
+BASE_FOLDER = "Extracted"
+SSE_KEEPALIVE_SECONDS = 15
+MAX_FINISHED_JOBS = int(os.getenv("JOB_SERVER_KEEP_JOBS", "200"))  # older finished jobs are forgotten
+FINISHED_JOB_EVENTS = 100  # events a finished job keeps for late /events readers
+
+
+# === Jobs and their event log ===
+class Job:
+    def __init__(self, job_id, kind, payload):
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.state = "queued"
+        self.created = time.time()
+        self.result = None
+        self.error = None
+        self.progress = {"done": 0, "total": None, "success": 0, "failed": 0, "skipped": 0}
+        self.events = []
+        self.dropped = 0  # events trimmed from the front; ids stay stable
+        self._cond = threading.Condition()
+
+    def emit(self, event, data):
+        with self._cond:
+            self.events.append({"id": self.next_id(), "event": event, "data": data})
+            self._cond.notify_all()
+
+    def next_id(self):
+        return self.dropped + len(self.events)
+
+    def trim(self, keep):
+        with self._cond:
+            excess = len(self.events) - keep
+            if excess > 0:
+                del self.events[:excess]
+                self.dropped += excess
+
+    def finished(self):
+        return self.state in ("done", "failed")
+
+    def wait_events(self, start, timeout):
+        # Events from id `start` (or the oldest kept one), blocking until there are some or the job ends
+        with self._cond:
+            if start >= self.next_id() and not self.finished():
+                self._cond.wait(timeout)
+            return self.events[max(0, start - self.dropped):], self.finished()
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "payload": self.payload,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+        }
+
+
+class JobService:
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS, logger=print):
+        self.logger = logger
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+        self.grammars = {}  # client -> (grammar file mtime, grammar)
+
+    # === Warm state, paid once per process instead of once per job ===
+    def warm_up(self):
+        started = time.perf_counter()
+        import lets_do_this  # loads .env, configures genai, builds policies
+        import src.send_chunk_llm  # noqa: F401  (shared HTTP session for the REST path)
+        from ingest_daemon import template_clients
+
+        for model_name in lets_do_this.MODEL_TIERS:
+            lets_do_this.get_model(model_name)
+        loaded = sum(g is not None for g in self.current_grammars(template_clients()).values())
+        self.logger(
+            f"🔥 Warm: {len(lets_do_this.MODEL_TIERS)} model client(s), {loaded} layout grammar(s) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def current_grammars(self, clients=None):
+        # The warm grammars, re-read only for clients whose grammar file changed (re-induced)
+        from src.layout_induction import grammar_path, load_grammar
+
+        with self._lock:
+            for client in clients or list(self.grammars):
+                path = grammar_path(client)
+                mtime = os.path.getmtime(path) if os.path.exists(path) else None
+                if client not in self.grammars or self.grammars[client][0] != mtime:
+                    self.grammars[client] = (mtime, load_grammar(client) if mtime else None)
+            return {client: grammar for client, (_, grammar) in self.grammars.items()}
+
+    def submit(self, kind, payload):
+        with self._lock:
+            job = Job(f"{next(self._ids):05d}", kind, payload)
+            self.jobs[job.id] = job
+        job.emit("queued", job.summary())
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        from ingest_daemon import run_rtf_job, run_xlsx_job
+
+        job.state = "running"
+        job.emit("started", {"kind": job.kind})
+        logger = lambda msg: job.emit("log", {"message": str(msg)})
+
+        def on_result(result):
+            job.progress["done"] += 1
+            job.progress[result["status"]] += 1
+            job.emit("employee", {
+                "Emp#": result["data"].get("Emp#"),
+                "status": result["status"],
+                "source": result.get("source"),
+                **job.progress,
+            })
+
+        try:
+            if job.kind == "folder":
+                job.result = self._run_folder(job, logger, on_result)
+            elif job.kind == "rtf":
+                job.result = run_rtf_job(job.payload, logger, on_result=on_result, grammars=self.current_grammars())
+            elif job.kind == "xlsx":
+                job.result = run_xlsx_job(job.payload, logger)
+                # A combined workbook comes back as sections; each runs as its own job
+                for section in job.result.get("split", []):
+                    section["job"] = self.submit("xlsx", dict(job.payload, **section)).id
+                    logger(f"📥 Section {section['section']} → job {section['job']}")
+            else:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            job.state = "done"
+            job.emit("done", job.summary())
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+            job.emit("failed", job.summary())
+        self.logger(f"{'✅' if job.state == 'done' else '❌'} Job {job.id} ({job.kind}) {job.state}")
+        self._forget_old_jobs(job)
+
+    def _forget_old_jobs(self, job):
+        # A finished job keeps only its latest events; past MAX_FINISHED_JOBS the oldest finished jobs go
+        job.trim(FINISHED_JOB_EVENTS)
+        with self._lock:
+            finished = [old for old in self.jobs.values() if old.finished()]
+            for old in finished[:-MAX_FINISHED_JOBS or None]:
+                del self.jobs[old.id]
+
+    def get(self, job_id):
+        # Ids are zero-padded ("00001"); /jobs/1 finds the same job
+        return self.jobs.get(f"{int(job_id):05d}")
+
+    def _run_folder(self, job, logger, on_result):
+        from lets_do_this import process_folder
+        from generate_populated_csv import populate_csv, should_process_folder
+
+        folder = job.payload["folder"]
+        input_json = os.path.join(BASE_FOLDER, folder, "employee_data.json")
+        with open(input_json, "r", encoding="utf-8") as f:
+            job.progress["total"] = len(json.load(f))
+        counts = process_folder(
+            folder, base_folder=BASE_FOLDER, logger=logger, on_result=on_result, grammars=self.current_grammars()
+        )
+        if not should_process_folder(folder):
+            raise RuntimeError(f"❌ {counts['failed']} employee(s) failed; see {BASE_FOLDER}/{folder}/failed_chunks.json")
+        populate_csv(folder)
+        return {
+            "folder": folder,
+            "json": os.path.join(BASE_FOLDER, folder, "parsed_employee_data.json"),
+            "csv": os.path.join(BASE_FOLDER, folder, "populated_output.csv"),
+            **counts,
+        }
+
+
+# === HTTP API ===
+# POST /jobs                       {"folder": ...} | {"rtf": ..., "pdf": ..., "client": ...} | {"path": "x.xlsx", "client": ...}
+# POST /jobs/upload?filename=x.xlsx&client=NewBaltimore   (raw file as the request body)
+# GET  /jobs, /jobs/<id>, /jobs/<id>/events (server-sent events), /jobs/<id>/result.json, /jobs/<id>/result.csv
+JOB_PATH = re.compile(r"^/jobs/(?P<id>\d+)(?P<rest>/events|/result\.json|/result\.csv)?$")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # job events already cover what matters
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, content_type):
+        if not path or not os.path.exists(path):
+            return self._send_json({"error": "result not available"}, 404)
+        with open(path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            if url.path == "/jobs/upload":
+                query = parse_qs(url.query)
+                filename = os.path.basename(query.get("filename", [""])[0])
+                if not filename.lower().endswith(".xlsx"):
+                    return self._send_json({"error": "upload an .xlsx register (?filename=...)"}, 400)
+                os.makedirs(UPLOAD_DIR, exist_ok=True)
+                path = os.path.join(UPLOAD_DIR, f"{int(time.time() * 1000)}-{filename}")
+                with open(path, "wb") as f:
+                    f.write(self._read_body())
+                from ingest_daemon import infer_client
+                client = query.get("client", [None])[0]
+                job = self.service.submit("xlsx", {"source": path, "client": infer_client(path, client)})
+                return self._send_json(job.summary(), 202)
+
+            if url.path == "/jobs":
+                payload = json.loads(self._read_body() or b"{}")
+                if "folder" in payload:
+                    kind, job_payload = "folder", {"folder": os.path.basename(payload["folder"])}
+                elif "rtf" in payload:
+                    from ingest_daemon import infer_client
+                    kind = "rtf"
+                    job_payload = {
+                        "source": payload["rtf"],
+                        "pdf": payload.get("pdf") or os.path.splitext(payload["rtf"])[0] + ".pdf",
+                        "client": infer_client(payload["rtf"], payload.get("client")),
+                    }
+                elif "path" in payload:
+                    from ingest_daemon import infer_client
+                    kind, job_payload = "xlsx", {"source": payload["path"], "client": infer_client(payload["path"], payload.get("client"))}
+                else:
+                    return self._send_json({"error": "expected 'folder', 'rtf' or 'path'"}, 400)
+                return self._send_json(self.service.submit(kind, job_payload).summary(), 202)
+        except (ValueError, KeyError) as e:
+            return self._send_json({"error": str(e)}, 400)
+        self._send_json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ("/jobs", "/jobs/"):
+            return self._send_json([job.summary() for job in list(self.service.jobs.values())])
+        if url.path == "/health":
+            return self._send_json({"ok": True, "jobs": len(self.service.jobs)})
+
+        match = JOB_PATH.match(url.path)
+        job = self.service.get(match.group("id")) if match else None
+        if job is None:
+            return self._send_json({"error": "not found"}, 404)
+
+        rest = match.group("rest")
+        if rest is None:
+            return self._send_json(job.summary())
+        if rest == "/events":
+            return self._stream_events(job)
+        key, content_type = ("json", "application/json") if rest == "/result.json" else ("csv", "text/csv")
+        return self._send_file((job.result or {}).get(key), content_type)
+
+    def _stream_events(self, job):
+        # Server-sent events; reconnecting clients resume from Last-Event-ID
+        try:
+            start = int(self.headers.get("Last-Event-ID", "-1")) + 1
+        except ValueError:
+            start = 0  # malformed header: replay from the first event
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while True:
+                events, finished = job.wait_events(start, SSE_KEEPALIVE_SECONDS)
+                if not events and not finished:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    self.wfile.write(
+                        f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n".encode("utf-8")
+                    )
+                    start = event["id"] + 1
+                self.wfile.flush()
+                if finished and start >= job.next_id():
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+def main():
+    service = JobService()
+    service.warm_up()
+    JobRequestHandler.service = service
+    server = ThreadingHTTPServer((HOST, PORT), JobRequestHandler)
+    server.daemon_threads = True
+    print(f"🟢 Job server on http://{HOST}:{PORT} ({MAX_CONCURRENT_JOBS} concurrent jobs)")
+    if profile_dir():
+        print(f"⏱️ Profiling every stage ({PROFILE_ENV}) → {profile_dir()}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Shutting down")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,216 +1,336 @@
 import os
 import json
+import threading
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_not_exception_type
 from tqdm import tqdm
-import google.generativeai as genai
+from src.json_repair import loads_tolerant
+from src.extraction_prompt import EXTRACTION_INSTRUCTIONS, EXPECTED_KEYS, build_prompt
+from src.hedging import HedgePolicy
+from src.block_normalizer import normalize_block, preflight_folders
+from src.model_router import ModelRouter
+from src.layout_induction import load_grammar, extract_with_grammar
+from src.scheduler import order_folders
+from src.stream_extract import STREAM_RESPONSES, StreamAborted, make_streaming_extractor
+from src.key_pool import get_key_pool, generate_text, multi_key_configured, parse_keys
+from src.truncation import get_output_ceilings, completion_from_sdk, extract_with_ceiling
+from src.profiling import profiled_stage
+from generate_populated_csv import extract_payroll_dates_from_folder
 
 # === Config ===
 MAX_WORKERS = 8
 BASE_FOLDER = "Extracted"
-
-# === Load Gemini API Key ===
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("❌ Missing GEMINI_API_KEY in .env")
-
-# === Initialize Gemini Client ===
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash-lite")
-
-# === Retry Wrapper ===
-@retry(wait=wait_exponential(min=2, max=15), stop=stop_after_attempt(3), retry=retry_if_exception_type(Exception))
-def send_to_gemini(prompt):
-    response = model.generate_content(prompt)
-    raw_output = response.text.strip()
-    if raw_output.startswith("```json"):
-        raw_output = raw_output.removeprefix("```json").removesuffix("```").strip()
-    elif raw_output.startswith("```"):
-        raw_output = raw_output.removeprefix("```").removesuffix("```").strip()
-    return json.loads(raw_output)
-
-# === Prompt Template Function ===
-def build_prompt(chunk):
-    return f"""
-You are a strict payroll data extractor.
-
-From the raw payroll block below, extract values as a flat JSON using exactly the following keys.  
-If a value is missing, set it to `null`. All keys must always be present.
-
-Include both **Current** and **YTD** values for all applicable fields.
-
-Also extract employee-level totals:
-- "Total Deductions", "Total Taxes", and "Net Pay"
-
-Earnings Field Format:
-- All earning types (e.g., Regular, Sick, Holiday, Personal, Vac, Comp, Jury, etc.) follow this format:
- | Hours | Rate | Current Amount | YTD Amount |
-
-Fallback Parsing Rules:
-Each earnings line will follow exactly one of these 3 formats:
-
-1. **Full format with 4 values**:  
-   `Hours | Rate | Current Amount | YTD Amount`  
-   → Assign all four values in order.
-
-2. **Two values**:  
-   `Current Amount | YTD Amount` (preceded by two empty separators)  
-   → Assign to **Current Amount** and **YTD Amount**.  
-   Set `Hours` and `Rate` = null.
-
-3. **Single value at the end**:  
-   `|||YTD Amount|`  
-   → Assign to **YTD Amount**.  
-   Set all others = null.
-
-- Field separators may be pipes (`|`), tabs (`\t`), or multiple spaces — treat them all the same.
-
-Field Name Disambiguation:
-- "Vision Ins" and "Vision Insurance" are **distinct fields**.
-- "Dental Ins" and "Dental Insurance" are **also distinct**.
-- Similarly named fields must not be merged or inferred from each other.
-
-
-
-Here is the required structure:
-
-{{
-  "Emp#": null,
-  "Name": null,
-
-  "RegHrs": null, "RegRate":null, "RegAmt": null, "RegAmt_YTD": null,
-  "VacHrs": null, "VacRate":null, "VacAmt": null, "VacAmt_YTD": null,
-  "HolHrs": null, "HolRate":null, "HolAmt": null, "HolAmt_YTD": null,
-  "ReimbAmt": null, "ReimbAmt_YTD": null,
-  "SickHrs": null, "SickRate":null, "SickAmt": null, "SickAmt_YTD": null,
-  "OTHrs": null,   "OTRate":null,   "OTAmt": null,   "OTAmt_YTD": null,
-  "PersonalHrs": null, "PersonalRate":null, "PersonalAmt": null, "PersonalAmt_YTD": null,
-
-  "Deputy Hrs": null, "Deputy Rate":null, "Deputy Amt": null, "Deputy Amt_YTD": null,
-  "Recor Hrs": null, "Recor Rate":null, "Recor Amt": null, "Recor Amt_YTD": null,
-  "Comp Hrs": null, "Comp Rate":null, "Comp Amt": null, "Comp Amt_YTD": null,
-  "Clerk Hrs": null, "Clerk Rate":null, "Clerk Amt": null, "Clerk Amt_YTD": null,
-  "Jury Hrs": null, "Jury Rate":null, "Jury Amt": null, "Jury Amt_YTD": null,
-  "BRV Hrs": null, "BRV Rate":null, "BRV Amt": null, "BRV Amt_YTD": null,
-  "OtherHrs": null, "OtherRate":null, "OtherAmt": null, "OtherAmt_YTD": null,
-  "Emergency Mgmt Hrs": null, "Emergency Mgmt Rate":null, "Emergency Mgmt Amt": null, "Emergency Mgmt Amt_YTD": null,
-  "Retro Pay": null, "Retro Pay_YTD": null,
-  "Deputy Supt Amt": null, "Deputy Supt Amt_YTD": null,
-  "Supv Secretary Amt": null, "Supv Secretary Amt_YTD": null,
-  "Assessor Hrs": null, "Assessor Rate":null, "Assessor Amt": null, "Assessor Amt_YTD": null,
-  "Codes Hrs": null, "Code Rate":null, "Codes Amt": null, "Codes Amt_YTD": null,
-  "Zoning Hrs": null, "Zoning Rate":null, "Zoning Amt": null, "Zoning Amt_YTD": null,
-  "Planning Hrs": null, "Planning Rate":null, "Planning Amt": null, "Planning Amt_YTD": null,
-  "Collector Hrs": null, "Collector Rate":null, "Collector Amt": null, "Collector Amt_YTD": null,
-
-  "FWT": null, "FWT_YTD": null,
-  "SS W/H": null, "SS W/H_YTD": null,
-  "MC W/H": null, "MC W/H_YTD": null,
-  "NY State Tax": null, "NY State Tax_YTD": null,
-  "NY SDI": null, "NY SDI_YTD": null,
-  "NY PFML": null, "NY PFML_YTD": null,
-
-  "ER SS": null, "ER SS_YTD": null,
-  "ER MC": null, "ER MC_YTD": null,
-  "FUTA": null, "FUTA_YTD": null,
-  "NY SUTA": null, "NY SUTA_YTD": null,
-   
-  "403(b) for EE": null, "403(b) for EE_YTD": null,
-  "414(h)": null, "414(h)_YTD": null,
-  "457(b)": null, "457(b)_YTD": null,
-  "457(b) (50+)": null, "457(b) (50+)_YTD": null,
-  "Aflac": null, "Aflac_YTD": null,
-  "Child/Spousal Support": null, "Child/Spousal Support_YTD": null,
-  "Colonial AC": null, "Colonial AC_YTD": null,
-  "Colonial DB": null, "Colonial DB_YTD": null,
-  "Medical Ins": null, "Medical Ins_YTD": null,
-  "Medical Insurance": null, "Medical Insurance_YTD": null,
-  "Dental Ins": null, "Dental Ins_YTD": null,
-  "Vision Ins": null, "Vision Ins_YTD": null,
-  "Dental Insurance": null, "Dental Insurance_YTD": null,
-  "Vision Insurance": null, "Vision Insurance_YTD": null,
-  "Aflac Pre-Tax": null, "Aflac Pre-Tax_YTD": null,
-  "Union Dues": null, "Union Dues_YTD": null,
-  "Pre Tax SCP": null, "Pre Tax SCP_YTD": null,
-  "Roth 457(b)": null, "Roth 457(b)_YTD": null,
-  "Loan Repayment": null, "Loan Repayment_YTD": null,
-
-  "Net Pay": null
-}}
-
-Rules:
-- Only return valid **JSON**
-- Use `null` if any value is not present
-- No markdown, no explanation, no extra keys
-
-Raw input:
-{chunk}
-""".strip()
+MODEL_NAME = "gemini-2.0-flash-lite"
+USE_MODEL_ROUTER = True
+MODEL_TIERS = ["gemini-2.0-flash-lite", "gemini-2.0-flash"]
+USE_HEDGING = os.getenv("GEMINI_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = 0.9
+HEDGE_BUDGET = 0.1  # at most ~10% extra requests
+NORMALIZE_BLOCKS = True
+USE_LAYOUT_GRAMMAR = True  # learned per client by: python -m src.layout_induction
+
+# === Gemini Client (configured on first use, so importing this module stays cheap) ===
+_client_lock = threading.Lock()
+genai = None
+models = {}
+stream_extractor = None
+key_pool = None
+
+def get_genai():
+    global genai
+    with _client_lock:
+        if genai is None:
+            import google.generativeai as client
+            load_dotenv()
+            api_key = os.getenv("GEMINI_API_KEY") or next((k for _, k in parse_keys(os.getenv("GEMINI_API_KEYS"))), None)
+            if not api_key:
+                raise ValueError("❌ Missing GEMINI_API_KEY in .env")
+            client.configure(api_key=api_key)
+            genai = client
+        return genai
+
+def get_model(model_name):
+    client = get_genai()
+    with _client_lock:
+        if model_name not in models:
+            models[model_name] = client.GenerativeModel(model_name)
+        return models[model_name]
+
+# === Optional: several keys (GEMINI_API_KEYS) shared by quota headroom ===
+# The SDK is configured with one key process-wide, so pooled calls go over REST
+def get_key_pool_if_shared():
+    global key_pool
+    with _client_lock:
+        if key_pool is None and multi_key_configured():
+            key_pool = get_key_pool()
+        return key_pool
+
+# === Optional: stream responses, abort and re-send as soon as the JSON goes wrong ===
+def get_stream_extractor():
+    global stream_extractor
+    if not STREAM_RESPONSES:
+        return None
+    pool = get_key_pool_if_shared()
+    with _client_lock:
+        if stream_extractor is None:
+            stream_extractor = make_streaming_extractor(pool)
+        return stream_extractor
+
+# === Optional: duplicate straggling requests past the tracked latency percentile ===
+hedge_policy = None
+if USE_HEDGING:
+    hedge_policy = HedgePolicy(percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET, max_workers=MAX_WORKERS * 2)
+
+# === Retry Wrapper (transport errors only; aborted streams were already re-sent) ===
+@retry(wait=wait_exponential(min=2, max=15), stop=stop_after_attempt(3), retry=retry_if_not_exception_type(StreamAborted))
+def call_gemini(prompt, chunk=None, model_name=MODEL_NAME):
+    streamer = get_stream_extractor()
+    if streamer is not None:
+        # Full-record calls are checked against the schema; re-asks only structurally
+        return streamer.generate(prompt, model_name, EXPECTED_KEYS if chunk is not None else None)
+    pool = get_key_pool_if_shared()
+    if pool is not None:
+        return generate_text(prompt, model_name, pool)
+    response = get_model(model_name).generate_content(prompt)
+    return completion_from_sdk(response)
+
+# === Tolerant decode + partial re-ask ===
+# A response cut at MAX_TOKENS keeps its complete members; only the rest is
+# asked for, in parts that fit (see src/truncation.py)
+def send_to_gemini(prompt, chunk=None, model_name=MODEL_NAME, client=None):
+    if chunk is None:
+        return loads_tolerant(call_gemini(prompt, chunk, model_name))
+    return extract_with_ceiling(
+        lambda: call_gemini(prompt, chunk, model_name),
+        lambda reask: call_gemini(reask, model_name=model_name),
+        chunk, EXPECTED_KEYS, get_output_ceilings(), client,
+    )
+
+def send_with_policies(prompt, chunk, model_name=MODEL_NAME, client=None):
+    if hedge_policy is not None:
+        return hedge_policy.call(send_to_gemini, prompt, chunk, model_name, client)
+    return send_to_gemini(prompt, chunk, model_name, client)
+
+# === Two-tier routing: cheap model first, escalate on failed arithmetic checks ===
+def make_router(client=None):
+    if not USE_MODEL_ROUTER:
+        return None
+    return ModelRouter(lambda prompt, chunk, model_name: send_with_policies(prompt, chunk, model_name, client), tiers=MODEL_TIERS)
 
 # === Parallel Chunk Processor ===
-def process_employee(emp):
+def process_employee(emp, grammar=None, router=None, client=None):
     emp_id = emp.get("Emp#", "unknown")
     chunk = emp.get("Block", "")
     if "Net Pay" not in chunk:
         return {"status": "skipped", "data": {"Emp#": emp_id, "Block": chunk}}
     try:
-        prompt = build_prompt(chunk)
-        parsed = send_to_gemini(prompt)
+        parsed, routing = None, None
+        if grammar is not None:
+            ask_fn = lambda p: call_gemini(p, model_name=MODEL_TIERS[0])
+            parsed, source = extract_with_grammar(grammar, chunk, ask_fn)
+        if parsed is None:
+            # No grammar, or it could not settle this employee: full routed extraction
+            prompt_chunk = normalize_block(chunk) if NORMALIZE_BLOCKS else chunk
+            prompt = build_prompt(prompt_chunk)
+            if router is not None:
+                parsed, routing = router.extract(emp_id, prompt, prompt_chunk, chunk)
+            else:
+                parsed = send_with_policies(prompt, prompt_chunk, client=client)
+            source = "llm"
         parsed["Emp#"] = emp_id
         if not parsed.get("Name"):
             parsed["Name"] = chunk.strip().split("\n")[0].strip()
-        return {"status": "success", "data": parsed}
+        return {"status": "success", "source": source, "data": parsed, "routing": routing}
     except Exception as e:
         return {"status": "failed", "data": {"Emp#": emp_id, "error": str(e), "raw_input": chunk}}
 
-# === Main Folder Loop ===
-for folder in os.listdir(BASE_FOLDER):
-    folder_path = os.path.join(BASE_FOLDER, folder)
-    if not os.path.isdir(folder_path):
-        continue
-
+# === One folder: Extracted/<Client-dates>/employee_data.json → parsed_employee_data.json ===
+def start_folder(folder, base_folder=BASE_FOLDER, logger=print, grammars=None):
+    # Loads a folder's employees and per-folder state; None when there is nothing to parse.
+    # grammars: {client: grammar} already loaded by a long-running caller (job_server)
+    folder_path = os.path.join(base_folder, folder)
     input_json = os.path.join(folder_path, "employee_data.json")
-    output_json = os.path.join(folder_path, "parsed_employee_data.json")
-    failed_json = os.path.join(folder_path, "failed_chunks.json")
-    skipped_json = os.path.join(folder_path, "skipped_chunks.json")
-
     if not os.path.exists(input_json):
-        print(f"⚠️ Skipping {folder} (no employee_data.json)")
-        continue
+        logger(f"⚠️ Skipping {folder} (no employee_data.json)")
+        return None
+    get_genai()  # fail fast on a missing key instead of once per employee
 
-    print(f"\n📂 Processing folder: {folder}")
+    logger(f"\n📂 Processing folder: {folder}")
     with open(input_json, "r", encoding="utf-8") as f:
         employee_blocks = json.load(f)
 
-    parsed_employees = []
-    failed_chunks = []
-    skipped_chunks = []
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(process_employee, emp) for emp in employee_blocks]
-        for future in tqdm(as_completed(futures), total=len(futures), desc="🔄 Parsing"):
-            result = future.result()
-            if result["status"] == "success":
-                parsed_employees.append(result["data"])
-            elif result["status"] == "failed":
-                failed_chunks.append(result["data"])
-            else:
-                skipped_chunks.append(result["data"])
+    try:
+        client = extract_payroll_dates_from_folder(folder)["ClientName"]
+    except ValueError:
+        client = None
+    grammar = None
+    if USE_LAYOUT_GRAMMAR and client:
+        grammar = grammars[client] if grammars is not None and client in grammars else load_grammar(client)
+
+    return {
+        "folder": folder,
+        "folder_path": folder_path,
+        "employees": employee_blocks,
+        "remaining": len(employee_blocks),
+        "client": client,
+        "grammar": grammar,
+        "router": make_router(client),
+        "parsed": [],
+        "failed": [],
+        "skipped": [],
+        "sources": {},
+    }
+
+
+def record_result(state, result):
+    if result["status"] == "success":
+        state["parsed"].append(result["data"])
+        state["sources"][result["source"]] = state["sources"].get(result["source"], 0) + 1
+    elif result["status"] == "failed":
+        state["failed"].append(result["data"])
+    else:
+        state["skipped"].append(result["data"])
+    state["remaining"] -= 1
+
+
+def finish_folder(state, logger=print):
+    folder, folder_path = state["folder"], state["folder_path"]
+    output_json = os.path.join(folder_path, "parsed_employee_data.json")
+    failed_json = os.path.join(folder_path, "failed_chunks.json")
+    skipped_json = os.path.join(folder_path, "skipped_chunks.json")
+    routing_json = os.path.join(folder_path, "routing_log.json")
+    # Results arrive in completion order; keep the register's order in the outputs
+    register_order = {str(emp.get("Emp#")): i for i, emp in enumerate(state["employees"])}
+    for key in ("parsed", "failed", "skipped"):
+        state[key].sort(key=lambda rec: register_order.get(str(rec.get("Emp#")), len(register_order)))
 
     # Save Outputs
     with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(parsed_employees, f, indent=2)
-    print(f"💾 Saved parsed employees → {output_json}")
+        json.dump(state["parsed"], f, indent=2)
+    logger(f"💾 Saved parsed employees → {output_json}")
 
-    if failed_chunks:
+    if state["failed"]:
         with open(failed_json, "w", encoding="utf-8") as f:
-            json.dump(failed_chunks, f, indent=2)
-        print(f"⚠️ Saved failed chunks → {failed_json}")
+            json.dump(state["failed"], f, indent=2)
+        logger(f"⚠️ Saved failed chunks → {failed_json}")
 
-    if skipped_chunks:
+    if state["skipped"]:
         with open(skipped_json, "w", encoding="utf-8") as f:
-            json.dump(skipped_chunks, f, indent=2)
-        print(f"🟡 Saved skipped chunks → {skipped_json}")
-    print(f"✅ Completed processing folder: {folder}\n")
+            json.dump(state["skipped"], f, indent=2)
+        logger(f"🟡 Saved skipped chunks → {skipped_json}")
+    if state["grammar"] is not None:
+        logger(f"🧩 Layout grammar v{state['grammar']['version']}: " + ", ".join(f"{k}={v}" for k, v in state["sources"].items()))
+    router = state["router"]
+    if router is not None:
+        decisions = router.decisions
+        with open(routing_json, "w", encoding="utf-8") as f:
+            json.dump(decisions, f, indent=2)
+        logger(ModelRouter.summarize(decisions))
+    if hedge_policy is not None:
+        logger(hedge_policy.report())
+    if stream_extractor is not None:
+        logger(stream_extractor.report())
+    if key_pool is not None:
+        logger(key_pool.report())
+    logger(get_output_ceilings().report())
+    logger(f"✅ Completed processing folder: {folder}\n")
+    return {"parsed": len(state["parsed"]), "failed": len(state["failed"]), "skipped": len(state["skipped"])}
+
+
+@profiled_stage("extract")
+def process_folder(folder, base_folder=BASE_FOLDER, logger=print, on_result=None, grammars=None):
+    # on_result(result) is called as each employee finishes (for progress reporting)
+    state = start_folder(folder, base_folder, logger, grammars)
+    if state is None:
+        return None
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(process_employee, emp, state["grammar"], state["router"], state["client"]) for emp in state["employees"]]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="🔄 Parsing"):
+            result = future.result()
+            if on_result is not None:
+                on_result(result)
+            record_result(state, result)
+    return finish_folder(state, logger)
+
+
+# === Whole backlog: one pool, employees from every pending folder ===
+# Folders are opened one after another in pay-date order, but the pool never
+# waits for a folder to drain: while the last employees of one folder are in
+# flight, idle workers already take employees of the next. Each folder's
+# outputs are written the moment its own last employee finishes.
+@profiled_stage("extract")
+def process_backlog(folders=None, base_folder=BASE_FOLDER, logger=print, on_result=None, workers=MAX_WORKERS, grammars=None):
+    # folders=None: everything under base_folder in scheduler order, re-read each
+    # time a folder has been handed out so a newly dropped due payroll goes next
+    started = set()
+    given = list(folders) if folders is not None else None
+    tasks = deque()  # (state, emp) of the folder being handed out
+    in_flight = {}
+    counts = {}
+    bar = tqdm(total=0, desc="🔄 Parsing")
+
+    def next_folder():
+        if given is not None:
+            return given.pop(0) if given else None
+        pending = [
+            f for f in os.listdir(base_folder)
+            if f not in started and os.path.isdir(os.path.join(base_folder, f))
+        ]
+        return order_folders(pending)[0] if pending else None
+
+    def next_task():
+        while not tasks:
+            folder = next_folder()
+            if folder is None:
+                return None
+            started.add(folder)
+            state = start_folder(folder, base_folder, logger, grammars)
+            if state is None:
+                continue
+            if not state["employees"]:
+                counts[folder] = finish_folder(state, logger)
+                continue
+            tasks.extend((state, emp) for emp in state["employees"])
+            bar.total += len(state["employees"])
+            bar.refresh()
+        return tasks.popleft()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def refill():
+            # Two tasks per worker keeps the pool busy without queueing the whole backlog
+            while len(in_flight) < workers * 2:
+                task = next_task()
+                if task is None:
+                    return
+                state, emp = task
+                in_flight[executor.submit(process_employee, emp, state["grammar"], state["router"], state["client"])] = state
+
+        refill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                state = in_flight.pop(future)
+                result = future.result()
+                if on_result is not None:
+                    on_result(result)
+                record_result(state, result)
+                bar.update(1)
+                if state["remaining"] == 0:
+                    counts[state["folder"]] = finish_folder(state, logger)
+            refill()
+    bar.close()
+    return counts
+
+
+# === Main Folder Loop ===
+def main():
+    # Pre-flight: estimated tokens, cost and request count for the whole run
+    preflight_folders(BASE_FOLDER, EXTRACTION_INSTRUCTIONS, EXPECTED_KEYS, MODEL_NAME, normalize=NORMALIZE_BLOCKS)
+    # Earliest pay date first, backfills shared across clients (see src/scheduler.py)
+    process_backlog()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import json
 import time
 import requests
 from dotenv import load_dotenv
+from src.json_repair import loads_tolerant
 
 # === Config ===
 REQUEST_DELAY_SECONDS = 7
@@ -10,33 +11,8 @@ FAILED_LOG_PATH = "data/pdf_ones/failed_chunks_pdf.json"
 SUCCESS_LOG_PATH = "data/pdf_ones/all_extracted_employees_pdf.json"
 CHUNKS_FILE_PATH = "data/pdf_ones/employee_chunks_raw_pdf.json"
 
-# === Load employee chunks ===
-with open(CHUNKS_FILE_PATH, "r", encoding="utf-8") as f:
-    employee_chunks = json.load(f)
-
-# === Gemini API setup ===
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not GEMINI_API_KEY:
-    raise ValueError("❌ Missing GEMINI_API_KEY in .env")
-
-GEMINI_URL = (
-    f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-)
-HEADERS = {"Content-Type": "application/json"}
-
-# === Output containers ===
-all_extracted = []
-failed_chunks = []
-
-# === Gemini extraction loop ===
-for idx, chunk in enumerate(employee_chunks):
-    if not any(word.startswith("Emp#") for word in chunk.split()) or "Net Pay" not in chunk:
-        print(f"⚠️ Skipping likely header-only chunk #{idx+1}")
-        continue
-
-    prompt = f"""
+# === Extraction prompt ({chunk} is filled in per employee) ===
+PROMPT_TEMPLATE = """
 You are a strict payroll data extractor.
 
 From the raw payroll block below, extract values as a flat JSON using exactly the following keys.  
@@ -121,58 +97,86 @@ Rules:
 
 Raw input:
 {chunk}
-""".strip()
+"""
+
+def main():
+    # === Load employee chunks ===
+    with open(CHUNKS_FILE_PATH, "r", encoding="utf-8") as f:
+        employee_chunks = json.load(f)
 
+    # === Gemini API setup ===
+    load_dotenv()
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-    body = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
+    if not GEMINI_API_KEY:
+        raise ValueError("❌ Missing GEMINI_API_KEY in .env")
 
-    try:
-        print(f"⏳ Sending employee #{idx+1}...")
-        res = requests.post(GEMINI_URL, headers=HEADERS, json=body)
-        res.raise_for_status()
+    GEMINI_URL = (
+        f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
+    )
+    HEADERS = {"Content-Type": "application/json"}
 
-        response_data = res.json()
-        raw_output = response_data['candidates'][0]['content']['parts'][0]['text'].strip()
+    # === Output containers ===
+    all_extracted = []
+    failed_chunks = []
 
-        # Clean up markdown fences if they exist
-        if raw_output.startswith("```json"):
-            raw_output = raw_output.removeprefix("```json").removesuffix("```").strip()
-        elif raw_output.startswith("```"):
-            raw_output = raw_output.removeprefix("```").removesuffix("```").strip()
+    # === Gemini extraction loop ===
+    for idx, chunk in enumerate(employee_chunks):
+        if not any(word.startswith("Emp#") for word in chunk.split()) or "Net Pay" not in chunk:
+            print(f"⚠️ Skipping likely header-only chunk #{idx+1}")
+            continue
+
+        prompt = PROMPT_TEMPLATE.format(chunk=chunk).strip()
+
+
+        body = {
+            "contents": [{"parts": [{"text": prompt}]}]
+        }
 
         try:
-            parsed = json.loads(raw_output)
-            all_extracted.append(parsed)
-            print(f"✅ Success for employee #{idx+1}")
-        except json.JSONDecodeError as e:
-            print(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
+            print(f"⏳ Sending employee #{idx+1}...")
+            res = requests.post(GEMINI_URL, headers=HEADERS, json=body)
+            res.raise_for_status()
+
+            response_data = res.json()
+            raw_output = response_data['candidates'][0]['content']['parts'][0]['text'].strip()
+
+            try:
+                # Tolerant decode: strips fences/prose, quotes bare keys, closes truncated output
+                parsed = loads_tolerant(raw_output)
+                all_extracted.append(parsed)
+                print(f"✅ Success for employee #{idx+1}")
+            except json.JSONDecodeError as e:
+                print(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
+                failed_chunks.append({
+                    "index": idx,
+                    "error": "parse_failed",
+                    "raw": raw_output,
+                    "input": chunk
+                })
+
+        except Exception as e:
+            print(f"❌ Error for employee #{idx+1}: {e}")
             failed_chunks.append({
                 "index": idx,
-                "error": "parse_failed",
-                "raw": raw_output,
+                "error": str(e),
                 "input": chunk
             })
 
-    except Exception as e:
-        print(f"❌ Error for employee #{idx+1}: {e}")
-        failed_chunks.append({
-            "index": idx,
-            "error": str(e),
-            "input": chunk
-        })
-
-    time.sleep(REQUEST_DELAY_SECONDS)
-
-# === Save output files ===
-with open(SUCCESS_LOG_PATH, "w", encoding="utf-8") as f:
-    json.dump(all_extracted, f, indent=2)
-print(f"✅ Extracted data saved to: {SUCCESS_LOG_PATH}")
-
-if failed_chunks:
-    with open(FAILED_LOG_PATH, "w", encoding="utf-8") as f:
-        json.dump(failed_chunks, f, indent=2)
-    print(f"⚠️ Failed chunks saved to: {FAILED_LOG_PATH}")
-else:
-    print("🎉 No failed chunks. All data extracted successfully.")
+        time.sleep(REQUEST_DELAY_SECONDS)
+
+    # === Save output files ===
+    with open(SUCCESS_LOG_PATH, "w", encoding="utf-8") as f:
+        json.dump(all_extracted, f, indent=2)
+    print(f"✅ Extracted data saved to: {SUCCESS_LOG_PATH}")
+
+    if failed_chunks:
+        with open(FAILED_LOG_PATH, "w", encoding="utf-8") as f:
+            json.dump(failed_chunks, f, indent=2)
+        print(f"⚠️ Failed chunks saved to: {FAILED_LOG_PATH}")
+    else:
+        print("🎉 No failed chunks. All data extracted successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import json
+import os
+import time
+from datetime import datetime
+
+# === Offline batch extraction for large backlogs ===
+# submit:  every employee the layout grammar cannot handle becomes one line of
+#          requests.jsonl (custom ID "<folder>::<Emp#>"), sent as one batch job
+# poll:    batch jobs finish within hours at a lower price than live calls
+# collect: responses are mapped back by custom ID to each folder's
+#          parsed_employee_data.json / failed_chunks.json / skipped_chunks.json
+BATCH_DIR = os.path.join("Data", "batch")
+BASE_FOLDER = "Extracted"
+BATCH_MODEL = "gemini-2.0-flash-lite"
+POLL_SECONDS = 60
+KEY_SEPARATOR = "::"
+SUCCEEDED = {"BATCH_STATE_SUCCEEDED", "JOB_STATE_SUCCEEDED"}
+TERMINAL = SUCCEEDED | {
+    "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED",
+    "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED",
+}
+
+
+# === Backend: Gemini Batch API (REST, same key as the live calls) ===
+class GeminiBatchBackend:
+    API = "https://generativelanguage.googleapis.com"
+
+    def __init__(self):
+        from dotenv import load_dotenv
+        from src.send_chunk_llm import http_session
+
+        from src.key_pool import parse_keys
+
+        load_dotenv()
+        # A batch job belongs to one project, so it stays on one key (the first pooled one if no GEMINI_API_KEY)
+        api_key = os.getenv("GEMINI_API_KEY") or next((k for _, k in parse_keys(os.getenv("GEMINI_API_KEYS"))), None)
+        if not api_key:
+            raise ValueError("❌ Missing GEMINI_API_KEY in .env")
+        self.session = http_session
+        self.headers = {"x-goog-api-key": api_key}
+
+    def _upload(self, path, display_name):
+        with open(path, "rb") as f:
+            data = f.read()
+        start = self.session.post(
+            f"{self.API}/upload/v1beta/files",
+            headers={
+                **self.headers,
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(len(data)),
+                "X-Goog-Upload-Header-Content-Type": "application/jsonl",
+            },
+            json={"file": {"display_name": display_name}},
+        )
+        start.raise_for_status()
+        done = self.session.post(
+            start.headers["x-goog-upload-url"],
+            headers={**self.headers, "X-Goog-Upload-Offset": "0", "X-Goog-Upload-Command": "upload, finalize"},
+            data=data,
+        )
+        done.raise_for_status()
+        return done.json()["file"]["name"]
+
+    def submit(self, model_name, requests_path, display_name):
+        file_name = self._upload(requests_path, display_name)
+        res = self.session.post(
+            f"{self.API}/v1beta/models/{model_name}:batchGenerateContent",
+            headers=self.headers,
+            json={"batch": {"display_name": display_name, "input_config": {"file_name": file_name}}},
+        )
+        res.raise_for_status()
+        return res.json()["name"]
+
+    def status(self, batch_name):
+        res = self.session.get(f"{self.API}/v1beta/{batch_name}", headers=self.headers)
+        res.raise_for_status()
+        job = res.json()
+        metadata = job.get("metadata", {})
+        output = job.get("response") or metadata.get("output") or {}
+        return {
+            "state": metadata.get("state") or job.get("state"),
+            "responses_file": output.get("responsesFile"),
+        }
+
+    def results(self, batch_name, status):
+        res = self.session.get(
+            f"{self.API}/download/v1beta/{status['responses_file']}:download", params={"alt": "media"}, headers=self.headers
+        )
+        res.raise_for_status()
+        return [json.loads(line) for line in res.text.splitlines() if line.strip()]
+
+
+# === Backend: local stand-in (no network, for tests and dry runs) ===
+# Its outputs are written under Data/batch/<tag>/outputs/, never into Extracted/
+class LocalBatchBackend:
+    local = True
+
+    def __init__(self, responder=None, polls_until_done=1):
+        # responder(prompt) -> response text; defaults to an empty JSON object
+        self.responder = responder or (lambda prompt: "{}")
+        self.polls_until_done = polls_until_done
+        self.jobs = {}
+
+    def submit(self, model_name, requests_path, display_name):
+        name = f"batches/local-{os.path.basename(os.path.dirname(requests_path))}"
+        self.jobs[name] = {"requests_path": requests_path, "polls": 0}
+        return name
+
+    def status(self, batch_name):
+        job = self.jobs.setdefault(batch_name, {"polls": self.polls_until_done})
+        job["polls"] += 1
+        done = job["polls"] >= self.polls_until_done
+        return {"state": "BATCH_STATE_SUCCEEDED" if done else "BATCH_STATE_RUNNING", "responses_file": None}
+
+    def results(self, batch_name, status):
+        requests_path = os.path.join(BATCH_DIR, batch_name.split("local-", 1)[1], "requests.jsonl")
+        with open(self.jobs.get(batch_name, {}).get("requests_path", requests_path), "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        results = []
+        for line in lines:
+            prompt = line["request"]["contents"][0]["parts"][0]["text"]
+            try:
+                text = self.responder(prompt)
+            except Exception as e:
+                results.append({"key": line["key"], "error": {"message": str(e)}})
+                continue
+            results.append({"key": line["key"], "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]}})
+        return results
+
+
+def make_backend(local=False):
+    return LocalBatchBackend() if local else GeminiBatchBackend()
+
+
+# === submit ===
+def folders_to_parse(base_folder=BASE_FOLDER, folders=None, force=False):
+    selected = []
+    for folder in folders or sorted(os.listdir(base_folder)):
+        folder_path = os.path.join(base_folder, folder)
+        if not os.path.exists(os.path.join(folder_path, "employee_data.json")):
+            continue
+        if os.path.exists(os.path.join(folder_path, "parsed_employee_data.json")) and not force:
+            continue
+        selected.append(folder)
+    return selected
+
+
+def build_batch(folders, base_folder=BASE_FOLDER):
+    # Returns (request lines, records settled without the model: {folder: {Emp#: result}})
+    from src.block_normalizer import normalize_block
+    from src.extraction_prompt import build_prompt
+    from src.layout_induction import load_grammar, extract_with_grammar
+    from generate_populated_csv import extract_payroll_dates_from_folder
+
+    lines = []
+    settled = {}
+    for folder in folders:
+        with open(os.path.join(base_folder, folder, "employee_data.json"), "r", encoding="utf-8") as f:
+            employees = json.load(f)
+        try:
+            grammar = load_grammar(extract_payroll_dates_from_folder(folder)["ClientName"])
+        except ValueError:
+            grammar = None
+
+        settled[folder] = {}
+        for emp in employees:
+            emp_id, chunk = str(emp["Emp#"]), emp["Block"]
+            if "Net Pay" not in chunk:
+                settled[folder][emp_id] = {"status": "skipped", "data": {"Emp#": emp_id, "Block": chunk}}
+                continue
+            if grammar is not None:
+                record, _ = extract_with_grammar(grammar, chunk)
+                if record is not None:
+                    record["Emp#"] = emp_id
+                    if not record.get("Name"):
+                        record["Name"] = chunk.strip().split("\n")[0].strip()
+                    settled[folder][emp_id] = {"status": "success", "source": "grammar", "data": record}
+                    continue
+            lines.append({
+                "key": f"{folder}{KEY_SEPARATOR}{emp_id}",
+                "request": {"contents": [{"role": "user", "parts": [{"text": build_prompt(normalize_block(chunk))}]}]},
+            })
+    return lines, settled
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def submit_backlog(backend, folders=None, force=False, model_name=BATCH_MODEL, base_folder=BASE_FOLDER, logger=print):
+    folders = folders_to_parse(base_folder, folders, force)
+    if not folders:
+        logger("✅ Nothing to submit: every folder already has parsed_employee_data.json")
+        return None
+    lines, settled = build_batch(folders, base_folder)
+
+    tag = datetime.now().strftime("%Y%m%d-%H%M%S")
+    job_dir = os.path.join(BATCH_DIR, tag)
+    os.makedirs(job_dir, exist_ok=True)
+    requests_path = os.path.join(job_dir, "requests.jsonl")
+    with open(requests_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+    _write_json(os.path.join(job_dir, "settled.json"), settled)
+
+    manifest = {
+        "tag": tag,
+        "model": model_name,
+        "folders": folders,
+        "base_folder": base_folder,
+        "requests": len(lines),
+        "settled": sum(len(v) for v in settled.values()),
+        "batch": None,
+        "local": getattr(backend, "local", False),
+        "state": "NO_REQUESTS",
+        "submitted": datetime.now().isoformat(timespec="seconds"),
+    }
+    if lines:
+        manifest["batch"] = backend.submit(model_name, requests_path, f"payroll-{tag}")
+        manifest["state"] = "BATCH_STATE_PENDING"
+    _write_json(os.path.join(job_dir, "manifest.json"), manifest)
+    logger(
+        f"📦 Batch {tag}: {len(folders)} folder(s), {len(lines)} request(s) to {model_name}, "
+        f"{manifest['settled']} settled locally → {manifest['batch'] or 'nothing to send'}"
+    )
+    return tag
+
+
+# === poll ===
+def list_batches():
+    if not os.path.isdir(BATCH_DIR):
+        return []
+    return [_read_json(os.path.join(BATCH_DIR, tag, "manifest.json"))
+            for tag in sorted(os.listdir(BATCH_DIR))
+            if os.path.exists(os.path.join(BATCH_DIR, tag, "manifest.json"))]
+
+
+def poll_batch(backend, tag):
+    manifest_path = os.path.join(BATCH_DIR, tag, "manifest.json")
+    manifest = _read_json(manifest_path)
+    if manifest["batch"] and manifest["state"] not in TERMINAL and manifest["state"] != "COLLECTED":
+        status = backend.status(manifest["batch"])
+        manifest["state"] = status["state"]
+        manifest["responses_file"] = status["responses_file"]
+        _write_json(manifest_path, manifest)
+    return manifest
+
+
+def wait_for_batch(backend, tag, poll_seconds=POLL_SECONDS, logger=print):
+    while True:
+        manifest = poll_batch(backend, tag)
+        if manifest["state"] in TERMINAL or manifest["state"] in ("NO_REQUESTS", "COLLECTED"):
+            return manifest
+        logger(f"⏳ Batch {tag}: {manifest['state']}; checking again in {poll_seconds:.0f}s")
+        time.sleep(poll_seconds)
+
+
+# === collect ===
+def _response_text(result):
+    return result["response"]["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+
+def collect_batch(backend, tag, logger=print):
+    from src.json_repair import loads_tolerant
+    from src.consistency_checks import run_checks
+
+    job_dir = os.path.join(BATCH_DIR, tag)
+    manifest = poll_batch(backend, tag)
+    if manifest["state"] not in SUCCEEDED and manifest["state"] != "NO_REQUESTS":
+        raise RuntimeError(f"❌ Batch {tag} is {manifest['state']}; nothing to collect yet")
+
+    base_folder = manifest["base_folder"]
+    settled = _read_json(os.path.join(job_dir, "settled.json"))
+    results = backend.results(manifest["batch"], manifest) if manifest["batch"] else []
+    with open(os.path.join(job_dir, "results.jsonl"), "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    chunks = {}
+    for result in results:
+        folder, emp_id = result["key"].split(KEY_SEPARATOR, 1)
+        blocks = settled.setdefault(folder, {})
+        if folder not in chunks:
+            employees = _read_json(os.path.join(base_folder, folder, "employee_data.json"))
+            chunks[folder] = {str(emp["Emp#"]): emp["Block"] for emp in employees}
+        chunk = chunks[folder][emp_id]
+        try:
+            if "error" in result:
+                raise RuntimeError(result["error"].get("message", str(result["error"])))
+            parsed = loads_tolerant(_response_text(result))
+            parsed["Emp#"] = emp_id
+            if not parsed.get("Name"):
+                parsed["Name"] = chunk.strip().split("\n")[0].strip()
+            if run_checks(parsed, chunk)["hard_fail"]:
+                raise ValueError("failed arithmetic checks")
+            blocks[emp_id] = {"status": "success", "source": "batch", "data": parsed}
+        except Exception as e:
+            blocks[emp_id] = {"status": "failed", "data": {"Emp#": emp_id, "error": str(e), "raw_input": chunk}}
+
+    # Same outputs as lets_do_this.process_folder, in register order. A local
+    # (stand-in) batch writes them under the batch folder instead of Extracted/.
+    local = manifest.get("local") or getattr(backend, "local", False)
+    output_base = os.path.join(job_dir, "outputs") if local else base_folder
+    totals = {"success": 0, "failed": 0, "skipped": 0}
+    for folder in manifest["folders"]:
+        folder_path = os.path.join(base_folder, folder)
+        output_path = os.path.join(output_base, folder)
+        os.makedirs(output_path, exist_ok=True)
+        order = [str(emp["Emp#"]) for emp in _read_json(os.path.join(folder_path, "employee_data.json"))]
+        parsed_path = os.path.join(folder_path, "parsed_employee_data.json")
+        previous = {str(rec.get("Emp#")): rec for rec in _read_json(parsed_path)} if os.path.exists(parsed_path) else {}
+        by_status = {"success": [], "failed": [], "skipped": []}
+        kept = 0
+        for emp_id in order:
+            result = settled.get(folder, {}).get(emp_id)
+            if result is None:
+                continue
+            if result["status"] == "failed" and emp_id in previous:
+                # Keep the record we already had rather than dropping the employee
+                by_status["success"].append(previous[emp_id])
+                kept += 1
+                continue
+            by_status[result["status"]].append(result["data"])
+        if kept:
+            logger(f"♻️ {folder}: kept {kept} earlier record(s) for employees the batch failed on")
+        target = os.path.join(output_path, "parsed_employee_data.json")
+        if not local and len(by_status["success"]) < len(previous):
+            # Never replace a folder's records with fewer than it already holds
+            target = os.path.join(job_dir, "outputs", folder, "parsed_employee_data.json")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            logger(f"⚠️ {folder}: batch has {len(by_status['success'])} record(s), the folder already holds "
+                   f"{len(previous)}; left it alone, results → {target}")
+            output_path = os.path.dirname(target)
+        _write_json(target, by_status["success"])
+        for name, key in (("failed_chunks.json", "failed"), ("skipped_chunks.json", "skipped")):
+            path = os.path.join(output_path, name)
+            if by_status[key]:
+                _write_json(path, by_status[key])
+            elif os.path.exists(path):
+                os.remove(path)  # stale from an earlier run
+        for key in totals:
+            totals[key] += len(by_status[key])
+        logger(f"💾 {folder}: {len(by_status['success'])} parsed, {len(by_status['failed'])} failed, "
+               f"{len(by_status['skipped'])} skipped")
+
+    manifest["state"] = "COLLECTED"
+    manifest["collected"] = datetime.now().isoformat(timespec="seconds")
+    manifest["totals"] = totals
+    _write_json(os.path.join(job_dir, "manifest.json"), manifest)
+    logger(f"✅ Batch {tag} collected: {totals['success']} parsed, {totals['failed']} failed, {totals['skipped']} skipped")
+    return totals
+
+
+def format_batches(manifests):
+    if not manifests:
+        return "📦 No batch jobs"
+    return "\n".join(
+        f"📦 {m['tag']}: {m['state']} | {m['requests']} request(s), {m['settled']} settled locally | "
+        f"{len(m['folders'])} folder(s) | {m['batch'] or '—'}"
+        for m in manifests
+    )
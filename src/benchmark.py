@@ -0,0 +1,381 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from src.payroll_fields import IDENTITY_KEYS, to_number
+
+# === Golden set: inputs next to their curated outputs ===
+# Extracted/<folder>/employee_data.json   ↔ parsed_employee_data.json   (RTF registers)
+# Data/raw_chunks/<name>.json             ↔ Data/output/LLM/<name>.json (xlsx registers)
+BASE_FOLDER = "Extracted"
+XLSX_PAIRS = [("Data/raw_chunks/employee_chunks_raw.json", "Data/output/LLM/all_extracted_employees.json")]
+RECORDINGS_DIR = os.path.join("Data", "benchmark", "recordings")
+RESULTS_PATH = os.path.join("Data", "benchmark", "results.json")
+BATCH_SIZE = 5
+
+EMP_ID = re.compile(r"Emp#\s*(\d+)")
+
+
+def load_golden_set(base_folder=BASE_FOLDER, xlsx_pairs=XLSX_PAIRS):
+    from generate_populated_csv import extract_payroll_dates_from_folder
+
+    cases = []
+    for folder in sorted(os.listdir(base_folder)):
+        blocks_path = os.path.join(base_folder, folder, "employee_data.json")
+        parsed_path = os.path.join(base_folder, folder, "parsed_employee_data.json")
+        if not (os.path.exists(blocks_path) and os.path.exists(parsed_path)):
+            continue
+        try:
+            client = extract_payroll_dates_from_folder(folder)["ClientName"]
+        except ValueError:
+            client = None
+        with open(blocks_path, "r", encoding="utf-8") as f:
+            blocks = {str(emp["Emp#"]): emp["Block"] for emp in json.load(f)}
+        with open(parsed_path, "r", encoding="utf-8") as f:
+            for record in json.load(f):
+                emp_id = str(record.get("Emp#"))
+                if emp_id in blocks:
+                    cases.append({"id": f"{folder}#{emp_id}", "schema": "rtf", "client": client, "folder": folder,
+                                  "block": blocks[emp_id], "expected": record})
+
+    for chunks_path, extracted_path in xlsx_pairs:
+        if not (os.path.exists(chunks_path) and os.path.exists(extracted_path)):
+            continue
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            blocks = {}
+            for chunk in json.load(f):
+                emp = EMP_ID.search(chunk)
+                if emp and "Net Pay" in chunk:
+                    blocks[emp.group(1)] = chunk
+        with open(extracted_path, "r", encoding="utf-8") as f:
+            for record in json.load(f):
+                emp_id = str(record.get("Emp#"))
+                if emp_id in blocks:
+                    name = os.path.splitext(os.path.basename(extracted_path))[0]
+                    cases.append({"id": f"{name}#{emp_id}", "schema": "xlsx", "client": None, "folder": None,
+                                  "block": blocks[emp_id], "expected": record})
+    return cases
+
+
+# === Field-level scoring against the curated record ===
+def score_record(expected, actual):
+    # Scored fields are the expected record's non-empty values; a value the
+    # curated record leaves empty but the candidate fills in counts as spurious.
+    fields = agree = spurious = 0
+    wrong = []
+    for key, want in expected.items():
+        if key in IDENTITY_KEYS:
+            continue
+        got = actual.get(key)
+        want_n, got_n = to_number(want), to_number(got)
+        if want_n is None:
+            spurious += bool(got_n)
+            continue
+        fields += 1
+        if want_n == got_n:
+            agree += 1
+        else:
+            wrong.append(key)
+    return {"fields": fields, "agree": agree, "spurious": spurious, "wrong": wrong}
+
+
+# === Recorded LLM responses: replay offline, record once with a live key ===
+class MissingRecording(Exception):
+    pass
+
+
+class Recorder:
+    # mode: "replay" (offline; a prompt without a recording raises MissingRecording),
+    #       "record" (always call the model and store the response),
+    #       "auto"   (replay when recorded, otherwise call and store)
+    def __init__(self, name, mode="replay", model_name="gemini-2.0-flash-lite", recordings_dir=RECORDINGS_DIR):
+        self.mode = mode
+        self.model_name = model_name
+        self.path = os.path.join(recordings_dir, f"{name}.jsonl")
+        self.recordings = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.recordings[entry["key"]] = entry
+        self.usage = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "api_seconds": 0.0}
+
+    def _key(self, prompt):
+        return hashlib.sha1(f"{self.model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _call_live(self, prompt):
+        from lets_do_this import get_model
+        from src.block_normalizer import estimate_tokens
+
+        started = time.perf_counter()
+        response = get_model(self.model_name).generate_content(prompt)
+        latency = time.perf_counter() - started
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "text": response.text,
+            "input_tokens": getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt),
+            "output_tokens": getattr(usage, "candidates_token_count", None) or estimate_tokens(response.text),
+            "latency": round(latency, 3),
+        }
+
+    def __call__(self, prompt):
+        key = self._key(prompt)
+        entry = self.recordings.get(key)
+        if entry is None or self.mode == "record":
+            if self.mode == "replay":
+                raise MissingRecording(key)
+            entry = dict(self._call_live(prompt), key=key, model=self.model_name)
+            self.recordings[key] = entry
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        self.usage["requests"] += 1
+        self.usage["input_tokens"] += entry["input_tokens"]
+        self.usage["output_tokens"] += entry["output_tokens"]
+        self.usage["api_seconds"] += entry["latency"]
+        return entry["text"]
+
+
+# === Extractor backends ===
+# Each backend is called with a list of cases and returns {case id: record};
+# cases it cannot handle are left out and reported as not covered.
+def _full_prompt(case):
+    from src.block_normalizer import normalize_block
+
+    if case["schema"] == "xlsx":
+        from src.send_chunk_llm import build_prompt
+    else:
+        from src.extraction_prompt import build_prompt
+    return build_prompt(normalize_block(case["block"]))
+
+
+def _grammars(base_folder=BASE_FOLDER):
+    # Leave-one-folder-out: each folder is scored with a grammar learned from
+    # the client's other folders, never from the records it is scored against.
+    from src.layout_induction import learn_grammar, load_history
+
+    history = None
+    cache = {}
+
+    def grammar_for(case):
+        nonlocal history
+        if case["schema"] != "rtf" or not case["client"]:
+            return None
+        key = (case["client"], case["folder"])
+        if key not in cache:
+            if history is None:
+                history = load_history(base_folder)
+            pairs = [(block, record) for folder, block, record in history.get(case["client"], []) if folder != case["folder"]]
+            cache[key] = learn_grammar(pairs, case["client"]) if pairs else None
+        return cache[key]
+    return grammar_for
+
+
+def backend_grammar(cases, ask=None):
+    # Learned layout grammar only; no model calls
+    from src.layout_induction import apply_grammar
+
+    grammar_for = _grammars()
+    out = {}
+    for case in cases:
+        grammar = grammar_for(case)
+        if grammar is not None:
+            out[case["id"]] = apply_grammar(grammar, case["block"])[0]
+    return out
+
+
+def backend_grammar_llm(cases, ask):
+    # Grammar first, unseen lines re-asked, full prompt when checks still fail
+    from src.layout_induction import extract_with_grammar
+    from src.json_repair import loads_tolerant
+
+    grammar_for = _grammars()
+    out = {}
+    for case in cases:
+        grammar = grammar_for(case)
+        record = None
+        try:
+            if grammar is not None:
+                record, _ = extract_with_grammar(grammar, case["block"], ask)
+            if record is None:
+                record = loads_tolerant(ask(_full_prompt(case)))
+        except (MissingRecording, json.JSONDecodeError):
+            continue
+        out[case["id"]] = record
+    return out
+
+
+def backend_llm(cases, ask):
+    # One full-schema prompt per employee (what the pipeline does today)
+    from src.json_repair import loads_tolerant
+
+    out = {}
+    for case in cases:
+        try:
+            out[case["id"]] = loads_tolerant(ask(_full_prompt(case)))
+        except (MissingRecording, json.JSONDecodeError):
+            continue
+    return out
+
+
+def backend_llm_pruned(cases, ask):
+    # Schema cut down to the keys this client's registers have ever used
+    from src.block_normalizer import normalize_block
+    from src.json_repair import build_reask_prompt, loads_tolerant
+
+    grammar_for = _grammars()
+    out = {}
+    for case in cases:
+        grammar = grammar_for(case)
+        if grammar is None:
+            continue
+        keys = sorted({k for shapes in grammar["rules"].values() for slots in shapes.values() for k in slots if k})
+        try:
+            out[case["id"]] = loads_tolerant(ask(build_reask_prompt(normalize_block(case["block"]), keys)))
+        except (MissingRecording, json.JSONDecodeError):
+            continue
+    return out
+
+
+def backend_llm_batched(cases, ask, batch_size=BATCH_SIZE):
+    # Several employees per prompt, answered as a JSON array in the same order
+    from src.block_normalizer import normalize_block
+    from src.extraction_prompt import EXTRACTION_INSTRUCTIONS
+    from src.json_repair import strip_code_fences
+
+    out = {}
+    rtf_cases = [c for c in cases if c["schema"] == "rtf"]
+    for start in range(0, len(rtf_cases), batch_size):
+        batch = rtf_cases[start:start + batch_size]
+        blocks = "\n\n".join(f"### Block {i + 1}\n{normalize_block(c['block'])}" for i, c in enumerate(batch))
+        prompt = (
+            f"{EXTRACTION_INSTRUCTIONS}\n\nThere are {len(batch)} blocks below. Return a JSON array with "
+            f"exactly one object per block, in the same order.\n\n{blocks}"
+        )
+        try:
+            records = json.loads(strip_code_fences(ask(prompt)))
+        except (MissingRecording, json.JSONDecodeError):
+            continue
+        if isinstance(records, list) and len(records) == len(batch):
+            for case, record in zip(batch, records):
+                out[case["id"]] = record
+    return out
+
+
+BACKENDS = {
+    "grammar": backend_grammar,
+    "grammar+llm": backend_grammar_llm,
+    "llm": backend_llm,
+    "llm-pruned": backend_llm_pruned,
+    "llm-batched": backend_llm_batched,
+}
+OFFLINE_BACKENDS = {"grammar"}
+
+
+# === Run and compare ===
+def run_backend(name, cases, mode="replay", model_name="gemini-2.0-flash-lite"):
+    from src.block_normalizer import MODEL_PRICES_PER_M
+
+    recorder = None if name in OFFLINE_BACKENDS else Recorder(name, mode, model_name)
+    started = time.perf_counter()
+    records = BACKENDS[name](cases, recorder)
+    wall = time.perf_counter() - started
+
+    scores = {case["id"]: score_record(case["expected"], records[case["id"]]) for case in cases if case["id"] in records}
+    totals = _totals(scores.values())
+
+    usage = recorder.usage if recorder else {"requests": 0, "input_tokens": 0, "output_tokens": 0, "api_seconds": 0.0}
+    in_price, out_price = MODEL_PRICES_PER_M.get(model_name, (0.0, 0.0))
+    return {
+        "backend": name,
+        "cases": len(cases),
+        "covered": len(records),
+        # Accuracy on the backend's own coverage; run_benchmark adds the comparable figures
+        "covered_accuracy": totals["accuracy"],
+        "wall_seconds": round(wall, 3),
+        "api_seconds": round(usage["api_seconds"], 3),
+        "requests": usage["requests"],
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "cost_usd": round(usage["input_tokens"] / 1e6 * in_price + usage["output_tokens"] / 1e6 * out_price, 4),
+        "_scores": scores,
+    }
+
+
+def _totals(scores):
+    totals = {"fields": 0, "agree": 0, "spurious": 0, "exact": 0}
+    wrong_keys = {}
+    for s in scores:
+        for key in ("fields", "agree", "spurious"):
+            totals[key] += s[key]
+        totals["exact"] += not s["wrong"] and not s["spurious"]
+        for key in s["wrong"]:
+            wrong_keys[key] = wrong_keys.get(key, 0) + 1
+    totals["accuracy"] = round(totals["agree"] / totals["fields"], 4) if totals["fields"] else None
+    totals["most_wrong_keys"] = dict(sorted(wrong_keys.items(), key=lambda kv: -kv[1])[:5])
+    return totals
+
+
+def compare_on_common_cases(results):
+    # Accuracy is only comparable on the same employees: score every backend on
+    # the cases all backends with any coverage handled. Backends that covered
+    # nothing (no recordings yet) are left out of the intersection and flagged.
+    scored = [r for r in results if r["_scores"]]
+    common = set.intersection(*(set(r["_scores"]) for r in scored)) if scored else set()
+    for r in results:
+        totals = _totals(r["_scores"][case_id] for case_id in common) if r["_scores"] else None
+        r["common_cases"] = len(common) if totals else 0
+        r["field_accuracy"] = totals["accuracy"] if totals else None
+        r["exact_records"] = totals["exact"] if totals else None
+        r["spurious_fields"] = totals["spurious"] if totals else None
+        r["most_wrong_keys"] = totals["most_wrong_keys"] if totals else {}
+    return sorted(common)
+
+
+def format_comparison(results):
+    header = (f"{'backend':<12} {'covered':>9} {'accuracy':>9} {'exact':>6} {'spurious':>8} {'own acc.':>9} "
+              f"{'wall s':>7} {'api s':>7} {'requests':>8} {'tokens in/out':>17} {'cost $':>8}")
+    lines = [header, "-" * len(header)]
+    for r in results:
+        accuracy = "—" if r["field_accuracy"] is None else f"{r['field_accuracy']:.2%}"
+        own = "—" if r["covered_accuracy"] is None else f"{r['covered_accuracy']:.2%}"
+        exact = "—" if r["exact_records"] is None else r["exact_records"]
+        spurious = "—" if r["spurious_fields"] is None else r["spurious_fields"]
+        lines.append(
+            f"{r['backend']:<12} {r['covered']:>4}/{r['cases']:<4} {accuracy:>9} {exact:>6} "
+            f"{spurious:>8} {own:>9} {r['wall_seconds']:>7.2f} {r['api_seconds']:>7.1f} {r['requests']:>8} "
+            f"{r['input_tokens']:>8,}/{r['output_tokens']:<8,} {r['cost_usd']:>8.4f}"
+        )
+    return "\n".join(lines)
+
+
+def run_benchmark(backends=None, mode="replay", model_name="gemini-2.0-flash-lite", limit=None,
+                  out_path=RESULTS_PATH, logger=print):
+    cases = load_golden_set()
+    if limit:
+        cases = cases[:limit]
+    results = [run_backend(name, cases, mode, model_name) for name in (backends or list(BACKENDS))]
+    common = compare_on_common_cases(results)
+    logger(f"🏁 Golden set: {len(cases)} employee(s) | mode={mode} | model={model_name}")
+    logger(f"📏 accuracy, exact and spurious are scored on the {len(common)} employee(s) every backend with coverage handled; "
+           f"'own acc.' is each backend's accuracy on its own coverage")
+    logger(format_comparison(results))
+    unrecorded = [r["backend"] for r in results if not r["covered"]]
+    if unrecorded:
+        logger(f"⚠️ No coverage for {', '.join(unrecorded)} (no recordings under {RECORDINGS_DIR}?); "
+               f"record them once with `cli.py bench --mode auto` and a live key")
+    for r in results:
+        r.pop("_scores")
+    if out_path:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        logger(f"💾 Results saved to: {out_path}")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(sys.argv[1].split(",") if len(sys.argv) > 1 else None)
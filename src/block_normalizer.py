@@ -0,0 +1,200 @@
+import json
+import math
+import os
+import re
+import sys
+
+
+# === Page header/footer noise ===
+# Lines repeated on every page of the register; they carry no employee values.
+PAGE_NOISE_PATTERNS = [
+    re.compile(r"^\s*Payroll\s+Register\s+Report\s*$", re.IGNORECASE),
+    re.compile(r"^\s*Pay\s+Period\s+From\s+\d{1,2}/\d{1,2}/\d{4}", re.IGNORECASE),
+    re.compile(r"^\s*Earnings[\s|]+Hours\*", re.IGNORECASE),
+    re.compile(r"^\s*Page\s+\d+\s+(of\s+\d+)?\s*$", re.IGNORECASE),
+    re.compile(r"^\s*(Printed|Run\s+Date|Report\s+Date)\s*[:]", re.IGNORECASE),
+    re.compile(r"^\s*\*+\s*(Hours|ER\s+Taxes)\b.*$", re.IGNORECASE),
+]
+REPORT_TITLE = PAGE_NOISE_PATTERNS[0]
+
+# === Compact positional notation ===
+# A run of N+1 identical separators becomes  <sep>~N<sep>  (N empty columns);
+# the extraction prompt explains the notation. A run is only collapsed when
+# the compact form is estimated to cost fewer tokens, so the short patterns
+# the prompt's fallback rules describe ("|||YTD Amount|") stay as they are.
+# Separators trailing the last value on a line are padding and are cut to one.
+SEPARATOR_RUN = re.compile(r"\|{2,}|\t{2,}")
+TRAILING_RUN = re.compile(r"([|\t])[|\t]+$")
+COMPACT_RUN = re.compile(r"([|\t])~(\d+)\1")
+
+
+def _compact_run(match):
+    run = match.group(0)
+    compact = f"{run[0]}~{len(run) - 1}{run[0]}"
+    return compact if estimate_tokens(compact) < estimate_tokens(run) else run
+
+
+def compact_separators(line):
+    line = TRAILING_RUN.sub(r"\1", line)
+    return SEPARATOR_RUN.sub(_compact_run, line)
+
+
+def expand_separators(text):
+    return COMPACT_RUN.sub(lambda m: m.group(1) * (int(m.group(2)) + 1), text)
+
+
+def is_page_noise(line):
+    return any(p.search(line) for p in PAGE_NOISE_PATTERNS)
+
+
+def strip_page_noise(lines):
+    kept = []
+    skip_company_line = False
+    for line in lines:
+        if skip_company_line:
+            # Company name printed directly under the report title
+            skip_company_line = False
+            if line.strip() and "Emp#" not in line and not re.search(r"\d", line):
+                continue
+        if REPORT_TITLE.search(line):
+            skip_company_line = True
+            continue
+        if is_page_noise(line):
+            continue
+        kept.append(line)
+    return kept
+
+
+# === Block normalization ===
+def normalize_block(block):
+    lines = [line.rstrip() for line in block.splitlines()]
+    lines = strip_page_noise(lines)
+    return "\n".join(compact_separators(line) for line in lines if line.strip())
+
+
+# === Local token estimate ===
+# Approximates SentencePiece-style tokenization without a network call:
+# words split into ~6-char pieces, digits in groups of 3, repeated symbols
+# merge in pairs and whitespace runs in fours.
+TOKEN_PIECE = re.compile(r"[A-Za-z]+|\d+|\n|[ \t]+|([^\sA-Za-z\d])\1*")
+
+
+def estimate_tokens(text):
+    total = 0
+    for m in TOKEN_PIECE.finditer(text):
+        piece = m.group(0)
+        if piece[0].isalpha():
+            total += math.ceil(len(piece) / 6)
+        elif piece[0].isdigit():
+            total += math.ceil(len(piece) / 3)
+        elif piece == "\n":
+            total += 1
+        elif piece[0] in " \t":
+            total += 0 if piece == " " else math.ceil(len(piece) / 4)
+        else:
+            total += math.ceil(len(piece) / 2)
+    return total
+
+
+# === Pre-flight estimate ===
+# USD per 1M tokens (input, output); list prices, update as needed.
+MODEL_PRICES_PER_M = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+OUTPUT_TOKENS_PER_KEY = 8
+
+
+def is_extractable(chunk):
+    return "Net Pay" in chunk
+
+
+def preflight(chunks, instructions, expected_keys, model_name="gemini-2.0-flash-lite", normalize=True):
+    instruction_tokens = estimate_tokens(instructions)
+    output_per_call = len(expected_keys) * OUTPUT_TOKENS_PER_KEY
+
+    per_chunk = []
+    for chunk in chunks:
+        raw_tokens = estimate_tokens(chunk)
+        sent = normalize_block(chunk) if normalize else chunk
+        per_chunk.append({
+            "raw_tokens": raw_tokens,
+            "tokens": estimate_tokens(sent),
+            "requests": 1 if is_extractable(chunk) else 0,
+        })
+
+    requests = sum(c["requests"] for c in per_chunk)
+    chunk_tokens = sum(c["tokens"] for c in per_chunk if c["requests"])
+    raw_chunk_tokens = sum(c["raw_tokens"] for c in per_chunk if c["requests"])
+    input_tokens = requests * instruction_tokens + chunk_tokens
+    output_tokens = requests * output_per_call
+
+    in_price, out_price = MODEL_PRICES_PER_M.get(model_name, (0.0, 0.0))
+    return {
+        "model": model_name,
+        "chunks": len(per_chunk),
+        "requests": requests,
+        "instruction_tokens": instruction_tokens,
+        "raw_chunk_tokens": raw_chunk_tokens,
+        "chunk_tokens": chunk_tokens,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "estimated_cost_usd": round(input_tokens / 1e6 * in_price + output_tokens / 1e6 * out_price, 4),
+        "per_chunk": per_chunk,
+    }
+
+
+def merge_preflight(reports):
+    merged = {"requests": 0, "chunks": 0, "raw_chunk_tokens": 0, "chunk_tokens": 0,
+              "input_tokens": 0, "output_tokens": 0, "estimated_cost_usd": 0.0}
+    for r in reports:
+        for key in merged:
+            merged[key] += r[key]
+    merged["estimated_cost_usd"] = round(merged["estimated_cost_usd"], 4)
+    return merged
+
+
+def format_preflight(report, label="Run"):
+    saved = report["raw_chunk_tokens"] - report["chunk_tokens"]
+    pct = (saved / report["raw_chunk_tokens"] * 100) if report["raw_chunk_tokens"] else 0.0
+    return (
+        f"🧮 {label}: {report['requests']} requests over {report['chunks']} chunks | "
+        f"~{report['input_tokens']:,} input + ~{report['output_tokens']:,} output tokens | "
+        f"chunk tokens {report['raw_chunk_tokens']:,} → {report['chunk_tokens']:,} (-{pct:.0f}%) | "
+        f"~${report['estimated_cost_usd']:.4f}"
+    )
+
+
+# === Load chunks from either layout ===
+def load_chunks(path):
+    # Accepts employee_data.json ([{"Emp#", "Block"}]) or employee_chunks_raw.json ([str])
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [item["Block"] if isinstance(item, dict) else item for item in data]
+
+
+def preflight_folders(base_folder, instructions, expected_keys, model_name="gemini-2.0-flash-lite",
+                      normalize=True, logger=print):
+    reports = {}
+    for folder in sorted(os.listdir(base_folder)):
+        path = os.path.join(base_folder, folder, "employee_data.json")
+        if not os.path.exists(path):
+            continue
+        reports[folder] = preflight(load_chunks(path), instructions, expected_keys, model_name, normalize)
+        logger(format_preflight(reports[folder], label=folder))
+    if reports:
+        logger(format_preflight(merge_preflight(reports.values()), label="Total"))
+    return reports
+
+
+if __name__ == "__main__":
+    from src.extraction_prompt import EXTRACTION_INSTRUCTIONS, EXPECTED_KEYS
+
+    target = sys.argv[1] if len(sys.argv) > 1 else "Extracted"
+    model_name = sys.argv[2] if len(sys.argv) > 2 else "gemini-2.0-flash-lite"
+
+    if os.path.isfile(target):
+        report = preflight(load_chunks(target), EXTRACTION_INSTRUCTIONS, EXPECTED_KEYS, model_name)
+        print(format_preflight(report, label=target))
+    else:
+        preflight_folders(target, EXTRACTION_INSTRUCTIONS, EXPECTED_KEYS, model_name)
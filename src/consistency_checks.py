@@ -0,0 +1,95 @@
+import re
+from decimal import Decimal
+
+from src.payroll_fields import NET_PAY_KEY, RTF_GROUPS, to_number, sum_fields
+
+CENT_TOLERANCE = Decimal("0.02")
+NET_PAY_IN_BLOCK = re.compile(r"Net Pay:\s*([\d,]*\.?\d+)")
+
+# Hard failures always escalate; soft ones only lower the confidence score
+HARD_CHECKS = {"has_net_pay", "net_pay_matches_block", "gross_minus_taxes_deductions"}
+
+
+# === Individual checks (return None when not applicable) ===
+# groups: src.payroll_fields.field_groups() of the schema the record was extracted with
+def check_has_net_pay(record, block, groups):
+    return to_number(record.get(NET_PAY_KEY)) is not None
+
+
+def check_net_pay_matches_block(record, block, groups):
+    match = NET_PAY_IN_BLOCK.search(block)
+    if not match:
+        return None
+    return to_number(match.group(1)) == to_number(record.get(NET_PAY_KEY))
+
+
+def check_gross_minus_taxes_deductions(record, block, groups):
+    net = to_number(record.get(NET_PAY_KEY))
+    if net is None:
+        return None
+    gross = sum_fields(record, groups["earning"])
+    withheld = sum_fields(record, groups["ee_tax"]) + sum_fields(record, groups["deduction"])
+    return abs(gross - withheld - net) <= CENT_TOLERANCE
+
+
+def check_hours_times_rate(record, block, groups):
+    results = []
+    for hrs_key, rate_key, amt_key in groups["triples"]:
+        hrs, rate, amt = (to_number(record.get(k)) for k in (hrs_key, rate_key, amt_key))
+        if None in (hrs, rate, amt):
+            continue
+        tolerance = max(Decimal("0.05"), abs(amt) * Decimal("0.005"))
+        results.append(abs(hrs * rate - amt) <= tolerance)
+    return all(results) if results else None
+
+
+def check_current_not_above_ytd(record, block, groups):
+    results = []
+    for key in groups["numeric"]:
+        if key.endswith("_YTD") or f"{key}_YTD" not in record:
+            continue
+        current, ytd = to_number(record.get(key)), to_number(record.get(f"{key}_YTD"))
+        if current is None or ytd is None or current < 0:
+            continue
+        results.append(current <= ytd + CENT_TOLERANCE)
+    return all(results) if results else None
+
+
+def check_values_present_in_block(record, block, groups):
+    # Every extracted number should literally appear in the source block
+    digits = block.replace(",", "")
+    results = []
+    for key in groups["numeric"]:
+        val = record.get(key)
+        if val is None or to_number(val) is None:
+            continue
+        results.append(str(val).replace(",", "").strip() in digits)
+    return all(results) if results else None
+
+
+CHECKS = {
+    "has_net_pay": check_has_net_pay,
+    "net_pay_matches_block": check_net_pay_matches_block,
+    "gross_minus_taxes_deductions": check_gross_minus_taxes_deductions,
+    "hours_times_rate": check_hours_times_rate,
+    "current_not_above_ytd": check_current_not_above_ytd,
+    "values_present_in_block": check_values_present_in_block,
+}
+
+
+# === Run all checks on one extracted record ===
+def run_checks(record, block, groups=RTF_GROUPS):
+    passed, failed = [], []
+    for name, check in CHECKS.items():
+        result = check(record, block, groups)
+        if result is None:
+            continue
+        (passed if result else failed).append(name)
+
+    applicable = len(passed) + len(failed)
+    return {
+        "passed": passed,
+        "failed": failed,
+        "hard_fail": any(name in HARD_CHECKS for name in failed),
+        "confidence": round(len(passed) / applicable, 3) if applicable else 0.0,
+    }
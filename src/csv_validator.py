@@ -0,0 +1,234 @@
+import csv
+import json
+import os
+import re
+import sys
+from decimal import Decimal
+
+from generate_populated_csv import (
+    BASE_DIR, COLUMN_TO_JSON_KEY, FIRST_EMPLOYEE_ROW, HEADER_ROWS,
+    extract_payroll_dates_from_folder, find_matching_template, merge_headers,
+)
+
+# === Pre-upload check of populated_output.csv against its client's template ===
+# Payroll Relief only accepts a file laid out exactly like the template it was
+# exported from. Everything the portal would reject (and everything it would
+# accept but pay wrongly) is checked here, locally, in milliseconds, so the
+# upload bot only ever logs in for files that will go through:
+#   layout     header rows identical to the template, every row the template's width
+#   pay info   Pay Period / Pay Date / Pay Schedule match the folder name
+#   employees  same employees, in the template's order; no unknown or repeated Emp#;
+#              every extracted employee has a row
+#   cells      hours/amount/tax cells are plain numbers ("1316.48", no "1,316.48")
+#   totals     column sums agree with tax_info.json and the register's net pay
+NUMBER_CELL = re.compile(r"-?\d+(\.\d+)?$")
+EMP_CELL = re.compile(r"(\d+)(?:\.0+)?$")  # populate writes Emp# as "137.0"; the portal reads it as 137
+NUMERIC_HEADER_SUFFIXES = ("Hours", "Amount", "Tax")
+PAY_INFO_ROWS = {"Pay Period:": "PayPeriod", "Pay Schedule:": "PaySchedule", "Pay Date:": "PayDate"}
+TOLERANCE_CENTS = 1
+MAX_LISTED = 5  # cells/employees named per problem
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def emp_of(cell):
+    # "137" / "137.0" -> "137"; anything else (blank, "Totals" row) -> None
+    match = EMP_CELL.match(cell.strip())
+    return match.group(1) if match else None
+
+
+def _listed(items):
+    items = list(items)
+    more = f" (+{len(items) - MAX_LISTED} more)" if len(items) > MAX_LISTED else ""
+    return ", ".join(str(i) for i in items[:MAX_LISTED]) + more
+
+
+# === Import layout derived from the template ===
+def template_layout(template_path):
+    rows = _read_csv(template_path)
+    headers = merge_headers(rows)
+    employees = [(emp_of(row[0]), row[1].strip() if len(row) > 1 else "")
+                 for row in rows[FIRST_EMPLOYEE_ROW:] if row and emp_of(row[0])]
+    return {
+        "template": template_path,
+        "rows": rows,
+        "width": len(rows[HEADER_ROWS[0]]),
+        "headers": headers,
+        "columns": {col: i for i, col in enumerate(headers)},
+        "numeric": [i for i, col in enumerate(headers) if col.endswith(NUMERIC_HEADER_SUFFIXES)],
+        "employees": employees,
+    }
+
+
+# === Checks ===
+def validate_csv(csv_path, layout, pay_info=None, records=None, tax_info=None, report_totals=None):
+    # Returns {"ok", "errors", "warnings", "employees"}; errors block the upload
+    errors, warnings = [], []
+    rows = _read_csv(csv_path)
+    if len(rows) <= HEADER_ROWS[1]:
+        return {"ok": False, "errors": [f"only {len(rows)} row(s); the template has {len(layout['rows'])}"],
+                "warnings": [], "employees": 0}
+
+    # layout
+    for r in HEADER_ROWS:
+        if rows[r] != layout["rows"][r]:
+            cols = [i for i in range(max(len(rows[r]), len(layout["rows"][r])))
+                    if (rows[r][i:i + 1] or [None]) != (layout["rows"][r][i:i + 1] or [None])]
+            errors.append(f"header row {r + 1} differs from the template at column(s) {_listed(c + 1 for c in cols)}")
+    if merge_headers(rows) != layout["headers"]:
+        errors.append("merged headers do not match the template's import layout")
+    ragged = [i + 1 for i, row in enumerate(rows) if len(row) != layout["width"]]
+    if ragged:
+        errors.append(f"row(s) {_listed(ragged)} are not {layout['width']} columns wide")
+
+    # pay info
+    for row in rows[:HEADER_ROWS[0]]:
+        label = row[0].strip() if row else ""
+        if pay_info and label in PAY_INFO_ROWS:
+            expected = pay_info[PAY_INFO_ROWS[label]]
+            actual = row[2].strip() if len(row) > 2 else ""
+            if actual != expected:
+                errors.append(f"{label} is '{actual}', the folder says '{expected}'")
+
+    # employees
+    data = [(i + 1, row) for i, row in enumerate(rows[FIRST_EMPLOYEE_ROW:], FIRST_EMPLOYEE_ROW) if row and emp_of(row[0])]
+    emps = [emp_of(row[0]) for _, row in data]
+    known = {emp for emp, _ in layout["employees"]}
+    unknown = [emp for emp in emps if emp not in known]
+    if unknown:
+        errors.append(f"Emp# not in the template: {_listed(unknown)}")
+    repeated = sorted({emp for emp in emps if emps.count(emp) > 1}, key=int)
+    if repeated:
+        errors.append(f"Emp# on more than one row: {_listed(repeated)}")
+    missing = [emp for emp, _ in layout["employees"] if emp not in emps]
+    if missing:
+        errors.append(f"template employees missing from the CSV: {_listed(missing)}")
+    if not (unknown or repeated or missing):
+        moved = [f"{emp} ({name!r})" for (_, row), (emp, name) in zip(data, layout["employees"])
+                 if emp_of(row[0]) != emp or row[1].strip() != name]
+        if moved:
+            errors.append(f"rows out of the template's order or renamed: {_listed(moved)}")
+    if records is not None:
+        absent = [r.emp_id for r in records if r.emp_id not in emps]
+        if absent:
+            errors.append(f"extracted employees with no row (would not be paid): {_listed(absent)}")
+
+    # cells
+    bad = [f"row {n} {layout['headers'][i]}={row[i]!r}" for n, row in data for i in layout["numeric"]
+           if i < len(row) and row[i].strip() and not NUMBER_CELL.match(row[i].strip())]
+    if bad:
+        errors.append(f"non-numeric cells: {_listed(bad)}")
+
+    # values with no column to go in (dropped silently by populate)
+    if records is not None:
+        mapped = {key for col, key in COLUMN_TO_JSON_KEY.items() if col in layout["columns"]}
+        dropped = sorted({key for r in records for key, value in r.numbers_by_key()
+                          if value and key not in mapped and key in _UPLOADED_KEYS})
+        if dropped:
+            warnings.append(f"values with no column in this template (not uploaded): {_listed(dropped)}")
+
+    # totals
+    def column_sum(col):
+        i = layout["columns"].get(col)
+        if i is None:
+            return None
+        return sum((Decimal(row[i]) for _, row in data if i < len(row) and NUMBER_CELL.match(row[i].strip())),
+                   Decimal(0))
+
+    def agree(label, actual, expected):
+        if actual is None or expected is None:
+            return
+        diff = actual - Decimal(str(expected))
+        if abs(diff) * 100 > TOLERANCE_CENTS:
+            errors.append(f"{label}: CSV has {actual:,.2f}, expected {Decimal(str(expected)):,.2f} ({diff:+,.2f})")
+
+    tax_info = tax_info or {}
+    if "NY Tax Withholding" in tax_info:
+        agree("NY Tax Withholding", column_sum("NY State Tax"), tax_info["NY Tax Withholding"].get("Amount"))
+    if "Federal Withholding & FICA Tax" in tax_info:
+        fwt, ss, mc = (column_sum(col) for col in ("Federal Tax", "Soc.Sec. Tax", "Medicare Tax"))
+        # employer SS/Medicare match the employee's share, so the liability is FWT + 2 × FICA
+        federal = None if None in (fwt, ss, mc) else fwt + 2 * (ss + mc)
+        agree("Federal Withholding & FICA Tax", federal, tax_info["Federal Withholding & FICA Tax"].get("Amount"))
+    if report_totals and report_totals.get("net_pay") is not None:
+        agree("Net pay", column_sum("Net Amount"), report_totals["net_pay"])
+
+    return {"ok": not errors, "errors": errors, "warnings": warnings, "employees": len(data)}
+
+
+def _uploaded_keys():
+    # Current-period hours, amounts, taxes and deductions (what a template column could hold)
+    from src.payroll_fields import NUMERIC_KEYS, YTD_KEYS, RATE_KEYS, ER_TAX_KEYS
+
+    return set(NUMERIC_KEYS) - set(YTD_KEYS) - set(RATE_KEYS) - set(ER_TAX_KEYS)
+
+
+_UPLOADED_KEYS = _uploaded_keys()
+
+
+# === Folders ===
+def validate_folder(folder_path):
+    from src.records import load_records
+
+    folder = os.path.basename(os.path.normpath(folder_path))
+    report = {"folder": folder, "ok": False, "errors": [], "warnings": [], "employees": 0}
+    csv_path = os.path.join(folder_path, "populated_output.csv")
+    if not os.path.exists(csv_path):
+        report["errors"].append("no populated_output.csv")
+        return report
+    try:
+        pay_info = extract_payroll_dates_from_folder(folder)
+    except ValueError as e:
+        report["errors"].append(str(e))
+        return report
+    template_path = find_matching_template(pay_info["ClientName"])
+    if not template_path:
+        report["errors"].append(f"no CSV template for client '{pay_info['ClientName']}'")
+        return report
+
+    parsed_path = os.path.join(folder_path, "parsed_employee_data.json")
+    report.update(validate_csv(
+        csv_path,
+        template_layout(template_path),
+        pay_info=pay_info,
+        records=load_records(parsed_path) if os.path.exists(parsed_path) else None,
+        tax_info=_load_json(os.path.join(folder_path, "tax_info.json")),
+        report_totals=_load_json(os.path.join(folder_path, "report_totals.json")),
+    ))
+    return report
+
+
+def validate_all(base_folder=BASE_DIR):
+    # Every Extracted/* folder with a populated CSV
+    return [
+        validate_folder(os.path.join(base_folder, folder))
+        for folder in sorted(os.listdir(base_folder))
+        if os.path.exists(os.path.join(base_folder, folder, "populated_output.csv"))
+    ]
+
+
+def format_validation(report):
+    head = "✅" if report["ok"] else "❌"
+    lines = [f"{head} {report['folder']}: {report['employees']} employee row(s), "
+             f"{len(report['errors'])} error(s), {len(report['warnings'])} warning(s)"]
+    lines += [f"   ⛔ {e}" for e in report["errors"]]
+    lines += [f"   ⚠️ {w}" for w in report["warnings"]]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else BASE_DIR
+    reports = validate_all(base_folder)
+    for report in reports:
+        print(format_validation(report))
+    print(f"📋 {sum(r['ok'] for r in reports)}/{len(reports)} CSV(s) ready to upload")
@@ -1,31 +1,53 @@
-from openpyxl import load_workbook
 import json
+from itertools import groupby
+from operator import itemgetter
 
-def extract_employee_chunks(file_path: str, output_path: str = "employee_chunks_raw.json"):
-    # === Load the workbook ===
-    wb = load_workbook(file_path, data_only=True)
-    sheet = wb.active
+from src.profiling import profiled_stage
+
+
+def row_text(row):
+    return "\t".join(str(cell).strip() if cell else "" for cell in row).strip()
+
+
+def iter_register_lines(file_path: str):
+    # (sheet title, row text) for every row of every sheet; read_only keeps
+    # openpyxl from loading whole sheets, so memory does not grow with the register.
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, data_only=True, read_only=True)
+    try:
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                yield ws.title, row_text(row)
+    finally:
+        wb.close()
 
-    # === Read all rows as raw strings ===
-    rows = []
-    for row in sheet.iter_rows(values_only=True):
-        raw_line = "\t".join(str(cell).strip() if cell else "" for cell in row).strip()
-        rows.append(raw_line)
 
+def group_employee_chunks(lines):
     # === Group rows into chunks per employee (starts with 'Emp#') ===
-    employee_chunks = []
     current_chunk = []
-
-    for line in rows:
-        if "Emp#" in line:
-            if current_chunk:
-                employee_chunks.append("\n".join(current_chunk))
-                current_chunk = []
+    for line in lines:
+        if "Emp#" in line and current_chunk:
+            yield "\n".join(current_chunk)
+            current_chunk = []
         current_chunk.append(line)
 
     # Add the final chunk
     if current_chunk:
-        employee_chunks.append("\n".join(current_chunk))
+        yield "\n".join(current_chunk)
+
+
+def iter_employee_chunks(file_path: str):
+    # Yields one employee chunk at a time, sheet after sheet (a new sheet starts
+    # a new chunk). Registers that combine several companies or pay groups are
+    # split into separate jobs by src/register_splitter.py instead.
+    for _, rows in groupby(iter_register_lines(file_path), key=itemgetter(0)):
+        yield from group_employee_chunks(line for _, line in rows)
+
+
+@profiled_stage("chunk-xlsx")
+def extract_employee_chunks(file_path: str, output_path: str = "employee_chunks_raw.json"):
+    employee_chunks = list(iter_employee_chunks(file_path))
 
     # === Save to JSON ===
     with open(output_path, "w", encoding="utf-8") as f:
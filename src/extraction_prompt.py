@@ -0,0 +1,134 @@
+import hashlib
+
+from src.json_repair import keys_from_skeleton
+
+# === Static extraction instructions ===
+# Identical for every employee and every folder; only the chunk suffix changes.
+EXTRACTION_INSTRUCTIONS = """
+You are a strict payroll data extractor.
+
+From the raw payroll block below, extract values as a flat JSON using exactly the following keys.  
+If a value is missing, set it to `null`. All keys must always be present.
+
+Include both **Current** and **YTD** values for all applicable fields.
+
+Also extract employee-level totals:
+- "Total Deductions", "Total Taxes", and "Net Pay"
+
+Earnings Field Format:
+- All earning types (e.g., Regular, Sick, Holiday, Personal, Vac, Comp, Jury, etc.) follow this format:
+ | Hours | Rate | Current Amount | YTD Amount |
+
+Fallback Parsing Rules:
+Each earnings line will follow exactly one of these 3 formats:
+
+1. **Full format with 4 values**:  
+   `Hours | Rate | Current Amount | YTD Amount`  
+   → Assign all four values in order.
+
+2. **Two values**:  
+   `Current Amount | YTD Amount` (preceded by two empty separators)  
+   → Assign to **Current Amount** and **YTD Amount**.  
+   Set `Hours` and `Rate` = null.
+
+3. **Single value at the end**:  
+   `|||YTD Amount|`  
+   → Assign to **YTD Amount**.  
+   Set all others = null.
+
+- Field separators may be pipes (`|`), tabs (`\t`), or multiple spaces — treat them all the same.
+- A run like `|~5|` (or the same with tabs) is shorthand for 6 consecutive separators (5 empty columns). Expand it before applying the rules above.
+
+Field Name Disambiguation:
+- "Vision Ins" and "Vision Insurance" are **distinct fields**.
+- "Dental Ins" and "Dental Insurance" are **also distinct**.
+- Similarly named fields must not be merged or inferred from each other.
+
+
+
+Here is the required structure:
+
+{
+  "Emp#": null,
+  "Name": null,
+
+  "RegHrs": null, "RegRate":null, "RegAmt": null, "RegAmt_YTD": null,
+  "VacHrs": null, "VacRate":null, "VacAmt": null, "VacAmt_YTD": null,
+  "HolHrs": null, "HolRate":null, "HolAmt": null, "HolAmt_YTD": null,
+  "ReimbAmt": null, "ReimbAmt_YTD": null,
+  "SickHrs": null, "SickRate":null, "SickAmt": null, "SickAmt_YTD": null,
+  "OTHrs": null,   "OTRate":null,   "OTAmt": null,   "OTAmt_YTD": null,
+  "PersonalHrs": null, "PersonalRate":null, "PersonalAmt": null, "PersonalAmt_YTD": null,
+
+  "Deputy Hrs": null, "Deputy Rate":null, "Deputy Amt": null, "Deputy Amt_YTD": null,
+  "Recor Hrs": null, "Recor Rate":null, "Recor Amt": null, "Recor Amt_YTD": null,
+  "Comp Hrs": null, "Comp Rate":null, "Comp Amt": null, "Comp Amt_YTD": null,
+  "Clerk Hrs": null, "Clerk Rate":null, "Clerk Amt": null, "Clerk Amt_YTD": null,
+  "Jury Hrs": null, "Jury Rate":null, "Jury Amt": null, "Jury Amt_YTD": null,
+  "BRV Hrs": null, "BRV Rate":null, "BRV Amt": null, "BRV Amt_YTD": null,
+  "OtherHrs": null, "OtherRate":null, "OtherAmt": null, "OtherAmt_YTD": null,
+  "Emergency Mgmt Hrs": null, "Emergency Mgmt Rate":null, "Emergency Mgmt Amt": null, "Emergency Mgmt Amt_YTD": null,
+  "Retro Pay": null, "Retro Pay_YTD": null,
+  "Deputy Supt Amt": null, "Deputy Supt Amt_YTD": null,
+  "Supv Secretary Amt": null, "Supv Secretary Amt_YTD": null,
+  "Assessor Hrs": null, "Assessor Rate":null, "Assessor Amt": null, "Assessor Amt_YTD": null,
+  "Codes Hrs": null, "Code Rate":null, "Codes Amt": null, "Codes Amt_YTD": null,
+  "Zoning Hrs": null, "Zoning Rate":null, "Zoning Amt": null, "Zoning Amt_YTD": null,
+  "Planning Hrs": null, "Planning Rate":null, "Planning Amt": null, "Planning Amt_YTD": null,
+  "Collector Hrs": null, "Collector Rate":null, "Collector Amt": null, "Collector Amt_YTD": null,
+
+  "FWT": null, "FWT_YTD": null,
+  "SS W/H": null, "SS W/H_YTD": null,
+  "MC W/H": null, "MC W/H_YTD": null,
+  "NY State Tax": null, "NY State Tax_YTD": null,
+  "NY SDI": null, "NY SDI_YTD": null,
+  "NY PFML": null, "NY PFML_YTD": null,
+
+  "ER SS": null, "ER SS_YTD": null,
+  "ER MC": null, "ER MC_YTD": null,
+  "FUTA": null, "FUTA_YTD": null,
+  "NY SUTA": null, "NY SUTA_YTD": null,
+   
+  "403(b) for EE": null, "403(b) for EE_YTD": null,
+  "414(h)": null, "414(h)_YTD": null,
+  "457(b)": null, "457(b)_YTD": null,
+  "457(b) (50+)": null, "457(b) (50+)_YTD": null,
+  "Aflac": null, "Aflac_YTD": null,
+  "Child/Spousal Support": null, "Child/Spousal Support_YTD": null,
+  "Colonial AC": null, "Colonial AC_YTD": null,
+  "Colonial DB": null, "Colonial DB_YTD": null,
+  "Medical Ins": null, "Medical Ins_YTD": null,
+  "Medical Insurance": null, "Medical Insurance_YTD": null,
+  "Dental Ins": null, "Dental Ins_YTD": null,
+  "Vision Ins": null, "Vision Ins_YTD": null,
+  "Dental Insurance": null, "Dental Insurance_YTD": null,
+  "Vision Insurance": null, "Vision Insurance_YTD": null,
+  "Aflac Pre-Tax": null, "Aflac Pre-Tax_YTD": null,
+  "Union Dues": null, "Union Dues_YTD": null,
+  "Pre Tax SCP": null, "Pre Tax SCP_YTD": null,
+  "Roth 457(b)": null, "Roth 457(b)_YTD": null,
+  "Loan Repayment": null, "Loan Repayment_YTD": null,
+
+  "Net Pay": null
+}
+
+Rules:
+- Only return valid **JSON**
+- Use `null` if any value is not present
+- No markdown, no explanation, no extra keys
+""".strip()
+
+# Changes whenever the instruction text changes, so learned grammars never outlive their template
+PROMPT_VERSION = hashlib.sha1(EXTRACTION_INSTRUCTIONS.encode("utf-8")).hexdigest()[:10]
+
+EXPECTED_KEYS = keys_from_skeleton(EXTRACTION_INSTRUCTIONS)
+
+
+# === Per-chunk suffix ===
+def build_chunk_prompt(chunk):
+    return f"Raw input:\n{chunk}"
+
+
+# === Full inline prompt ===
+def build_prompt(chunk):
+    return f"{EXTRACTION_INSTRUCTIONS}\n\n{build_chunk_prompt(chunk)}".strip()
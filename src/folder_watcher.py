@@ -0,0 +1,125 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+
+# === Wake-ups: inotify on Linux, plain polling elsewhere ===
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class InotifyWakeup:
+    def __init__(self, paths):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for path in paths:
+            if libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # Drain the events; the scan decides what actually changed
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWakeup:
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+def make_wakeup(paths, logger=print):
+    try:
+        wakeup = InotifyWakeup(paths)
+        logger(f"👀 Watching {len(paths)} folder(s) with inotify")
+        return wakeup
+    except (OSError, AttributeError, TypeError) as e:
+        logger(f"👀 inotify unavailable ({e}); polling {len(paths)} folder(s)")
+        return PollingWakeup()
+
+
+# === Debounced directory scanner ===
+# A file is reported once its size and mtime have stayed the same for
+# settle_seconds, so registers still being copied or saved are not picked up
+# half-written. Temp/lock files written by editors and browsers are ignored.
+IGNORED_PREFIXES = ("~$", ".")
+IGNORED_SUFFIXES = (".tmp", ".part", ".crdownload", ".partial")
+
+
+class StableFileScanner:
+    def __init__(self, paths, extensions, settle_seconds=3.0):
+        self.paths = list(paths)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.settle_seconds = settle_seconds
+        self._seen = {}      # path -> (size, mtime, unchanged_since)
+        self._reported = {}  # path -> (size, mtime) last reported
+
+    def _wanted(self, name):
+        lower = name.lower()
+        return (
+            lower.endswith(self.extensions)
+            and not name.startswith(IGNORED_PREFIXES)
+            and not lower.endswith(IGNORED_SUFFIXES)
+        )
+
+    def scan(self, now=None):
+        now = time.time() if now is None else now
+        stable = []
+        present = set()
+        for folder in self.paths:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if not self._wanted(name) or not os.path.isfile(path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                present.add(path)
+                signature = (st.st_size, st.st_mtime)
+                previous = self._seen.get(path)
+                if previous is None or previous[:2] != signature:
+                    self._seen[path] = (*signature, now)
+                    continue
+                if now - previous[2] >= self.settle_seconds and self._reported.get(path) != signature:
+                    self._reported[path] = signature
+                    stable.append(path)
+
+        for path in list(self._seen):
+            if path not in present:
+                self._seen.pop(path)
+                self._reported.pop(path, None)
+        return stable
+
+    def skip_existing(self):
+        # Treat everything already in the folders as handled
+        for path in self.scan(now=0.0):
+            pass
+        for path, (size, mtime, _) in self._seen.items():
+            self._reported[path] = (size, mtime)
+
+    def is_stable(self, path):
+        return path in self._reported and self._seen.get(path, (None, None))[:2] == self._reported[path]
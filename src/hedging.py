@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# === Rolling latency percentile ===
+class LatencyTracker:
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def count(self):
+        return len(self.samples)
+
+    def percentile(self, p):
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        idx = min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+# === Hedged request policy ===
+class HedgePolicy:
+    # When a call runs past the tracked latency percentile, a duplicate is
+    # issued and whichever finishes first with a valid result wins. The
+    # loser is cancelled if still queued; an in-flight HTTP call cannot be
+    # interrupted, so its result is simply discarded.
+    #
+    # budget caps hedges as a fraction of all calls (0.1 -> at most ~10% extra requests).
+
+    def __init__(self, percentile=0.9, budget=0.1, min_samples=10, min_delay=1.0,
+                 max_workers=16, window=200, logger=print):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.tracker = LatencyTracker(window)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "budget_denied": 0}
+
+    def hedge_delay(self):
+        if self.tracker.count() < self.min_samples:
+            return None
+        return max(self.min_delay, self.tracker.percentile(self.percentile))
+
+    def _take_hedge_slot(self):
+        with self._lock:
+            allowed = self.stats["hedges"] + 1 <= self.budget * self.stats["calls"] + 1
+            if allowed:
+                self.stats["hedges"] += 1
+            else:
+                self.stats["budget_denied"] += 1
+            return allowed
+
+    def _timed(self, fn, args, kwargs):
+        start = time.monotonic()
+        result = fn(*args, **kwargs)
+        return result, time.monotonic() - start
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            self.stats["calls"] += 1
+
+        primary = self.executor.submit(self._timed, fn, args, kwargs)
+        delay = self.hedge_delay()
+        if delay is None:
+            result, elapsed = primary.result()
+            self.tracker.record(elapsed)
+            return result
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge_slot():
+            result, elapsed = primary.result()
+            self.tracker.record(elapsed)
+            return result
+
+        hedge = self.executor.submit(self._timed, fn, args, kwargs)
+        pending = {primary, hedge}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                for other in pending:
+                    other.cancel()
+                self.tracker.record(elapsed + (delay if future is hedge else 0.0))
+                if future is hedge:
+                    with self._lock:
+                        self.stats["hedge_wins"] += 1
+                return result
+        raise last_error
+
+    def report(self):
+        s = self.stats
+        p = self.tracker.percentile(self.percentile)
+        threshold = f"{p:.2f}s" if p is not None else "n/a"
+        return (
+            f"🪃 Hedging: {s['hedges']} hedges over {s['calls']} calls "
+            f"({s['hedge_wins']} won, {s['budget_denied']} denied by budget) | p{int(self.percentile * 100)}={threshold}"
+        )
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from src.scheduler import edf_order, parse_pay_date
+
+# === Persistent file queue ===
+# One JSON file per job under <root>/<state>/<job_id>.json. State changes are
+# os.replace() moves, which are atomic on one filesystem, so jobs survive a
+# restart and two workers can never claim the same file.
+# Jobs carrying a "pay_date" are claimed in src/scheduler.py order; the rest
+# keep first-come-first-served order behind them.
+STATES = ("pending", "running", "done", "failed")
+
+
+class JobQueue:
+    def __init__(self, root="Data/queue"):
+        self.root = root
+        self._lock = threading.Lock()
+        for state in STATES:
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+
+    def _path(self, state, job_id):
+        return os.path.join(self.root, state, f"{job_id}.json")
+
+    def _write(self, path, job):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp, path)
+
+    def state_of(self, job_id):
+        for state in STATES:
+            if os.path.exists(self._path(state, job_id)):
+                return state
+        return None
+
+    def enqueue(self, job_id, payload):
+        # Returns False when the job is already known in any state
+        with self._lock:
+            if self.state_of(job_id) is not None:
+                return False
+            job = dict(payload, id=job_id, created=datetime.now().isoformat(timespec="seconds"), attempts=0)
+            self._write(self._path("pending", job_id), job)
+            return True
+
+    def _jobs_in(self, state):
+        state_dir = os.path.join(self.root, state)
+        jobs = []
+        for name in os.listdir(state_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(state_dir, name), "r", encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return jobs
+
+    def _pending_in_order(self):
+        pending = sorted((j for j in self._jobs_in("pending") if "created" in j), key=lambda j: (j["created"], j["id"]))
+        running = {}
+        for job in self._jobs_in("running"):
+            running[job.get("client")] = running.get(job.get("client"), 0) + 1
+        ordered = edf_order(pending, lambda j: j.get("client"), lambda j: parse_pay_date(j.get("pay_date")), in_flight=running)
+        return [job["id"] for job in ordered]
+
+    def claim(self):
+        # Most urgent pending job, moved to running; None when the queue is empty
+        with self._lock:
+            for job_id in self._pending_in_order():
+                running = self._path("running", job_id)
+                try:
+                    os.replace(self._path("pending", job_id), running)
+                except FileNotFoundError:
+                    continue  # claimed by another process
+                with open(running, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                job["attempts"] += 1
+                job["started"] = datetime.now().isoformat(timespec="seconds")
+                self._write(running, job)
+                return job
+            return None
+
+    def _finish(self, job, state, **fields):
+        with self._lock:
+            job = dict(job, finished=datetime.now().isoformat(timespec="seconds"), **fields)
+            self._write(self._path(state, job["id"]), job)
+            os.remove(self._path("running", job["id"]))
+
+    def complete(self, job, result):
+        self._finish(job, "done", result=result)
+
+    def fail(self, job, error):
+        self._finish(job, "failed", error=error)
+
+    def retry(self, job_id):
+        # Put a failed job back in line
+        with self._lock:
+            os.replace(self._path("failed", job_id), self._path("pending", job_id))
+
+    def recover(self):
+        # Jobs left running by a crashed daemon go back to pending
+        with self._lock:
+            running_dir = os.path.join(self.root, "running")
+            recovered = [n for n in os.listdir(running_dir) if n.endswith(".json")]
+            for name in recovered:
+                os.replace(os.path.join(running_dir, name), os.path.join(self.root, "pending", name))
+            return len(recovered)
+
+    def counts(self):
+        return {
+            state: sum(n.endswith(".json") for n in os.listdir(os.path.join(self.root, state)))
+            for state in STATES
+        }
+
+    def wait_for_job(self, stop_event, poll_seconds=1.0):
+        while not stop_event.is_set():
+            job = self.claim()
+            if job is not None:
+                return job
+            stop_event.wait(poll_seconds)
+        return None
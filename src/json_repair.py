@@ -0,0 +1,185 @@
+import json
+import re
+
+
+# === Markdown Fence Cleanup ===
+def strip_code_fences(raw_output):
+    raw_output = raw_output.strip()
+    if raw_output.startswith("```json"):
+        raw_output = raw_output.removeprefix("```json").removesuffix("```").strip()
+    elif raw_output.startswith("```"):
+        raw_output = raw_output.removeprefix("```").removesuffix("```").strip()
+    return raw_output
+
+
+# === Locate the JSON object inside prose ===
+def locate_json_object(text):
+    # Returns the first {...} object in the text. If the object never closes
+    # (truncated output), everything from the opening brace is returned.
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _drop_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+# === Repair common LLM JSON faults ===
+def repair_json_text(text):
+    # Single pass over the text that:
+    # - quotes bare keys (e.g. Emergency Mgmt Hrs: null)
+    # - drops trailing commas before } or ]
+    # - closes truncated output after the last complete member
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    expect_key = False
+    last_complete = None  # (len(out), stack) at the last member boundary
+
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+            expect_key = False
+            out.append(ch)
+        elif ch in "{[":
+            stack.append(ch)
+            expect_key = ch == "{"
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            expect_key = False
+            out.append(ch)
+            if not stack:
+                break
+        elif ch == ",":
+            last_complete = (len(out), list(stack))
+            expect_key = bool(stack) and stack[-1] == "{"
+            out.append(ch)
+        elif expect_key and not ch.isspace() and ch != "'":
+            end = text.find(":", i)
+            if end == -1:
+                break
+            out.append(json.dumps(text[i:end].strip()))
+            expect_key = False
+            i = end
+            continue
+        elif ch == "'" and expect_key:
+            end = text.find("'", i + 1)
+            if end == -1:
+                break
+            out.append(json.dumps(text[i + 1:end]))
+            expect_key = False
+            i = end + 1
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if not stack and not in_string:
+        return "".join(out)
+
+    # === Truncated: keep only members that finished before the cut ===
+    if last_complete is None:
+        return "{}"
+    length, open_stack = last_complete
+    out = out[:length]
+    _drop_trailing_comma(out)
+    closers = {"{": "}", "[": "]"}
+    return "".join(out) + "".join(closers[c] for c in reversed(open_stack))
+
+
+# === Tolerant decode ===
+def loads_tolerant(raw_output):
+    text = strip_code_fences(raw_output)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    candidate = locate_json_object(text)
+    if candidate is None:
+        raise json.JSONDecodeError("No JSON object found in model output", text, 0)
+
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+
+    # Raises JSONDecodeError if the repaired text is still not valid
+    return json.loads(repair_json_text(candidate))
+
+
+# === Partial re-ask helpers ===
+SKELETON_KEY_PATTERN = re.compile(r'"([^"]+)"\s*:\s*null')
+
+
+def keys_from_skeleton(prompt_text):
+    return list(dict.fromkeys(SKELETON_KEY_PATTERN.findall(prompt_text)))
+
+
+def missing_keys(parsed, expected_keys):
+    return [k for k in expected_keys if k not in parsed]
+
+
+def build_reask_prompt(chunk, keys):
+    skeleton = ",\n".join(f"  {json.dumps(k)}: null" for k in keys)
+    return f"""
+You are a strict payroll data extractor.
+
+From the raw payroll block below, extract ONLY the following keys as a flat JSON object.
+If a value is missing, set it to `null`. All listed keys must be present.
+
+{{
+{skeleton}
+}}
+
+Rules:
+- Only return valid **JSON**
+- No markdown, no explanation, no extra keys
+
+Raw input:
+{chunk}
+""".strip()
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from src.block_normalizer import estimate_tokens
+
+# === Gemini credential pool: several keys/projects, each with its own quota ===
+# GEMINI_API_KEYS="KEY1,KEY2" or "proj-a:KEY1,proj-b:KEY2" (falls back to the single
+# GEMINI_API_KEY). Every call leases the key with the most headroom in its
+# per-minute request and token budget; a key that answers 429 cools down and
+# the others carry the load. Throughput then scales with the keys provisioned.
+KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "30"))  # requests per minute per key
+KEY_TPM = int(os.getenv("GEMINI_KEY_TPM", "1000000"))  # tokens per minute per key
+WINDOW_SECONDS = 60.0
+COOLDOWN_SECONDS = 30.0  # first 429; doubles on each further 429 in a row, up to MAX_COOLDOWN_SECONDS
+MAX_COOLDOWN_SECONDS = 300.0
+OUTPUT_TOKENS_GUESS = 600  # reserved per call until the response reports its real usage
+API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
+
+class PoolExhausted(RuntimeError):
+    pass
+
+
+def parse_keys(text):
+    # "proj-a:KEY1, AIza…wXyZ" -> [("proj-a", "KEY1"), ("…wXyZ", "AIza…wXyZ")]
+    keys = []
+    for entry in (text or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        label, _, key = entry.rpartition(":")
+        keys.append((label or f"…{key[-4:]}", key))
+    return keys
+
+
+def is_rate_limited(error):
+    # requests.HTTPError with a 429, or the SDK's ResourceExhausted
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(error)[:40]
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class _KeyState:
+    def __init__(self, label, key, rpm, tpm):
+        self.label = label
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = deque()  # (time, tokens) of calls in the last WINDOW_SECONDS
+        self.in_flight = 0
+        self.cool_until = 0.0
+        self.strikes = 0  # 429s in a row
+        self.stats = {"requests": 0, "tokens": 0, "rate_limited": 0, "errors": 0}
+
+    def trim(self, now):
+        while self.window and now - self.window[0][0] >= WINDOW_SECONDS:
+            self.window.popleft()
+
+    def headroom(self, now, tokens):
+        # Fraction of the tighter budget left after this call; < 0 means over budget
+        self.trim(now)
+        requests_used = len(self.window) + self.in_flight
+        tokens_used = sum(t for _, t in self.window)
+        return min((self.rpm - requests_used - 1) / self.rpm, (self.tpm - tokens_used - tokens) / self.tpm)
+
+    def free_at(self, now):
+        # When the oldest call leaves the window (or the cooldown ends)
+        self.trim(now)
+        oldest = self.window[0][0] + WINDOW_SECONDS if self.window else now
+        return max(self.cool_until, oldest if len(self.window) + self.in_flight >= self.rpm else now)
+
+
+class KeyPool:
+    def __init__(self, keys, rpm=KEY_RPM, tpm=KEY_TPM, max_wait_seconds=120.0):
+        if not keys:
+            raise ValueError("❌ Missing GEMINI_API_KEY / GEMINI_API_KEYS in .env")
+        self.keys = [_KeyState(label, key, rpm, tpm) for label, key in keys]
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait_seconds = max_wait_seconds
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _pick(self, tokens):
+        now = time.monotonic()
+        ready = [k for k in self.keys if k.cool_until <= now]
+        scored = [(k.headroom(now, tokens), -k.in_flight, k) for k in ready]
+        scored = [s for s in scored if s[0] >= 0]
+        if scored:
+            return max(scored, key=lambda s: s[:2])[2], None
+        return None, min(k.free_at(now) for k in self.keys) - now
+
+    def acquire(self, tokens):
+        # Blocks until some key has room for one more call of ~tokens
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._cond:
+            while True:
+                state, wait = self._pick(tokens)
+                if state is not None:
+                    state.in_flight += 1
+                    return state
+                if time.monotonic() + max(wait, 0) > deadline:
+                    raise PoolExhausted(f"❌ All {len(self.keys)} Gemini key(s) are out of quota or cooling down")
+                self._cond.wait(timeout=max(wait, 0.05))
+
+    def release(self, state, tokens, error=None):
+        now = time.monotonic()
+        with self._cond:
+            state.in_flight -= 1
+            state.window.append((now, tokens))
+            state.stats["requests"] += 1
+            state.stats["tokens"] += tokens
+            if error is not None and is_rate_limited(error):
+                state.stats["rate_limited"] += 1
+                state.strikes += 1
+                cooldown = retry_after(error) or min(COOLDOWN_SECONDS * 2 ** (state.strikes - 1), MAX_COOLDOWN_SECONDS)
+                state.cool_until = now + cooldown
+            elif error is not None:
+                state.stats["errors"] += 1
+            else:
+                state.strikes = 0
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, prompt_tokens):
+        # with pool.lease(n) as lease: use lease.key; set lease.tokens from the response usage
+        state = self.acquire(prompt_tokens + OUTPUT_TOKENS_GUESS)
+        lease = _Lease(state, prompt_tokens + OUTPUT_TOKENS_GUESS)
+        error = None
+        try:
+            yield lease
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # also on GeneratorExit, when a streamed response is closed early
+            self.release(state, lease.tokens, error)
+
+    def run(self, fn, prompt_tokens):
+        # fn(lease) -> result; a 429 moves the call to another key (each key tried once)
+        last = None
+        for _ in range(len(self.keys)):
+            try:
+                with self.lease(prompt_tokens) as lease:
+                    return fn(lease)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                last = e
+        raise last
+
+    def report(self):
+        now = time.monotonic()
+        parts = []
+        for k in self.keys:
+            cooling = f", cooling {k.cool_until - now:.0f}s" if k.cool_until > now else ""
+            parts.append(
+                f"{k.label}: {k.stats['requests']} req, {k.stats['tokens']:,} tok, "
+                f"{k.stats['rate_limited']}×429{cooling}"
+            )
+        return f"🔑 Key pool ({len(self.keys)} key(s), {self.rpm} rpm / {self.tpm:,} tpm each): " + " | ".join(parts)
+
+
+class _Lease:
+    def __init__(self, state, tokens):
+        self.label = state.label
+        self.key = state.key
+        self.tokens = tokens
+
+
+# === Shared pool + REST call for entry points ===
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            keys = parse_keys(os.getenv("GEMINI_API_KEYS")) or parse_keys(os.getenv("GEMINI_API_KEY"))
+            _pool = KeyPool(keys)
+        return _pool
+
+
+def multi_key_configured():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return len(parse_keys(os.getenv("GEMINI_API_KEYS"))) > 1
+
+
+def usage_tokens(response_data, fallback):
+    usage = response_data.get("usageMetadata") or {}
+    return usage.get("totalTokenCount") or fallback
+
+
+def generate_text(prompt, model_name, pool=None, session=None):
+    # One generateContent call on the key with the most headroom; returns the response
+    # text as a Completion (finish reason and output tokens attached)
+    from src.truncation import completion_from_rest
+
+    if session is None:
+        from src.send_chunk_llm import http_session as session
+    pool = pool or get_key_pool()
+
+    def call(lease):
+        res = session.post(
+            API_URL.format(model=model_name),
+            headers={"Content-Type": "application/json", "x-goog-api-key": lease.key},
+            json={"contents": [{"parts": [{"text": prompt}]}]},
+        )
+        res.raise_for_status()
+        data = res.json()
+        lease.tokens = usage_tokens(data, lease.tokens)
+        return completion_from_rest(data)
+
+    return pool.run(call, estimate_tokens(prompt))
@@ -0,0 +1,299 @@
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from src.extraction_prompt import EXPECTED_KEYS, PROMPT_VERSION
+from src.payroll_fields import NUMERIC_KEYS, to_number
+from src.consistency_checks import run_checks
+from src.json_repair import loads_tolerant, build_reask_prompt
+
+TEMPLATE_DIR = "Data/CSV_Templates"
+MIN_SUPPORT = 2
+MIN_PRECISION = 0.8
+
+NUMBER_TOKEN = re.compile(r"^-?[\d,]*\.?\d+$")
+INLINE_VALUE = re.compile(r"^(?P<label>.*[A-Za-z)].*?):\s*(?P<value>-?[\d,]*\.?\d+)$")
+
+
+# === Tokenize a register line into labels, numbers and empty slots ===
+def tokenize_line(line):
+    tokens = []
+    for field in re.split(r"[|\t]", line):
+        field = field.strip()
+        if not field:
+            tokens.append(("empty", ""))
+            continue
+        inline = INLINE_VALUE.match(field)
+        if inline:
+            # "Net Pay: 554.07"
+            tokens.append(("label", inline.group("label").strip()))
+            tokens.append(("num", inline.group("value")))
+            continue
+        parts = field.split()
+        if all(NUMBER_TOKEN.match(p) for p in parts):
+            # "10.00 74.9192" -> hours and rate printed in one cell
+            tokens.extend(("num", p) for p in parts)
+            continue
+        tokens.append(("label", field.rstrip(":").strip()))
+    return tokens
+
+
+# === Split a line into (label, shape, values) segments ===
+# shape marks filled (N) and empty (_) slots after the label, e.g. "Sick|||263.52" -> ("Sick", "__N")
+def segment_line(line):
+    segments = []
+    label, slots = "^", []
+
+    def close():
+        shape = "".join("N" if kind == "num" else "_" for kind, _ in slots).rstrip("_")
+        values = [value for kind, value in slots if kind == "num"]
+        if values:
+            segments.append((label, shape, values))
+
+    for kind, value in tokenize_line(line):
+        if kind == "label":
+            close()
+            label, slots = value, []
+        else:
+            slots.append((kind, value))
+    close()
+    return segments
+
+
+def first_line(block):
+    for line in block.splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
+
+
+def _stem(key):
+    stem = key.removesuffix("_YTD")
+    for suffix in ("Hrs", "Rate", "Amt"):
+        stem = stem.removesuffix(suffix)
+    return stem.strip().lower()
+
+
+def _similarity(label, key):
+    return SequenceMatcher(None, label.lower(), _stem(key)).ratio()
+
+
+# === Learn a grammar from past Blocks and their extracted records ===
+def learn_grammar(pairs, client, min_support=MIN_SUPPORT, min_precision=MIN_PRECISION):
+    votes = defaultdict(lambda: defaultdict(int))
+    seen = defaultdict(int)
+    name_hits = name_total = 0
+    trained = 0
+
+    for block, record in pairs:
+        # Only learn from records that are arithmetically consistent
+        if run_checks(record, block)["hard_fail"]:
+            continue
+        trained += 1
+        name_total += 1
+        name_hits += record.get("Name") == first_line(block)
+
+        slot_values = []
+        for line in block.splitlines():
+            for label, shape, values in segment_line(line):
+                for pos, raw in enumerate(values):
+                    slot_values.append(((label, shape, pos), to_number(raw)))
+
+        # Each extracted value is credited to one free slot whose label best
+        # matches its key, so totals lines and look-alike columns ("ER SS" =
+        # "SS W/H") do not claim keys that belong elsewhere. Keys go in skeleton
+        # order (current before YTD), so equal current/YTD values land in order.
+        assigned = {}
+        for key in NUMERIC_KEYS:
+            number = to_number(record.get(key))
+            if number is None:
+                continue
+            candidates = [i for i, (slot, value) in enumerate(slot_values) if value == number and i not in assigned]
+            if candidates:
+                best = max(candidates, key=lambda i: _similarity(slot_values[i][0][0], key))
+                assigned[best] = key
+
+        for i, (slot, _) in enumerate(slot_values):
+            seen[slot] += 1
+            votes[slot][assigned.get(i)] += 1
+
+    # Best key per slot, then one key per segment (the slot with most support keeps it)
+    choices = defaultdict(list)
+    for (label, shape, pos), counts in votes.items():
+        total = seen[(label, shape, pos)]
+        key, count = max(
+            counts.items(),
+            key=lambda kv: (kv[1], _similarity(label, kv[0]) if kv[0] else -1.0),
+        )
+        if total < min_support or count / total < min_precision:
+            continue
+        choices[(label, shape)].append((count, pos, key))
+
+    rules = defaultdict(dict)
+    for (label, shape), picks in sorted(choices.items()):
+        slots = [None] * shape.count("N")
+        taken = set()
+        for count, pos, key in sorted(picks, reverse=True):
+            if key is not None and key in taken:
+                continue
+            slots[pos] = key
+            taken.add(key)
+        rules[label][shape] = slots
+
+    return {
+        "client": client,
+        "prompt_version": PROMPT_VERSION,
+        "trained_on_records": trained,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "name_from_first_line": name_total > 0 and name_hits / name_total >= min_precision,
+        "rules": {label: dict(shapes) for label, shapes in rules.items()},
+    }
+
+
+# === Deterministic extraction with a learned grammar ===
+def apply_grammar(grammar, block):
+    # Returns (record, unseen_lines). Keys the grammar could not fill stay None.
+    record = {k: None for k in EXPECTED_KEYS}
+    if grammar.get("name_from_first_line"):
+        record["Name"] = first_line(block)
+
+    unseen = []
+    rules = grammar["rules"]
+    for line in block.splitlines():
+        line_known = True
+        for label, shape, values in segment_line(line):
+            slots = rules.get(label, {}).get(shape)
+            if slots is None:
+                line_known = False
+                continue
+            for key, raw in zip(slots, values):
+                if key is not None:
+                    record[key] = raw
+        if not line_known:
+            unseen.append(line)
+    return record, unseen
+
+
+def extract_with_grammar(grammar, block, ask_fn=None):
+    # Deterministic first; only lines the grammar has never seen go to the LLM
+    # via ask_fn(prompt) -> text. Returns (record or None, source); None means
+    # the caller should fall back to a full extraction.
+    record, unseen = apply_grammar(grammar, block)
+    source = "grammar"
+    if unseen:
+        if ask_fn is None:
+            return None, "unseen"
+        remaining = [k for k in EXPECTED_KEYS if record.get(k) is None and k != "Emp#"]
+        try:
+            patch = loads_tolerant(ask_fn(build_reask_prompt("\n".join(unseen), remaining)))
+        except Exception:
+            # Unparseable answer, transport error or aborted stream: the full extraction takes over
+            return None, "grammar+llm"
+        if not isinstance(patch, dict):
+            return None, "grammar+llm"
+        for key in remaining:
+            if patch.get(key) is not None:
+                record[key] = patch[key]
+        source = "grammar+llm"
+
+    if run_checks(record, block)["hard_fail"]:
+        return None, source
+    return record, source
+
+
+# === Grammar storage next to the client template ===
+def grammar_path(client, template_dir=TEMPLATE_DIR):
+    return os.path.join(template_dir, f"{client}.layout.json")
+
+
+def load_grammar(client, template_dir=TEMPLATE_DIR):
+    path = grammar_path(client, template_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        grammar = json.load(f)
+    # A grammar learned against another skeleton may map to stale keys
+    if grammar.get("prompt_version") != PROMPT_VERSION:
+        return None
+    return grammar
+
+
+def save_grammar(grammar, template_dir=TEMPLATE_DIR):
+    path = grammar_path(grammar["client"], template_dir)
+    version = 1
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("rules") == grammar["rules"] and previous.get("prompt_version") == grammar["prompt_version"]:
+            return path, previous["version"]
+        version = previous.get("version", 0) + 1
+        archive = os.path.join(template_dir, f"{grammar['client']}.layout.v{previous.get('version', 0)}.json")
+        os.replace(path, archive)
+
+    grammar = dict(grammar, version=version)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(grammar, f, indent=2)
+    return path, version
+
+
+# === Training data from Extracted/<Client-dates>/ ===
+def load_history(base_folder="Extracted"):
+    from generate_populated_csv import extract_payroll_dates_from_folder
+
+    history = defaultdict(list)
+    for folder in sorted(os.listdir(base_folder)):
+        blocks_path = os.path.join(base_folder, folder, "employee_data.json")
+        parsed_path = os.path.join(base_folder, folder, "parsed_employee_data.json")
+        if not (os.path.exists(blocks_path) and os.path.exists(parsed_path)):
+            continue
+        try:
+            client = extract_payroll_dates_from_folder(folder)["ClientName"]
+        except ValueError:
+            continue
+        with open(blocks_path, "r", encoding="utf-8") as f:
+            blocks = {emp["Emp#"]: emp["Block"] for emp in json.load(f)}
+        with open(parsed_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        for record in records:
+            if record.get("Emp#") in blocks:
+                history[client].append((folder, blocks[record["Emp#"]], record))
+    return history
+
+
+def evaluate(grammar, rows):
+    # Field-level agreement with past extractions and share of employees needing no LLM call
+    fields = agree = covered = 0
+    for _, block, record in rows:
+        extracted, unseen = apply_grammar(grammar, block)
+        covered += not unseen
+        for key in NUMERIC_KEYS:
+            expected = to_number(record.get(key))
+            if expected is None:
+                continue
+            fields += 1
+            agree += to_number(extracted.get(key)) == expected
+    return {
+        "employees": len(rows),
+        "fully_covered": covered,
+        "field_agreement": round(agree / fields, 4) if fields else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else "Extracted"
+    for client, rows in load_history(base_folder).items():
+        grammar = learn_grammar([(block, record) for _, block, record in rows], client)
+        path, version = save_grammar(grammar)
+        stats = evaluate(grammar, rows)
+        print(
+            f"🧩 {client}: v{version} with {sum(len(s) for s in grammar['rules'].values())} line shapes "
+            f"from {grammar['trained_on_records']} records → {path}"
+        )
+        print(
+            f"   {stats['fully_covered']}/{stats['employees']} employees need no LLM call, "
+            f"field agreement {stats['field_agreement']:.2%}"
+        )
@@ -0,0 +1,80 @@
+import threading
+
+from src.consistency_checks import run_checks
+from src.payroll_fields import RTF_GROUPS, field_groups
+
+
+# === Two-tier model router ===
+class ModelRouter:
+    # Sends each chunk to the cheapest model first and escalates to the next
+    # tier only when the result fails a hard arithmetic check, scores below
+    # min_confidence, or the call itself fails.
+    #
+    # send_fn(prompt, chunk, model_name) -> parsed dict
+    # expected_keys: the prompt's schema, when it is not the RTF one (xlsx registers)
+
+    def __init__(self, send_fn, tiers=("gemini-2.0-flash-lite", "gemini-2.0-flash"), min_confidence=0.8, logger=print,
+                 expected_keys=None):
+        self.send_fn = send_fn
+        self.groups = field_groups(expected_keys) if expected_keys is not None else RTF_GROUPS
+        self.tiers = list(tiers)
+        self.min_confidence = min_confidence
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self.decisions = []
+
+    def _acceptable(self, checks):
+        return not checks["hard_fail"] and checks["confidence"] >= self.min_confidence
+
+    def extract(self, emp_id, prompt, prompt_chunk, block):
+        attempts = []
+        best = None
+        last_error = None
+
+        for model_name in self.tiers:
+            try:
+                parsed = self.send_fn(prompt, prompt_chunk, model_name)
+            except Exception as e:
+                last_error = e
+                attempts.append({"model": model_name, "error": str(e)})
+                continue
+
+            checks = run_checks(parsed, block, self.groups)
+            attempts.append({"model": model_name, "failed": checks["failed"], "confidence": checks["confidence"]})
+            # Keep the best result seen so far; later (stronger) tiers win ties
+            if best is None or (not checks["hard_fail"], checks["confidence"]) >= (not best[1]["hard_fail"], best[1]["confidence"]):
+                best = (parsed, checks, model_name)
+            if self._acceptable(checks):
+                break
+
+        decision = {
+            "Emp#": emp_id,
+            "model": best[2] if best else None,
+            "escalated": len(attempts) > 1,
+            "accepted": bool(best) and self._acceptable(best[1]),
+            "attempts": attempts,
+        }
+        with self._lock:
+            self.decisions.append(decision)
+
+        if best is None:
+            raise last_error
+        return best[0], decision
+
+    def reset(self):
+        with self._lock:
+            decisions, self.decisions = self.decisions, []
+        return decisions
+
+    @staticmethod
+    def summarize(decisions):
+        total = len(decisions)
+        escalated = sum(d["escalated"] for d in decisions)
+        by_model = {}
+        for d in decisions:
+            by_model[d["model"]] = by_model.get(d["model"], 0) + 1
+        rate = (escalated / total * 100) if total else 0.0
+        models = ", ".join(f"{m}={n}" for m, n in by_model.items())
+        unresolved = sum(not d["accepted"] for d in decisions)
+        return f"🧭 Router: {escalated}/{total} escalated ({rate:.0f}%) | final model: {models} | {unresolved} still failing checks"
@@ -0,0 +1,104 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from src.extraction_prompt import EXPECTED_KEYS
+
+
+# === Field groups (derived from the extraction skeleton) ===
+IDENTITY_KEYS = ["Emp#", "Name"]
+EE_TAX_KEYS = ["FWT", "SS W/H", "MC W/H", "NY State Tax", "NY SDI", "NY PFML"]
+ER_TAX_KEYS = ["ER SS", "ER MC", "FUTA", "NY SUTA"]
+NET_PAY_KEY = "Net Pay"
+
+CURRENT_KEYS = [k for k in EXPECTED_KEYS if not k.endswith("_YTD")]
+YTD_KEYS = [k for k in EXPECTED_KEYS if k.endswith("_YTD")]
+HOURS_KEYS = [k for k in CURRENT_KEYS if k.endswith("Hrs")]
+RATE_KEYS = [k for k in CURRENT_KEYS if k.endswith("Rate")]
+EARNING_KEYS = [k for k in CURRENT_KEYS if k.endswith("Amt") or k == "Retro Pay"]
+DEDUCTION_KEYS = [
+    k for k in CURRENT_KEYS
+    if k not in IDENTITY_KEYS + EE_TAX_KEYS + ER_TAX_KEYS + HOURS_KEYS + RATE_KEYS + EARNING_KEYS + [NET_PAY_KEY]
+]
+NUMERIC_KEYS = [k for k in EXPECTED_KEYS if k not in IDENTITY_KEYS]
+
+
+def _earning_triples(hours_keys=HOURS_KEYS, rate_keys=RATE_KEYS, earning_keys=EARNING_KEYS):
+    # (hours, rate, amount) per earning type, e.g. ("RegHrs", "RegRate", "RegAmt")
+    triples = []
+    for hrs in hours_keys:
+        base = hrs[:-3]
+        amt = base + "Amt"
+        # "Codes Hrs" pairs with "Code Rate" in the skeleton
+        candidates = [base + "Rate", base.strip() + " Rate", base.strip()[:-1] + " Rate"]
+        rate = next((r for r in candidates if r in rate_keys), None)
+        if amt in earning_keys and rate:
+            triples.append((hrs, rate, amt))
+    return triples
+
+
+EARNING_TRIPLES = _earning_triples()
+
+
+# === The same groups for another extraction schema ===
+# The groups above follow the RTF skeleton. The xlsx prompt (src/send_chunk_llm.py)
+# has its own keys: "Deputy Clerk Hrs", SOCSEC/MEDI for SS/MC withholding, a
+# Department and register totals ("Total Gross", "Total Taxes Current", ...) that
+# must not be summed as if they were deductions.
+TEXT_KEYS = ["Department"]
+EE_TAX_ALIASES = ["SOCSEC", "MEDI"]
+TOTAL_PREFIX = "Total "
+
+
+def field_groups(expected_keys=EXPECTED_KEYS):
+    current = [k for k in expected_keys if not k.endswith("_YTD")]
+    totals = [k for k in current if k.startswith(TOTAL_PREFIX)]
+    text = IDENTITY_KEYS + TEXT_KEYS
+    ee_tax = [k for k in current if k in EE_TAX_KEYS + EE_TAX_ALIASES]
+    hours = [k for k in current if k.endswith("Hrs") and k not in totals]
+    rates = [k for k in current if k.endswith("Rate")]
+    earnings = [k for k in current if (k.endswith("Amt") or k == "Retro Pay") and k not in totals]
+    deductions = [
+        k for k in current
+        if k not in text + ee_tax + ER_TAX_KEYS + hours + rates + earnings + totals + [NET_PAY_KEY]
+    ]
+    return {
+        "earning": earnings,
+        "ee_tax": ee_tax,
+        "deduction": deductions,
+        "numeric": [k for k in expected_keys if k not in text],
+        "triples": _earning_triples(hours, rates, earnings),
+    }
+
+
+RTF_GROUPS = field_groups(EXPECTED_KEYS)
+
+
+# === Value parsing ===
+NUMBER_PATTERN = re.compile(r"^\(?-?[\d,]*\.?\d+\)?-?$")
+
+
+def to_number(val):
+    # "1,316.48" -> Decimal("1316.48"); "(12.00)" / "12.00-" -> negative; None/"" -> None
+    if val is None:
+        return None
+    if isinstance(val, (int, float, Decimal)):
+        return Decimal(str(val))
+    text = str(val).strip().replace("$", "")
+    if not text or not NUMBER_PATTERN.match(text):
+        return None
+    negative = text.startswith("(") or text.startswith("-") or text.endswith("-")
+    text = text.strip("()-").replace(",", "")
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return None
+    return -number if negative else number
+
+
+def sum_fields(record, keys):
+    total = Decimal("0")
+    for key in keys:
+        number = to_number(record.get(key))
+        if number is not None:
+            total += number
+    return total
@@ -0,0 +1,181 @@
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# === Opt-in profiling of pipeline stages ===
+# `cli.py --profile-stages <command>` (or PAYROLL_PROFILE=all|cpu|memory for the daemon,
+# the job server and plain scripts) profiles every stage the pipeline runs:
+#   NN-<stage>.prof       cProfile of the stage (pstats, snakeviz)
+#   NN-<stage>.collapsed  sampled stacks of every thread, one "a;b;c count" line per
+#                         stack (flamegraph.pl, speedscope, inferno); worker threads
+#                         and network waits (socket reads) show up here
+#   NN-<stage>.alloc.txt  tracemalloc: peak and the allocation sites that grew most
+#   summary.txt           one line per stage, also printed as each stage ends
+# tracemalloc hooks every allocation and slows allocation-heavy code several
+# times over: "cpu" leaves it out for honest timings, "memory" records only
+# allocations, "all" does both. Off by default; a stage then costs one lookup.
+PROFILE_ENV = "PAYROLL_PROFILE"
+PROFILE_DIR_ENV = "PAYROLL_PROFILE_DIR"
+PROFILE_DIR = os.path.join("Data", "logs", "profiles")
+MODES = ("all", "cpu", "memory")
+SAMPLE_INTERVAL_SECONDS = 0.005
+TOP_ALLOCATIONS = 15
+
+_lock = threading.Lock()
+_session = {"dir": None, "mode": None, "checked": False, "count": 0, "active": [], "sampler": None}
+
+
+def enable(mode="all", output_dir=None):
+    # Profile every stage from here on; files go to output_dir (default: a new timestamped folder)
+    if mode not in MODES:
+        raise ValueError(f"❌ Unknown profile mode '{mode}' (expected one of {', '.join(MODES)})")
+    with _lock:
+        _session["dir"] = output_dir or os.path.join(PROFILE_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        _session["mode"] = mode
+        _session["checked"] = True
+        os.makedirs(_session["dir"], exist_ok=True)
+    return _session["dir"]
+
+
+def enabled():
+    if not _session["checked"]:
+        value = os.getenv(PROFILE_ENV, "")
+        if value and value != "0":
+            enable("all" if value == "1" else value, os.getenv(PROFILE_DIR_ENV) or None)
+        _session["checked"] = True
+    return _session["dir"] is not None
+
+
+def profile_dir():
+    return _session["dir"] if enabled() else None
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# === Sampler: one thread, running while any stage is active ===
+def _sample_loop():
+    me = threading.get_ident()
+    while True:
+        with _lock:
+            active = list(_session["active"])
+            if not active:
+                _session["sampler"] = None
+                return
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            key = ";".join([names.get(ident, f"thread-{ident}")] + stack[::-1])
+            for run in active:
+                run["samples"][key] += 1
+        time.sleep(SAMPLE_INTERVAL_SECONDS)
+
+
+# === Stages ===
+@contextmanager
+def stage(name):
+    if not enabled():
+        yield
+        return
+    import cProfile
+    import tracemalloc
+
+    mode = _session["mode"]
+    memory = mode in ("all", "memory")
+    with _lock:
+        _session["count"] += 1
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "-", name).strip("-")
+        run = {"name": name, "prefix": os.path.join(_session["dir"], f"{_session['count']:02d}-{safe}"), "samples": Counter()}
+        alone = not _session["active"]
+        _session["active"].append(run)
+        if mode != "memory" and _session["sampler"] is None:
+            _session["sampler"] = threading.Thread(target=_sample_loop, name="profile-sampler", daemon=True)
+            _session["sampler"].start()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if memory and alone:
+            tracemalloc.reset_peak()  # with stages overlapping, the peak is the process's while this one ran
+    before = tracemalloc.take_snapshot() if memory else None
+    profiler = cProfile.Profile() if mode != "memory" else None
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None  # another stage's profiler is running: its profile covers this one
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        memory_use = tracemalloc.get_traced_memory() if memory else None
+        after = tracemalloc.take_snapshot() if memory else None
+        with _lock:
+            _session["active"].remove(run)
+            if memory and not _session["active"]:
+                tracemalloc.stop()
+        _write_stage(run, profiler, before, after, wall, cpu, memory_use)
+
+
+def profiled_stage(name):
+    # Decorator form of stage()
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+def _profiler_overhead(key, value):
+    # The sampler thread and this module's own bookkeeping (its sleeps, frame walks), not the pipeline
+    filename, callers = key[0], value[4]
+    return filename == __file__ or (filename == "~" and bool(callers) and all(c[0] == __file__ for c in callers))
+
+
+def _write_stage(run, profiler, before, after, wall, cpu, memory_use):
+    import pstats
+
+    prefix = run["prefix"]
+    parts = [f"{wall:.2f}s wall", f"{cpu:.2f}s CPU"]
+    if profiler is not None:
+        profiler.dump_stats(prefix + ".prof")
+        stats = pstats.Stats(profiler)
+        own = sorted(((v[2], k) for k, v in stats.stats.items() if not _profiler_overhead(k, v)), reverse=True)
+        if own:
+            seconds, (filename, line, func) = own[0]
+            parts.append(f"hottest {func} ({os.path.basename(filename)}:{line}) {seconds:.2f}s self")
+    if _session["mode"] != "memory":
+        with open(prefix + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in sorted(run["samples"].items()):
+                f.write(f"{stack} {count}\n")
+        parts.append(f"{sum(run['samples'].values())} samples")
+    if memory_use is not None:
+        current, peak = memory_use
+        with open(prefix + ".alloc.txt", "w", encoding="utf-8") as f:
+            f.write(f"peak {peak / 2**20:.1f} MiB, {current / 2**20:.1f} MiB still allocated at the end\n\n")
+            for diff in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+                f.write(f"{diff}\n")
+        parts.append(f"peak {peak / 2**20:.1f} MiB")
+    line = f"⏱️ {run['name']}: {', '.join(parts)} → {prefix}.*"
+    with _lock:
+        with open(os.path.join(_session["dir"], "summary.txt"), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    print(line)
+
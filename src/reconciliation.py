@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import sys
+
+from src.payroll_fields import (
+    EARNING_KEYS, EE_TAX_KEYS, ER_TAX_KEYS, DEDUCTION_KEYS, HOURS_KEYS, NET_PAY_KEY,
+)
+
+# === What the register's own totals should equal ===
+# tax_info.json liabilities, as typed into the portal
+TAX_LIABILITIES = {
+    "Federal Withholding & FICA Tax": ["FWT", "SS W/H", "MC W/H", "ER SS", "ER MC"],
+    "NY Tax Withholding": ["NY State Tax"],
+}
+# report_totals.json "payroll_totals" column -> skeleton keys summed across employees
+PAYROLL_TOTAL_KEYS = {
+    "hours": HOURS_KEYS,
+    "gross": EARNING_KEYS,
+    "taxes": EE_TAX_KEYS,
+    "deductions": DEDUCTION_KEYS,
+    "er_taxes": ER_TAX_KEYS,
+}
+# Summary labels whose skeleton key is not derivable from the label itself
+EARNING_LABEL_ALIASES = {"Overtime": ["OTAmt"]}
+TOLERANCE_CENTS = 1
+
+
+# === Records → integer cents, one column per key ===
+def to_cents_frame(records):
+    # records: dicts or PayrollRecords; numbers come straight from the typed
+    # record's scaled integers, so no column is parsed as text
+    import numpy as np
+    import pandas as pd
+    from src.records import PayrollRecord, decode_record, NUMERIC_INDEX
+
+    typed = [r if isinstance(r, PayrollRecord) else decode_record(r) for r in records]
+    column_of = {index: col for col, index in enumerate(NUMERIC_INDEX.values())}
+    cents = np.zeros((len(typed), len(column_of)), dtype=np.int64)
+    for row, record in enumerate(typed):
+        for index, units, scale in zip(record.indexes, record.units, record.scales):
+            cents[row, column_of[index]] = units * 10 ** (2 - scale) if scale <= 2 else _round_half_up(units, scale - 2)
+    return pd.DataFrame(cents, index=pd.Index([r.emp_id for r in typed], name="Emp#"), columns=list(NUMERIC_INDEX))
+
+
+def _round_half_up(units, places):
+    # Rates carry 3-4 places: 366450 (36.6450) -> 3665 cents
+    whole, rest = divmod(abs(units), 10 ** places)
+    whole += 2 * rest >= 10 ** places
+    return -whole if units < 0 else whole
+
+
+def _keys_for_earning(label):
+    if label in EARNING_LABEL_ALIASES:
+        return EARNING_LABEL_ALIASES[label]
+    words = label.lower().split()
+    keys = []
+    for key in EARNING_KEYS:
+        stem = key.removesuffix("Amt").strip().lower()
+        # "Regular" -> RegAmt, "Deputy Clerk 1410" -> Deputy Amt + Clerk Amt
+        if stem and (set(stem.split()) <= set(words) or words[0].startswith(stem)):
+            keys.append(key)
+    return keys
+
+
+def _keys_for_deduction(label):
+    normalize = lambda s: s.lower().replace("insurance", "ins")
+    return [key for key in DEDUCTION_KEYS if normalize(key) == normalize(label)]
+
+
+def _label_in_block(label, block):
+    return re.search(rf"(^|[|\t])\s*{re.escape(label)}\s*([|\t:]|$)", block, re.MULTILINE) is not None
+
+
+# === Reconcile one period ===
+def reconcile(records, report_totals=None, tax_info=None, blocks=None):
+    # Returns {"ok", "employees", "checks": [...]}; each failed check lists the
+    # employees and columns most likely responsible.
+    blocks = blocks or {}
+    cents = to_cents_frame(records)
+    column_sums = cents.sum()
+    checks = []
+
+    def group_sum(keys):
+        keys = [k for k in keys if k in cents.columns]
+        return int(column_sums[keys].sum()), keys
+
+    def suspects_for(keys, diff, label=None):
+        per_employee = cents[keys].sum(axis=1)
+        found = set(per_employee.index[per_employee.abs() == abs(diff)])  # one record missing/doubled
+        if label:
+            found |= {emp for emp, value in per_employee.items() if value == 0 and _label_in_block(label, blocks.get(emp, ""))}
+        return sorted(found, key=lambda e: (len(e), e))
+
+    def add(name, keys, expected, label=None):
+        if expected is None:
+            return
+        actual, keys = group_sum(keys)
+        expected = int(round(expected * 100))
+        diff = actual - expected
+        ok = abs(diff) <= TOLERANCE_CENTS
+        checks.append({
+            "check": name,
+            "columns": keys,
+            "expected": expected / 100,
+            "actual": actual / 100,
+            "diff": diff / 100,
+            "ok": ok,
+            "suspects": [] if ok or not keys else suspects_for(keys, diff, label),
+        })
+
+    for liability, keys in TAX_LIABILITIES.items():
+        if tax_info and liability in tax_info:
+            add(f"tax_info: {liability}", keys, tax_info[liability].get("Amount"))
+
+    if report_totals:
+        add("report: Total Federal Tax", TAX_LIABILITIES["Federal Withholding & FICA Tax"], report_totals.get("federal_tax"))
+        add("report: Total NY Tax", TAX_LIABILITIES["NY Tax Withholding"], report_totals.get("ny_tax"))
+        add("report: Total Net Pay", [NET_PAY_KEY], report_totals.get("net_pay"))
+        for column, keys in PAYROLL_TOTAL_KEYS.items():
+            if column == "er_taxes" and report_totals.get("er_taxes"):
+                keys = list(report_totals["er_taxes"])  # the summary leaves out SUTA/FUTA
+            add(f"report: Payroll Totals {column}", keys, report_totals.get("payroll_totals", {}).get(column))
+        for label, entry in report_totals.get("earnings", {}).items():
+            add(f"report: {label}", _keys_for_earning(label), entry["current"], label)
+        for section in ("taxes", "er_taxes"):
+            for label, entry in report_totals.get(section, {}).items():
+                add(f"report: {label}", [label], entry["current"], label)
+        for label, entry in report_totals.get("deductions", {}).items():
+            add(f"report: {label}", _keys_for_deduction(label), entry["current"], label)
+
+        # Per-employee gross and net from the Employee Checks table pin mismatches to people
+        employee_checks = report_totals.get("employee_checks", {})
+        if employee_checks:
+            gross = cents[[k for k in EARNING_KEYS if k in cents.columns]].sum(axis=1)
+            net = cents[NET_PAY_KEY]
+            for emp_id, expected in employee_checks.items():
+                for what, series, key_list in (("gross", gross, EARNING_KEYS), ("net", net, [NET_PAY_KEY])):
+                    actual = int(series.get(emp_id, 0))
+                    diff = actual - int(round(expected[what] * 100))
+                    if abs(diff) > TOLERANCE_CENTS or emp_id not in cents.index:
+                        checks.append({
+                            "check": f"employee {emp_id} {what}",
+                            "columns": key_list,
+                            "expected": expected[what],
+                            "actual": actual / 100,
+                            "diff": diff / 100,
+                            "ok": False,
+                            "suspects": [emp_id],
+                        })
+            # Employees whose own check disagrees are the first place to look for a total that does not
+            for total, what in (("report: Payroll Totals gross", "gross"), ("report: Total Net Pay", "net")):
+                culprits = [c["suspects"][0] for c in checks if c["check"].endswith(f" {what}") and c["check"].startswith("employee ")]
+                for c in checks:
+                    if c["check"] == total and not c["ok"]:
+                        c["suspects"] = sorted(set(c["suspects"]) | set(culprits), key=lambda e: (len(e), e))
+            extra = sorted(set(cents.index) - set(employee_checks))
+            if extra:
+                checks.append({
+                    "check": "employees not on the report", "columns": [], "expected": 0, "actual": len(extra),
+                    "diff": len(extra), "ok": False, "suspects": extra,
+                })
+
+    return {"ok": all(c["ok"] for c in checks), "employees": len(cents), "checks": checks}
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def reconcile_folder(folder_path, write=False):
+    records = _load_json(os.path.join(folder_path, "parsed_employee_data.json"))
+    if records is None:
+        raise FileNotFoundError(f"❌ No parsed_employee_data.json in {folder_path}")
+    employee_data = _load_json(os.path.join(folder_path, "employee_data.json")) or []
+    report = reconcile(
+        records,
+        report_totals=_load_json(os.path.join(folder_path, "report_totals.json")),
+        tax_info=_load_json(os.path.join(folder_path, "tax_info.json")),
+        blocks={str(emp["Emp#"]): emp["Block"] for emp in employee_data},
+    )
+    report["folder"] = os.path.basename(os.path.normpath(folder_path))
+    if write:
+        with open(os.path.join(folder_path, "reconciliation.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def format_reconciliation(report):
+    failed = [c for c in report["checks"] if not c["ok"]]
+    head = "✅" if report["ok"] else "❌"
+    lines = [f"{head} {report['folder']}: {len(report['checks']) - len(failed)}/{len(report['checks'])} checks balance"]
+    if not report["checks"]:
+        lines[0] = f"⚪ {report['folder']}: no report totals or tax_info.json to reconcile against"
+    for c in failed:
+        who = f" → check Emp# {', '.join(c['suspects'])}" if c["suspects"] else ""
+        lines.append(f"   ⚠️ {c['check']}: expected {c['expected']:,.2f}, got {c['actual']:,.2f} ({c['diff']:+,.2f}){who}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else "Extracted"
+    for folder in sorted(os.listdir(base_folder)):
+        folder_path = os.path.join(base_folder, folder)
+        if os.path.exists(os.path.join(folder_path, "parsed_employee_data.json")):
+            print(format_reconciliation(reconcile_folder(folder_path)))
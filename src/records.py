@@ -0,0 +1,191 @@
+import json
+import re
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from decimal import Decimal
+
+from src.extraction_prompt import EXPECTED_KEYS
+from src.payroll_fields import (
+    IDENTITY_KEYS, HOURS_KEYS, RATE_KEYS, EARNING_KEYS, YTD_KEYS, NUMERIC_KEYS, to_number,
+)
+
+# === Field registry (one entry per skeleton key, in skeleton order) ===
+# Records keep only the fields that have a value, as Decimals, so a register
+# of mostly-null ~145-key dicts shrinks to a few dozen numbers per employee.
+Field = namedtuple("Field", "index name kind")
+
+
+def _kind(key):
+    if key in IDENTITY_KEYS:
+        return "text"
+    if key in YTD_KEYS:
+        return "ytd"
+    if key in HOURS_KEYS:
+        return "hours"
+    if key in RATE_KEYS:
+        return "rate"
+    if key in EARNING_KEYS:
+        return "amount"
+    return "amount" if key in NUMERIC_KEYS else "text"
+
+
+FIELDS = [Field(i, key, _kind(key)) for i, key in enumerate(EXPECTED_KEYS)]
+FIELD_INDEX = {field.name: field.index for field in FIELDS}
+NUMERIC_INDEX = {key: FIELD_INDEX[key] for key in NUMERIC_KEYS}
+
+
+class RecordError(ValueError):
+    pass
+
+
+# === Typed record ===
+class PayrollRecord:
+    # emp_id/name as text. Numbers are exact scaled integers: a sorted array of
+    # field indexes, a parallel array of units and the decimal places of each
+    # (1,316.48 → 131648, 2), turned back into Decimals on demand. extra holds,
+    # verbatim, what the schema cannot type (unknown keys, text in a numeric
+    # field) and numbers spelled differently from format_number ("(12.00)",
+    # JSON floats), so encoding gives back exactly what was decoded.
+    __slots__ = ("emp_id", "name", "indexes", "units", "scales", "extra")
+
+    def __init__(self, emp_id, name=None, numbers=None, extra=None):
+        # numbers: {field name: Decimal or (units, scale)}
+        self.emp_id = emp_id
+        self.name = name
+        pairs = sorted(
+            (NUMERIC_INDEX[key], value if isinstance(value, tuple) else to_units(value))
+            for key, value in (numbers or {}).items() if value is not None
+        )
+        self.indexes = array("H", [i for i, _ in pairs])
+        self.units = array("q", [units for _, (units, _) in pairs])
+        self.scales = bytes(scale for _, (_, scale) in pairs)
+        self.extra = extra or None
+
+    def number(self, key):
+        # Decimal or None
+        index = NUMERIC_INDEX.get(key)
+        if index is None:
+            return None
+        pos = bisect_left(self.indexes, index)
+        if pos < len(self.indexes) and self.indexes[pos] == index:
+            return Decimal(self.units[pos]).scaleb(-self.scales[pos])
+        return None
+
+    def get(self, key, default=None):
+        # The value as it appears in parsed_employee_data.json ("1,316.48"), like dict.get
+        if key == "Emp#":
+            return self.emp_id
+        if key == "Name":
+            return self.name
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        number = self.number(key)
+        return format_number(number) if number is not None else default
+
+    def __contains__(self, key):
+        return key in FIELD_INDEX or bool(self.extra and key in self.extra)
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def numbers_by_key(self):
+        # (field name, Decimal) for every number present
+        return [
+            (FIELDS[i].name, Decimal(units).scaleb(-scale))
+            for i, units, scale in zip(self.indexes, self.units, self.scales)
+        ]
+
+    def to_dict(self):
+        # Full skeleton, nulls included, in skeleton order (the on-disk format)
+        out = dict.fromkeys(EXPECTED_KEYS)
+        out["Emp#"], out["Name"] = self.emp_id, self.name
+        for key, value in self.numbers_by_key():
+            out[key] = format_number(value)
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def __repr__(self):
+        return f"PayrollRecord(Emp#={self.emp_id!r}, {len(self.units)} values)"
+
+
+def format_number(value):
+    # Decimal("1316.48") -> "1,316.48" (the register's own formatting; scale is kept)
+    return f"{value:,}"
+
+
+def to_units(number):
+    # Decimal("-12.50") -> (-1250, 2)
+    scale = max(0, -number.as_tuple().exponent)
+    return int(number.scaleb(scale)), scale
+
+
+PLAIN_NUMBER = re.compile(r"(-?)(\d{1,3}(?:,\d{3})*|\d+)(?:\.(\d+))?$")
+
+
+def parse_plain(text):
+    # (units, scale) for text already in format_number's spelling, else None
+    match = PLAIN_NUMBER.match(text)
+    if not match:
+        return None
+    sign, whole, frac = match.groups()
+    digits = whole.replace(",", "")
+    if f"{int(digits):,}" != whole:
+        return None  # "1316.48" (no separator) or "01.00" re-encode differently
+    frac = frac or ""
+    units = int(digits + frac)
+    return (-units if sign else units), len(frac)
+
+
+# === Codec: JSON ↔ records, validated against the registry in one pass ===
+def decode_record(obj, strict=False):
+    # strict=True raises RecordError on unknown keys or text in numeric fields;
+    # otherwise those are carried in extra unchanged
+    if not isinstance(obj, dict):
+        raise RecordError(f"expected an object, got {type(obj).__name__}")
+    emp_id = obj.get("Emp#")
+    if emp_id is None:
+        raise RecordError("record has no Emp#")
+    numbers = {}
+    extra = {}
+    for key, value in obj.items():
+        if value is None or key in IDENTITY_KEYS:
+            continue
+        if key not in NUMERIC_INDEX:
+            if strict:
+                raise RecordError(f"Emp# {emp_id}: unknown key '{key}'")
+            extra[key] = value
+            continue
+        plain = parse_plain(value) if isinstance(value, str) else None
+        if plain is not None:
+            numbers[key] = plain
+            continue
+        number = to_number(value)
+        if number is None:
+            if strict:
+                raise RecordError(f"Emp# {emp_id}: '{key}' is not a number: {value!r}")
+            extra[key] = value
+            continue
+        numbers[key] = to_units(number)
+        extra[key] = value  # keep the original spelling for encoding
+    return PayrollRecord(str(emp_id), obj.get("Name"), numbers, extra)
+
+
+def decode_records(data, strict=False):
+    if not isinstance(data, list):
+        raise RecordError(f"expected a list of records, got {type(data).__name__}")
+    return [decode_record(obj, strict) for obj in data]
+
+
+def load_records(path, strict=False):
+    with open(path, "r", encoding="utf-8") as f:
+        return decode_records(json.load(f), strict)
+
+
+def dump_records(records, path):
+    # Same file as json.dump([...], indent=2) of the original dicts
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([record.to_dict() for record in records], f, indent=2)
@@ -0,0 +1,191 @@
+import json
+import os
+import re
+
+# === Pay period from the PDF copy of the register ===
+PAY_PERIOD_PATTERN = re.compile(
+    r"Payroll\s+Register\s+Report.*?"
+    r"Pay\s*Period\s*From\s*(\d{1,2}/\d{1,2}/\d{4})\s*to\s*(\d{1,2}/\d{1,2}/\d{4})"
+    r".*?Pay\s*Date[:\s]*([\d/]+)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def extract_pay_period_from_pdf(pdf_path):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(pdf_path)
+    text = ""
+    for page in doc:
+        text += page.get_text()
+
+    match = PAY_PERIOD_PATTERN.search(text)
+    if match:
+        return match.group(1), match.group(2), match.group(3)
+    return None, None, None
+
+
+# === Employee blocks from the RTF copy of the register ===
+def split_employee_blocks(text):
+    employee_blocks = re.split(r"\bEmp#\s*\d+\b", text)
+    employee_ids = re.findall(r"\bEmp#\s*(\d+)\b", text)
+
+    cleaned_employees = []
+    for emp_id, block in zip(employee_ids, employee_blocks[1:]):
+        # Stop reading after "Employee Tot:" line
+        cleaned_lines = []
+        for line in block.splitlines():
+            cleaned_lines.append(line)
+            if "Employee Tot:" in line:
+                break
+        cleaned_block = "\n".join(cleaned_lines).strip()
+        if cleaned_block:
+            cleaned_employees.append({"Emp#": emp_id, "Block": cleaned_block})
+    return cleaned_employees
+
+
+def read_rtf_text(rtf_path):
+    from striprtf.striprtf import rtf_to_text
+
+    with open(rtf_path, "r", encoding="utf-8") as f:
+        return rtf_to_text(f.read())
+
+
+def extract_employees_from_rtf(rtf_path):
+    return split_employee_blocks(read_rtf_text(rtf_path))
+
+
+# === Company-level totals printed after the last employee ===
+# Kept next to employee_data.json as report_totals.json so the extraction can
+# be reconciled against the register itself before upload.
+MONEY = r"-?\$?[\d,]*\.\d+"
+MERGED_CELL = re.compile(rf"^({MONEY})\s+(.*[A-Za-z].*)$")
+PAYROLL_TOTAL_FIELDS = [
+    "hours", "gross", "gross_ytd", "taxes", "taxes_ytd",
+    "deductions", "deductions_ytd", "er_taxes", "er_taxes_ytd",
+]
+EE_TAX_LABELS = {"FWT", "SS W/H", "MC W/H", "NY State Tax", "NY SDI", "NY PFML"}
+ER_TAX_LABELS = {"ER SS", "ER MC", "FUTA", "NY SUTA"}
+
+
+def _money(text):
+    return float(text.replace("$", "").replace(",", ""))
+
+
+def _split_merged_cells(line):
+    # "1,708.08 414(h)" -> "1,708.08|414(h)" (two cells the export ran together)
+    fields = []
+    for field in line.split("|"):
+        merged = MERGED_CELL.match(field.strip())
+        fields.extend(merged.groups() if merged else [field])
+    return "|".join(fields)
+
+
+def _summary_lines(text):
+    start = re.search(r"Payroll Summary\s*Total Net Pay:", text)
+    end = text.find("Payroll Totals :")
+    if not start or end < 0:
+        return []
+    return text[start.end():end].splitlines()[1:]
+
+
+def extract_report_totals(text):
+    from src.layout_induction import segment_line
+
+    totals = {"earnings": {}, "taxes": {}, "deductions": {}, "er_taxes": {}, "employee_checks": {}}
+
+    net = re.search(rf"Payroll Summary\s*Total Net Pay:\s*({MONEY})", text)
+    gross = re.search(rf"Total Gross Pay:\|?\s*({MONEY})", text)
+    paid = re.search(r"Employees Paid:\|?\s*(\d+)", text)
+    federal = re.search(rf"Total Federal Tax:[|\s]*({MONEY})", text)
+    ny = re.search(rf"Total NY Tax:[|\s]*({MONEY})", text)
+    totals["net_pay"] = _money(net.group(1)) if net else None
+    totals["gross_pay"] = _money(gross.group(1)) if gross else None
+    totals["employees_paid"] = int(paid.group(1)) if paid else None
+    totals["federal_tax"] = _money(federal.group(1)) if federal else None
+    totals["ny_tax"] = _money(ny.group(1)) if ny else None
+
+    # Summary grid: earnings (hrs, current, ytd) | taxes | deductions | ER taxes
+    for line in _summary_lines(text):
+        for label, _, values in segment_line(_split_merged_cells(line)):
+            if label == "^" or len(values) < 2:
+                continue
+            entry = {"current": _money(values[-2]), "ytd": _money(values[-1])}
+            if label in EE_TAX_LABELS:
+                totals["taxes"][label] = entry
+            elif label in ER_TAX_LABELS:
+                totals["er_taxes"][label] = entry
+            elif len(values) >= 3:
+                totals["earnings"][label] = dict(entry, hours=_money(values[0]))
+            else:
+                totals["deductions"][label] = entry
+
+    payroll = re.search(r"Payroll Totals :\|(.*)", text)
+    if payroll:
+        numbers = re.findall(MONEY, payroll.group(1))
+        if len(numbers) == len(PAYROLL_TOTAL_FIELDS):
+            totals["payroll_totals"] = dict(zip(PAYROLL_TOTAL_FIELDS, map(_money, numbers)))
+
+    # Employee Checks: Emp # | Name | Gross Pay | Net Pay | ...
+    # (rows are sometimes broken across lines, so walk the cells rather than the lines)
+    checks = re.search(r"Emp #\|Employee Name\|Gross Pay\|Net Pay\|[^\n]*\n(.*?)\|Totals :", text, re.DOTALL)
+    if checks:
+        cells = [c.strip() for c in re.split(r"[|\n]", checks.group(1)) if c.strip()]
+        for i in range(len(cells) - 3):
+            emp_id, name, gross_pay, net_pay = cells[i:i + 4]
+            if (emp_id.isdigit() and re.search(r"[A-Za-z]", name)
+                    and re.fullmatch(MONEY, gross_pay) and re.fullmatch(MONEY, net_pay)):
+                totals["employee_checks"][emp_id] = {"name": name, "gross": _money(gross_pay), "net": _money(net_pay)}
+    return totals
+
+
+# === Extracted/<Client-MM-DD-YYYY_MM-DD-YYYY_MM-DD-YYYY>/employee_data.json ===
+def register_folder_name(client, pay_start, pay_end, pay_date):
+    def mm_dd_yyyy(date_str):
+        month, day, year = date_str.split("/")
+        return f"{int(month):02d}-{int(day):02d}-{year}"
+
+    return f"{client}-{mm_dd_yyyy(pay_start)}_{mm_dd_yyyy(pay_end)}_{mm_dd_yyyy(pay_date)}"
+
+
+def chunk_rtf_register(rtf_path, pdf_path, client, output_base="Extracted", logger=print):
+    pay_start, pay_end, pay_date = extract_pay_period_from_pdf(pdf_path)
+    if not all([pay_start, pay_end, pay_date]):
+        raise ValueError(f"❌ Could not extract pay period from PDF: {pdf_path}")
+
+    folder_name = register_folder_name(client, pay_start, pay_end, pay_date)
+    output_dir = os.path.join(output_base, folder_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    text = read_rtf_text(rtf_path)
+    employee_data = split_employee_blocks(text)
+    output_json_path = os.path.join(output_dir, "employee_data.json")
+    with open(output_json_path, "w", encoding="utf-8") as f:
+        json.dump(employee_data, f, indent=2)
+    with open(os.path.join(output_dir, "report_totals.json"), "w", encoding="utf-8") as f:
+        json.dump(extract_report_totals(text), f, indent=2)
+
+    logger(f"✅ Extracted {len(employee_data)} employees: {os.path.basename(rtf_path)} → {output_json_path}")
+    return folder_name
+
+
+# === Backfill report_totals.json for folders chunked before it existed ===
+# RTF exports are named "<YYYY-MM-DD> <n> Payroll Set.rtf" after the pay date.
+def backfill_report_totals(rtf_dir, output_base="Extracted", logger=print):
+    by_pay_date = {}
+    for name in os.listdir(rtf_dir):
+        match = re.match(r"^(\d{4})-(\d{2})-(\d{2}) .*\.rtf$", name)
+        if match:
+            year, month, day = match.groups()
+            by_pay_date[f"{month}-{day}-{year}"] = os.path.join(rtf_dir, name)
+
+    written = 0
+    for folder in sorted(os.listdir(output_base)):
+        rtf_path = by_pay_date.get(folder.rsplit("_", 1)[-1])
+        if rtf_path is None:
+            continue
+        with open(os.path.join(output_base, folder, "report_totals.json"), "w", encoding="utf-8") as f:
+            json.dump(extract_report_totals(read_rtf_text(rtf_path)), f, indent=2)
+        written += 1
+        logger(f"🧾 {folder} ← {os.path.basename(rtf_path)}")
+    return written
@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+import re
+import sys
+
+from src.profiling import profiled_stage
+
+# === Combined registers → one independent job per company / pay group ===
+# Every page of a register export starts with the same three-line header:
+#   Payroll Register Report
+#   Town of New Baltimore
+#   Pay Period From 05/03/2025 to 05/16/2025, Pay Date: 05/23/2025, Payroll # 13 (Standard)
+# A combined export (several companies or pay groups, or one per sheet of a
+# workbook) is cut wherever that header changes. Repeated page headers of the
+# same section are dropped rather than ending up inside an employee's chunk.
+# Each section is routed to the template whose "Employer:" cell names its
+# company, so sections become separate Extracted/ folders or queue jobs that
+# are extracted and populated in parallel. Departments ("Department : Sewer")
+# stay inside their section: they upload as one CSV with the company.
+REPORT_TITLE = "payroll register report"
+PAY_PERIOD_LINE = re.compile(
+    r"Pay\s*Period\s*From\s*(\d{1,2}/\d{1,2}/\d{4})\s*to\s*(\d{1,2}/\d{1,2}/\d{4}),?\s*"
+    r"Pay\s*Date[:\s]*(\d{1,2}/\d{1,2}/\d{4})(?:,?\s*Payroll\s*#\s*(\d+))?",
+    re.IGNORECASE,
+)
+DEPARTMENT_LINE = re.compile(r"^Department\s*:\s*(.+)$")
+TEMPLATE_DIR = "Data/CSV_Templates"
+SECTIONS_DIR = os.path.join("Data", "raw_chunks", "sections")
+
+
+def _cells(line):
+    return [cell.strip() for cell in re.split(r"[\t|]", line) if cell.strip()]
+
+
+def _new_section(key, company=None, period=None):
+    pay_start, pay_end, pay_date, payroll = period or (None, None, None, None)
+    return {
+        "key": key, "company": company, "pay_start": pay_start, "pay_end": pay_end,
+        "pay_date": pay_date, "payroll": payroll, "sheets": [], "departments": [], "lines": [],
+    }
+
+
+# === Sections ===
+def split_sections(lines):
+    # lines: (sheet or None, text) pairs in register order. Returns the sections
+    # in order of first appearance; pages of one section that are not next to
+    # each other (A, B, A) are joined back together.
+    sections = {}
+    current = None
+    header = None  # page header being read: {"sheet", "company"}
+    sheet_seen = None
+    for sheet, line in lines:
+        text = line.strip()
+        if sheet != sheet_seen:
+            sheet_seen, current = sheet, None  # a sheet without its own header is its own section
+        if REPORT_TITLE in text.lower() and len(_cells(text)) == 1:
+            header = {"company": None}
+            continue
+        if header is not None and text:
+            period = PAY_PERIOD_LINE.search(text)
+            if period:
+                key = (header["company"],) + period.groups()
+                current = sections.setdefault(key, _new_section(key, header["company"], period.groups()))
+                header = None
+                continue
+            if header["company"] is None:
+                header["company"] = _cells(text)[0]
+                continue
+            header = None  # title and company without a pay period: keep reading as content
+        if current is None:
+            key = ("sheet", sheet, len(sections))
+            current = sections.setdefault(key, _new_section(key))
+        if sheet is not None and sheet not in current["sheets"]:
+            current["sheets"].append(sheet)
+        department = DEPARTMENT_LINE.match(" ".join(_cells(text)))
+        if department and department.group(1) not in current["departments"]:
+            current["departments"].append(department.group(1))
+        current["lines"].append(line)
+    return [s for s in sections.values() if any("Emp#" in line for line in s["lines"])]
+
+
+def describe(section):
+    dates = f"{section['pay_start']} to {section['pay_end']}, pay date {section['pay_date']}" if section["pay_date"] else "no pay period"
+    where = f" [{', '.join(section['sheets'])}]" if section["sheets"] else ""
+    depts = f" ({len(section['departments'])} dept)" if section["departments"] else ""
+    return f"{section['company'] or '?'} | {dates}{where}{depts}"
+
+
+# === Routing: company line → client template ===
+def _normalize(name):
+    return re.sub(r"[^a-z0-9]", "", (name or "").lower())
+
+
+def company_clients(template_dir=TEMPLATE_DIR):
+    # {"townofnewbaltimore": "NewBaltimore"} from each template's "Employer:" row
+    clients = {}
+    for name in sorted(os.listdir(template_dir)):
+        if not name.endswith(".csv"):
+            continue
+        with open(os.path.join(template_dir, name), newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if row and row[0].strip() == "Employer:" and len(row) > 2:
+                    clients[_normalize(row[2])] = name.split(" ")[0]
+                    break
+    return clients
+
+
+def route_section(section, fallback_client=None, clients=None):
+    # Client for the section's template: its company line, else the caller's guess
+    clients = company_clients() if clients is None else clients
+    return clients.get(_normalize(section["company"])) or fallback_client
+
+
+# === RTF registers → Extracted/<folder>/ per section ===
+@profiled_stage("chunk-rtf")
+def chunk_rtf_sections(rtf_path, pdf_path, client, output_base="Extracted", logger=print):
+    # Like register_chunker.chunk_rtf_register, but returns one folder per section.
+    # Sections without their own pay period (a plain single-company export) take
+    # the PDF's, so those come out exactly as before.
+    from src.register_chunker import (
+        read_rtf_text, split_employee_blocks, extract_report_totals, extract_pay_period_from_pdf,
+        register_folder_name,
+    )
+
+    text = read_rtf_text(rtf_path)
+    sections = split_sections((None, line) for line in text.splitlines())
+    pdf_period = None
+    clients = company_clients()
+    folders = {}
+    for section in sections:
+        section_client = route_section(section, client, clients)
+        if not section_client:
+            logger(f"⚠️ No template for {describe(section)}; section skipped")
+            continue
+        if section["pay_date"]:
+            period = (section["pay_start"], section["pay_end"], section["pay_date"])
+        else:
+            pdf_period = pdf_period or extract_pay_period_from_pdf(pdf_path)
+            if not all(pdf_period):
+                raise ValueError(f"❌ Could not extract pay period from PDF: {pdf_path}")
+            period = pdf_period
+        folder = register_folder_name(section_client, *period)
+        folders.setdefault(folder, []).append(section)
+
+    for folder, parts in folders.items():
+        output_dir = os.path.join(output_base, folder)
+        os.makedirs(output_dir, exist_ok=True)
+        section_text = "\n".join(line for section in parts for line in section["lines"])
+        employee_data = split_employee_blocks(section_text)
+        with open(os.path.join(output_dir, "employee_data.json"), "w", encoding="utf-8") as f:
+            json.dump(employee_data, f, indent=2)
+        with open(os.path.join(output_dir, "report_totals.json"), "w", encoding="utf-8") as f:
+            json.dump(extract_report_totals(section_text), f, indent=2)
+        logger(f"✅ Extracted {len(employee_data)} employees: {os.path.basename(rtf_path)} → {output_dir}/employee_data.json")
+    if len(folders) > 1:
+        logger(f"✂️ {os.path.basename(rtf_path)} split into {len(folders)} registers")
+    return list(folders)
+
+
+# === Workbooks → one chunk file (and queue job) per section ===
+@profiled_stage("split-xlsx")
+def split_workbook(xlsx_path, client=None, output_dir=SECTIONS_DIR, logger=print):
+    # Returns [{"chunks", "client", "section", "pay_date", "employees"}], one per
+    # section, each chunk file in extract_employee_chunks' format
+    from src.excel_raw_text_chunk import iter_register_lines, group_employee_chunks
+    from src.register_chunker import register_folder_name
+
+    stem = os.path.splitext(os.path.basename(xlsx_path))[0]
+    clients = company_clients()
+    jobs = {}
+    for n, section in enumerate(split_sections(iter_register_lines(xlsx_path)), 1):
+        section_client = route_section(section, client, clients)
+        if not section_client:
+            logger(f"⚠️ No template for {describe(section)}; section skipped")
+            continue
+        label = (register_folder_name(section_client, section["pay_start"], section["pay_end"], section["pay_date"])
+                 if section["pay_date"] else f"{section_client}-{n}")
+        job = jobs.setdefault(label, {"client": section_client, "section": label, "pay_date": section["pay_date"], "chunks": []})
+        job["chunks"].extend(chunk for chunk in group_employee_chunks(section["lines"]) if "Emp#" in chunk)
+
+    os.makedirs(os.path.join(output_dir, stem), exist_ok=True)
+    for job in jobs.values():
+        chunks, job["chunks"] = job.pop("chunks"), os.path.join(output_dir, stem, f"{job['section']}.json")
+        with open(job["chunks"], "w", encoding="utf-8") as f:
+            json.dump(chunks, f, indent=2)
+        job["employees"] = len(chunks)
+        logger(f"✂️ {job['section']}: {len(chunks)} employee chunk(s) → {job['chunks']}")
+    return list(jobs.values())
+
+
+if __name__ == "__main__":
+    # python -m src.register_splitter <register.xlsx|register.rtf>: print the sections found
+    path = sys.argv[1]
+    if path.lower().endswith(".xlsx"):
+        from src.excel_raw_text_chunk import iter_register_lines
+
+        lines = iter_register_lines(path)
+    else:
+        from src.register_chunker import read_rtf_text
+
+        lines = ((None, line) for line in read_rtf_text(path).splitlines())
+    clients = company_clients()
+    for section in split_sections(lines):
+        employees = sum("Emp#" in line for line in section["lines"])
+        print(f"📑 {route_section(section, None, clients) or '⚠️ no template'} ← {describe(section)}: {employees} employee(s)")
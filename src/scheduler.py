@@ -0,0 +1,115 @@
+import os
+import re
+from collections import Counter
+from datetime import date, datetime
+
+# === Pay-date-aware ordering for extraction and upload work ===
+# Every unit of work (folder, queued employee, ingest job, upload record) has a
+# client and a pay date. Work falls into one of three tiers:
+#   0 due      pay date is today or later, or at most LATE_GRACE_DAYS ago
+#              → earliest deadline first
+#   1 backfill pay date is long past; nothing is waiting on it
+#              → clients take turns, each client's oldest period first
+#   2 unknown  no pay date could be read → last, in the order given
+# Within the due tier, work with the same pay date also alternates between
+# clients, so one client's large register cannot hold up another due that day.
+LATE_GRACE_DAYS = int(os.getenv("SCHED_LATE_GRACE_DAYS", "3"))
+DUE, BACKFILL, UNKNOWN = 0, 1, 2
+TIER_NAMES = {DUE: "due", BACKFILL: "backfill", UNKNOWN: "unknown"}
+
+RTF_PAY_DATE = re.compile(r"^(\d{4})-(\d{2})-(\d{2}) ")  # "2025-01-09 2 Payroll Set.rtf"
+
+
+def folder_pay_info(folder):
+    # "Client-MM-DD-YYYY_MM-DD-YYYY_MM-DD-YYYY" → (client, pay date); (None, None) when unparseable
+    from generate_populated_csv import extract_payroll_dates_from_folder
+
+    try:
+        info = extract_payroll_dates_from_folder(os.path.basename(os.path.normpath(folder)))
+    except ValueError:
+        return None, None
+    return info["ClientName"], parse_pay_date(info["PayDate"])
+
+
+def parse_pay_date(text):
+    # Accepts 1/9/2025, 01/09/2025, 01-09-2025 and 2025-01-09
+    if not text:
+        return None
+    for fmt in ("%m/%d/%Y", "%m-%d-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def rtf_pay_date(path):
+    match = RTF_PAY_DATE.match(os.path.basename(path))
+    return date(*map(int, match.groups())) if match else None
+
+
+def tier_of(pay_date, today=None):
+    if pay_date is None:
+        return UNKNOWN
+    today = today or date.today()
+    return DUE if (today - pay_date).days <= LATE_GRACE_DAYS else BACKFILL
+
+
+def grace_cutoff(today=None):
+    # Earliest pay date still in the due tier
+    return date.fromordinal((today or date.today()).toordinal() - LATE_GRACE_DAYS)
+
+
+def edf_order(items, client_of, pay_date_of, today=None, in_flight=None):
+    # items in run order; in_flight: {client: units already running}, so a client
+    # that already holds workers yields the next turn to one that holds none
+    today = today or date.today()
+    in_flight = Counter(in_flight or {})
+    keyed = []
+    for position, item in enumerate(items):
+        pay_date = pay_date_of(item)
+        keyed.append((tier_of(pay_date, today), pay_date, str(client_of(item) or ""), position, item))
+
+    # A client's n-th unit (oldest first) gets turn n, offset by what it already has running
+    turns = {}
+    seen = Counter()
+    for tier, pay_date, client, position, _ in sorted(keyed, key=lambda k: (k[0], k[1] or date.max, k[3])):
+        turns[position] = in_flight[client] + seen[(tier, client, pay_date if tier == DUE else None)]
+        seen[(tier, client, pay_date if tier == DUE else None)] += 1
+
+    def key(k):
+        tier, pay_date, client, position, _ = k
+        if tier == DUE:
+            return (tier, pay_date, turns[position], client, position)
+        if tier == BACKFILL:
+            return (tier, turns[position], pay_date, client, position)
+        return (tier, position)
+
+    return [k[-1] for k in sorted(keyed, key=key)]
+
+
+# === Helpers for the shapes of work this repo passes around ===
+def order_folders(folders, today=None):
+    info = {folder: folder_pay_info(folder) for folder in folders}
+    return edf_order(folders, lambda f: info[f][0], lambda f: info[f][1], today)
+
+
+def order_records(records, today=None):
+    # to_run_files records: {"CLIENT", "PAY_DATE": "MM/DD/YYYY", ...}
+    return edf_order(records, lambda r: r.get("CLIENT"), lambda r: parse_pay_date(r.get("PAY_DATE")), today)
+
+
+def format_schedule(folders, today=None):
+    lines = []
+    for folder in folders:
+        client, pay_date = folder_pay_info(folder)
+        tier = TIER_NAMES[tier_of(pay_date, today)]
+        lines.append(f"   {tier:<8} {str(pay_date or '?'):<10} {client or '?':<14} {folder}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    base_folder = "Extracted"
+    folders = [f for f in os.listdir(base_folder) if os.path.isdir(os.path.join(base_folder, f))]
+    print(f"🗓️ Run order for {base_folder}/ (late grace {LATE_GRACE_DAYS} day(s)):")
+    print(format_schedule(order_folders(folders)))
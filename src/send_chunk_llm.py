@@ -1,44 +1,18 @@
 import os
+import re
 import json
 import time
 import requests
-from dotenv import load_dotenv
-
-def extract_payroll_with_gemini(
-    chunks_path="employee_chunks_raw.json",
-    success_path="all_extracted_employees.json",
-    failed_path="failed_chunks.json",
-    delay_seconds=7,
-    logger=print
-):
-    # === Load employee chunks ===
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        employee_chunks = json.load(f)
-
-    # === Gemini API setup ===
-    load_dotenv()
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-    if not GEMINI_API_KEY:
-        raise ValueError("❌ Missing GEMINI_API_KEY in .env")
-
-    GEMINI_URL = (
-        f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-    )
-    HEADERS = {"Content-Type": "application/json"}
-
-    # === Output containers ===
-    all_extracted = []
-    failed_chunks = []
-
-    # === Gemini extraction loop ===
-    for idx, chunk in enumerate(employee_chunks):
-        if not any(word.startswith("Emp#") for word in chunk.split()) or "Net Pay" not in chunk:
-            print(f"⚠️ Skipping likely header-only chunk #{idx+1}")
-            logger(f"⚠️ Skipping likely header-only chunk #{idx+1}")
-            continue
-
-        prompt = f"""
+from src.block_normalizer import normalize_block, preflight, format_preflight
+from src.model_router import ModelRouter
+from src.stream_extract import STREAM_RESPONSES, make_streaming_extractor
+from src.key_pool import get_key_pool, generate_text
+from src.truncation import get_output_ceilings, extract_with_ceiling
+from src.profiling import profiled_stage
+
+# === Prompt Template ===
+def build_prompt(chunk):
+    return f"""
 You are a strict payroll data extractor.
 
 From the raw payroll block below, extract values as a flat JSON using exactly the following keys.  
@@ -64,7 +38,7 @@ Here is the required structure:
   "PersonalHrs": ..., "PersonalAmt": ..., "PersonalAmt_YTD": ...,
   "Deputy Clerk Hrs": ..., "Deputy Clerk Amt": ..., "Deputy Clerk Amt_YTD": ...,
   "OtherHrs": ..., "OtherAmt": ..., "OtherAmt_YTD": ...,
-  Emergency Mgmt Hrs: ..., "Emergency Mgmt Amt": ..., "Emergency Mgmt Amt_YTD": ...,
+  "Emergency Mgmt Hrs": ..., "Emergency Mgmt Amt": ..., "Emergency Mgmt Amt_YTD": ...,
 
   "FWT": ..., "FWT_YTD": ...,
   "SS W/H": ..., "SS W/H_YTD": ...,
@@ -92,7 +66,7 @@ Here is the required structure:
   "Total Earnings YTD":...,
   "Total Taxes Current": ...,
   "Total Taxes YTD": ...,
-  Total Deductions YTD:...,
+  "Total Deductions YTD":...,
   "Total ER Taxes Cuurrent": ...,
   "Total ER Taxes YTD": ...,
   "Net Pay": ...
@@ -102,43 +76,111 @@ Rules:
 - Only return valid **JSON**
 - Use `null` if any value is not present
 - No markdown, no explanation, no extra keys
+- A run like `|~5|` (or the same with tabs) is shorthand for 6 consecutive separators (5 empty columns)
 
 Raw input:
 {chunk}
 """.strip()
 
 
-        body = {"contents": [{"parts": [{"text": prompt}]}]}
+EXPECTED_KEYS = re.findall(r'"([^"]+)"\s*:', build_prompt(""))
+
+# Reused across calls (and jobs) so TLS connections to the API stay open
+http_session = requests.Session()
+
+
+def make_gemini_sender(stream=None, client=None):
+    # === Gemini API setup: GEMINI_API_KEY, or several keys in GEMINI_API_KEYS ===
+    pool = get_key_pool()
+    ceilings = get_output_ceilings()
+
+    # GEMINI_STREAM=1: read the response as it is generated and re-send early when it goes wrong
+    if STREAM_RESPONSES if stream is None else stream:
+        streamer = make_streaming_extractor(pool, session=http_session)
+
+        def stream_to_model(prompt, prompt_chunk, model_name):
+            # A response cut at the output limit keeps its complete members; the rest is asked in parts
+            return extract_with_ceiling(
+                lambda: streamer.generate(prompt, model_name, EXPECTED_KEYS).strip(),
+                lambda reask: streamer.generate(reask, model_name),
+                prompt_chunk, EXPECTED_KEYS, ceilings, client, strict=True,
+            )
+
+        stream_to_model.streamer = streamer
+        stream_to_model.pool = pool
+        return stream_to_model
+
+    def send_to_model(prompt, prompt_chunk, model_name):
+        return extract_with_ceiling(
+            lambda: generate_text(prompt, model_name, pool, session=http_session),
+            lambda reask: generate_text(reask, model_name, pool, session=http_session),
+            prompt_chunk, EXPECTED_KEYS, ceilings, client, strict=True,
+        )
+
+    send_to_model.pool = pool
+    return send_to_model
+
+
+def is_employee_chunk(chunk):
+    # Header/footer rows before the first Emp# come through as their own chunk
+    return any(word.startswith("Emp#") for word in chunk.split()) and "Net Pay" in chunk
+
+
+@profiled_stage("extract-xlsx")
+def extract_payroll_with_gemini(
+    chunks_path="employee_chunks_raw.json",
+    success_path="all_extracted_employees.json",
+    failed_path="failed_chunks.json",
+    delay_seconds=7,
+    logger=print,
+    normalize=True,
+    model_tiers=("gemini-2.0-flash-lite", "gemini-2.0-flash"),
+    client=None,
+):
+    # === Load employee chunks ===
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        employee_chunks = json.load(f)
+
+    # === Pre-flight estimate before any calls ===
+    report = preflight(employee_chunks, build_prompt(""), EXPECTED_KEYS, model_tiers[0], normalize)
+    print(format_preflight(report, label=os.path.basename(chunks_path)))
+    logger(format_preflight(report, label=os.path.basename(chunks_path)))
+
+    send_to_model = make_gemini_sender(client=client)
+
+    # === Cheapest model first, escalate chunks that fail arithmetic checks ===
+    router = ModelRouter(send_to_model, tiers=model_tiers, logger=logger, expected_keys=EXPECTED_KEYS)
+
+    # === Output containers ===
+    all_extracted = []
+    failed_chunks = []
+
+    # === Gemini extraction loop ===
+    for idx, chunk in enumerate(employee_chunks):
+        if not is_employee_chunk(chunk):
+            print(f"⚠️ Skipping likely header-only chunk #{idx+1}")
+            logger(f"⚠️ Skipping likely header-only chunk #{idx+1}")
+            continue
+
+        prompt_chunk = normalize_block(chunk) if normalize else chunk
+        prompt = build_prompt(prompt_chunk)
 
         try:
             print(f"⏳ Sending employee #{idx+1}...")
             logger(f"⏳ Sending employee #{idx+1}...")
-            res = requests.post(GEMINI_URL, headers=HEADERS, json=body)
-            res.raise_for_status()
-
-            response_data = res.json()
-            raw_output = response_data['candidates'][0]['content']['parts'][0]['text'].strip()
-
-            if raw_output.startswith("```json"):
-                raw_output = raw_output.removeprefix("```json").removesuffix("```").strip()
-            elif raw_output.startswith("```"):
-                raw_output = raw_output.removeprefix("```").removesuffix("```").strip()
-
-            try:
-                parsed = json.loads(raw_output)
-                all_extracted.append(parsed)
-                print(f"✅ Success for employee #{idx+1}")
-                logger(f"✅ Success for employee #{idx+1}")
-            except json.JSONDecodeError as e:
-                print(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
-                logger(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
-                failed_chunks.append({
-                    "index": idx,
-                    "error": "parse_failed",
-                    "raw": raw_output,
-                    "input": chunk
-                })
-
+            parsed, decision = router.extract(idx, prompt, prompt_chunk, chunk)
+            all_extracted.append(parsed)
+            print(f"✅ Success for employee #{idx+1} ({decision['model']})")
+            logger(f"✅ Success for employee #{idx+1} ({decision['model']})")
+        except json.JSONDecodeError as e:
+            print(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
+            logger(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
+            failed_chunks.append({
+                "index": idx,
+                "error": "parse_failed",
+                "raw": e.doc,
+                "input": chunk
+            })
         except Exception as e:
             print(f"❌ Error for employee #{idx+1}: {e}")
             logger(f"❌ Error for employee #{idx+1}: {e}")
@@ -156,6 +198,19 @@ Raw input:
     print(f"✅ Extracted data saved to: {success_path}")
     logger(f"✅ Extracted data saved to: {success_path}")
 
+    routing_path = os.path.join(os.path.dirname(success_path), "routing_log.json")
+    with open(routing_path, "w", encoding="utf-8") as f:
+        json.dump(router.decisions, f, indent=2)
+    print(ModelRouter.summarize(router.decisions))
+    logger(ModelRouter.summarize(router.decisions))
+    if hasattr(send_to_model, "streamer"):
+        print(send_to_model.streamer.report())
+        logger(send_to_model.streamer.report())
+    print(send_to_model.pool.report())
+    logger(send_to_model.pool.report())
+    print(get_output_ceilings().report())
+    logger(get_output_ceilings().report())
+
     if failed_chunks:
         with open(failed_path, "w", encoding="utf-8") as f:
             json.dump(failed_chunks, f, indent=2)
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from src.payroll_fields import NUMERIC_KEYS, to_number
+from src.block_normalizer import estimate_tokens
+from src.truncation import Completion, completion_from_rest
+
+# === Streaming extraction: validate the JSON while it is being generated ===
+# The response is read from streamGenerateContent as it arrives and fed to an
+# incremental checker for the flat extraction object. As soon as the output is
+# clearly wrong (prose instead of JSON, a repeated key, too many unknown or
+# too many keys, a runaway value, non-numbers in numeric fields) the
+# connection is closed, which stops generation, and the request is sent again.
+# Reading also stops as soon as the object closes, so trailing prose is never
+# waited for.
+STREAM_RESPONSES = os.getenv("GEMINI_STREAM", "0") == "1"
+MAX_RESTARTS = 2
+MAX_PREAMBLE_CHARS = 40  # "```json" and a short lead-in are fine; a paragraph is not
+MAX_UNKNOWN_KEYS = 3
+MAX_VALUE_CHARS = 120
+MAX_BAD_NUMBERS = 3
+STREAM_TIMEOUT_SECONDS = 60
+STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse"
+NUMERIC = set(NUMERIC_KEYS)
+
+
+class StreamAborted(Exception):
+    def __init__(self, reason, text, detail=""):
+        super().__init__(f"stream aborted: {reason}" + (f" ({detail})" if detail else ""))
+        self.reason = reason
+        self.text = text
+
+
+# === Incremental checker for one flat JSON object ===
+class IncrementalJsonCheck:
+    # feed(text) returns True once the top-level object has closed and raises
+    # StreamAborted as soon as the text so far cannot become a usable record.
+    # expected_keys=None (re-asks, grammar fallbacks) keeps only the structural checks.
+    def __init__(self, expected_keys=None):
+        self.expected = set(expected_keys) if expected_keys is not None else None
+        self.text = []
+        self.preamble = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False
+        self.token = []  # key or top-level value being read
+        self.key = None
+        self.keys = set()
+        self.unknown = 0
+        self.bad_numbers = 0
+        self.done = False
+
+    def abort(self, reason, detail=""):
+        raise StreamAborted(reason, "".join(self.text), detail)
+
+    def feed(self, text):
+        self.text.append(text)
+        for ch in text:
+            if self.done:
+                break
+            self._step(ch)
+        return self.done
+
+    def _step(self, ch):
+        if self.depth == 0:
+            if ch == "{":
+                self.depth, self.expect_key = 1, True
+            elif not ch.isspace() and ch != "`":
+                self.preamble += 1
+                if self.preamble > MAX_PREAMBLE_CHARS:
+                    self.abort("prose before the JSON object")
+            return
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif ch == "\\":
+                self.escape = True
+            elif ch == '"':
+                self.in_string = False
+            if self.depth == 1:
+                self._append(ch)
+            return
+
+        if ch == '"':
+            self.in_string = True
+        if self.depth > 1 or ch in "{[":
+            self.depth += 1 if ch in "{[" else -1 if ch in "}]" else 0
+            self._append(ch)
+            return
+
+        if self.expect_key:
+            if ch == ":":
+                self._end_key()
+            elif ch == "}":
+                self.done = True  # empty object or trailing comma
+            elif ch != "," and (self.token or not ch.isspace()):
+                self._append(ch)  # quoted or bare key
+        elif ch in ",}":
+            self._end_value()
+            self.expect_key = True
+            self.done = ch == "}"
+        else:
+            self._append(ch)
+
+    def _append(self, ch):
+        self.token.append(ch)
+        if len(self.token) > MAX_VALUE_CHARS:
+            self.abort(f"runaway {'key' if self.expect_key else 'value'}", self.key or "first key")
+
+    def _end_key(self):
+        key = "".join(self.token).strip().strip('"')
+        self.token = []
+        self.expect_key = False
+        if key in self.keys:
+            self.abort("repeated key", key)
+        self.keys.add(key)
+        self.key = key
+        if self.expected is None:
+            return
+        if key not in self.expected:
+            self.unknown += 1
+            if self.unknown > MAX_UNKNOWN_KEYS:
+                self.abort("keys not in the schema", f"{self.unknown}, last: {key}")
+        if len(self.keys) > len(self.expected):
+            self.abort("too many keys", f"more than {len(self.expected)}")
+
+    def _end_value(self):
+        raw = "".join(self.token).strip()
+        self.token = []
+        if self.expected is None or self.key not in NUMERIC or raw in ("null", '""', ""):
+            return
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw
+        if to_number(value) is None:
+            self.bad_numbers += 1
+            if self.bad_numbers > MAX_BAD_NUMBERS:
+                self.abort("non-numbers in numeric fields", f"{self.bad_numbers}, last: {self.key}={raw[:20]}")
+
+
+# === Transports: text pieces of one streamed response ===
+def rest_transport(pool, session=None, timeout=STREAM_TIMEOUT_SECONDS):
+    # pool: src.key_pool.KeyPool; each stream runs on the key with the most headroom
+    def stream(prompt, model_name):
+        import requests
+
+        body = {"contents": [{"parts": [{"text": prompt}]}]}
+        http = session or requests
+        with pool.lease(estimate_tokens(prompt)) as lease:
+            headers = {"x-goog-api-key": lease.key}
+            with http.post(STREAM_URL.format(model=model_name), headers=headers, json=body, stream=True, timeout=timeout) as res:
+                res.raise_for_status()
+                for line in res.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    lease.tokens = (event.get("usageMetadata") or {}).get("totalTokenCount") or lease.tokens
+                    # Each piece carries the finish reason and output tokens reported so far
+                    yield completion_from_rest(event)
+        # leaving the with-blocks early (generator closed on abort) drops the connection
+        # and returns the key to the pool
+
+    return stream
+
+
+def local_transport(responder, piece_chars=16):
+    # responder(prompt, model_name) -> full text, replayed in small pieces (no network)
+    def stream(prompt, model_name):
+        text = responder(prompt, model_name)
+        for i in range(0, len(text), piece_chars):
+            yield text[i:i + piece_chars]
+
+    return stream
+
+
+# === Streamed call with early abort and re-issue ===
+class StreamingExtractor:
+    def __init__(self, transport, max_restarts=MAX_RESTARTS):
+        self.transport = transport
+        self.max_restarts = max_restarts
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "aborts": 0, "gave_up": 0, "early_close": 0, "aborted_chars": 0, "aborted_seconds": 0.0}
+        self.reasons = Counter()
+
+    def generate(self, prompt, model_name, expected_keys=None):
+        # Returns the response text; raises the last StreamAborted once restarts run out
+        with self._lock:
+            self.stats["calls"] += 1
+        runaway = False
+        for attempt in range(self.max_restarts + 1):
+            check = IncrementalJsonCheck(expected_keys)
+            started = time.perf_counter()
+            pieces = self.transport(prompt, model_name)
+            reason = tokens = None
+            try:
+                for piece in pieces:
+                    reason = getattr(piece, "finish_reason", None) or reason
+                    tokens = getattr(piece, "output_tokens", None) or tokens
+                    if check.feed(piece):
+                        with self._lock:
+                            self.stats["early_close"] += 1
+                        break
+                # runaway: an earlier attempt ran away, so this call's length is no guide to the output limit
+                return Completion("".join(check.text), reason, tokens, runaway)
+            except StreamAborted as e:
+                runaway = runaway or e.reason.startswith("runaway")
+                with self._lock:
+                    self.stats["aborts"] += 1
+                    self.stats["aborted_chars"] += len(e.text)
+                    self.stats["aborted_seconds"] += time.perf_counter() - started
+                    self.reasons[e.reason] += 1
+                    if attempt == self.max_restarts:
+                        self.stats["gave_up"] += 1
+                if attempt == self.max_restarts:
+                    raise
+            finally:
+                pieces.close()
+
+    def report(self):
+        s = self.stats
+        reasons = ", ".join(f"{reason} ×{n}" for reason, n in self.reasons.most_common(3)) or "none"
+        avg_chars = s["aborted_chars"] / s["aborts"] if s["aborts"] else 0
+        avg_seconds = s["aborted_seconds"] / s["aborts"] if s["aborts"] else 0
+        return (
+            f"🌊 Streaming: {s['calls']} calls, {s['aborts']} aborted and re-sent ({s['gave_up']} gave up), "
+            f"{s['early_close']} closed at the end of the object | aborts after ~{avg_chars:.0f} chars / "
+            f"{avg_seconds:.1f}s | {reasons}"
+        )
+
+
+def make_streaming_extractor(pool=None, session=None):
+    from src.key_pool import get_key_pool
+
+    return StreamingExtractor(rest_transport(pool or get_key_pool(), session))
@@ -0,0 +1,240 @@
+import csv
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+from src.excel_raw_text_chunk import iter_employee_chunks
+from src.populate_csv_template import merged_headers, fill_row
+from src.profiling import profiled_stage
+
+# === Streaming mode: chunk → extract → CSV without writing intermediate files ===
+# Stages are joined by bounded queues, so a slow stage blocks the one feeding
+# it instead of letting chunks or records pile up in memory. The template CSV
+# is written row by row as soon as that row's employee is extracted; only
+# records that finish ahead of their template row are buffered.
+QUEUE_SIZE = 8
+EXTRACT_WORKERS = 4
+HEADER_ROWS = 10  # template rows 1-10 are titles and the two header rows
+DONE = object()  # end-of-stream marker, one per extraction worker
+
+EMP_ID = re.compile(r"Emp#\s*(\d+)")
+
+
+class StageClock:
+    # Busy seconds per stage, so the summary can compare wall time to the slowest stage
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.busy = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+
+
+class JsonArrayWriter:
+    # Writes a JSON array one element at a time (same file format as json.dump)
+    def __init__(self, path):
+        self.f = open(path, "w", encoding="utf-8")
+        self.count = 0
+        self.f.write("[")
+
+    def append(self, item):
+        self.f.write(",\n" if self.count else "\n")
+        self.f.write("\n".join("  " + line for line in json.dumps(item, indent=2).splitlines()))
+        self.count += 1
+
+    def close(self):
+        self.f.write("\n]" if self.count else "]")
+        self.f.close()
+
+
+@profiled_stage("stream")
+def run_streaming_pipeline(
+    xlsx_path,
+    template_path,
+    success_path,
+    csv_path,
+    failed_path,
+    workers=EXTRACT_WORKERS,
+    queue_size=QUEUE_SIZE,
+    delay_seconds=0,
+    normalize=True,
+    model_tiers=("gemini-2.0-flash-lite", "gemini-2.0-flash"),
+    send_fn=None,
+    chunks=None,
+    client=None,
+    logger=print,
+):
+    # chunks: employee chunks to use instead of reading xlsx_path (one section of a
+    # combined register, see src/register_splitter.py)
+    from src.send_chunk_llm import EXPECTED_KEYS, build_prompt, is_employee_chunk, make_gemini_sender
+    from src.block_normalizer import normalize_block
+    from src.model_router import ModelRouter
+
+    send_fn = send_fn or make_gemini_sender(client=client)
+    router = ModelRouter(send_fn, tiers=model_tiers, logger=logger, expected_keys=EXPECTED_KEYS)
+    clock = StageClock()
+    chunk_q = queue.Queue(maxsize=queue_size)
+    record_q = queue.Queue(maxsize=queue_size)
+    chunked = set()  # Emp# seen by the chunker; complete once chunking_done is set
+    chunking_done = threading.Event()
+    stop = threading.Event()  # the writer failed: chunker and workers wind down without new calls
+    errors = []
+    started = time.perf_counter()
+
+    # === Stage 1: register rows → employee chunks ===
+    def chunk_stage():
+        try:
+            t = time.perf_counter()
+            for idx, chunk in enumerate(chunks if chunks is not None else iter_employee_chunks(xlsx_path)):
+                if stop.is_set():
+                    break
+                if not is_employee_chunk(chunk):
+                    logger(f"⚠️ Skipping likely header-only chunk #{idx+1}")
+                    continue
+                emp = EMP_ID.search(chunk)
+                emp_id = emp.group(1) if emp else None
+                chunked.add(emp_id)
+                clock.add("chunk", time.perf_counter() - t)
+                chunk_q.put((idx, emp_id, chunk))  # blocks while extraction is behind
+                t = time.perf_counter()
+            clock.add("chunk", time.perf_counter() - t)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunking_done.set()
+            for _ in range(workers):
+                chunk_q.put(DONE)
+
+    # === Stage 2: chunk → validated record (router escalates on failed checks) ===
+    def extract_stage():
+        while True:
+            item = chunk_q.get()
+            if item is DONE:
+                record_q.put(DONE)
+                return
+            if stop.is_set():
+                continue
+            idx, emp_id, chunk = item
+            t = time.perf_counter()
+            prompt_chunk = normalize_block(chunk) if normalize else chunk
+            try:
+                parsed, decision = router.extract(idx, build_prompt(prompt_chunk), prompt_chunk, chunk)
+                outcome = ("success", emp_id, parsed)
+                logger(f"✅ Success for employee #{idx+1} ({decision['model']})")
+            except json.JSONDecodeError as e:
+                outcome = ("failed", emp_id, {"index": idx, "error": "parse_failed", "raw": e.doc, "input": chunk})
+                logger(f"⚠️ JSON parse failed for employee #{idx+1}: {e}")
+            except Exception as e:
+                outcome = ("failed", emp_id, {"index": idx, "error": str(e), "input": chunk})
+                logger(f"❌ Error for employee #{idx+1}: {e}")
+            clock.add("extract", time.perf_counter() - t)
+            record_q.put(outcome)  # blocks while the writer is behind
+            if delay_seconds:
+                time.sleep(delay_seconds)
+
+    threads = [threading.Thread(target=chunk_stage, name="stream-chunk", daemon=True)]
+    threads += [threading.Thread(target=extract_stage, name=f"stream-extract-{i + 1}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    # === Stage 3 (this thread): records → extracted JSON + template CSV, in template order ===
+    ready = {}  # Emp# → record that arrived before its template row
+    settled = set()  # Emp# that failed (their template row is written unfilled)
+    failed_chunks = []
+    stats = {"success": 0, "failed": 0, "max_buffered": 0}
+    workers_left = workers
+    extracted = JsonArrayWriter(success_path)
+
+    def take_one():
+        nonlocal workers_left
+        outcome = record_q.get()
+        t = time.perf_counter()
+        if outcome is DONE:
+            workers_left -= 1
+            return
+        status, emp_id, data = outcome
+        stats[status] += 1
+        if status == "success":
+            extracted.append(data)
+            ready[emp_id or str(data.get("Emp#"))] = data
+            stats["max_buffered"] = max(stats["max_buffered"], len(ready))
+        else:
+            failed_chunks.append(data)
+            settled.add(emp_id)
+        clock.add("write", time.perf_counter() - t)
+
+    def still_coming(emp_num):
+        if emp_num in ready or emp_num in settled or workers_left == 0:
+            return False
+        return not (chunking_done.is_set() and emp_num not in chunked)
+
+    try:
+        with open(template_path, newline="", encoding="utf-8") as src, \
+                open(csv_path, "w", newline="", encoding="utf-8") as out:
+            writer = csv.writer(out)
+            header_index_map = {}
+            header_rows = []
+            for i, row in enumerate(csv.reader(src)):
+                if i < HEADER_ROWS:
+                    header_rows.append(row)
+                    writer.writerow(row)
+                    if i == HEADER_ROWS - 1:
+                        header_index_map = {col: j for j, col in enumerate(merged_headers(*header_rows[8:10]))}
+                    continue
+                emp_num = row[0].strip() if row else ""
+                if emp_num.isdigit():
+                    while still_coming(emp_num):
+                        take_one()
+                    if emp_num in ready:
+                        t = time.perf_counter()
+                        fill_row(row, header_index_map, ready.pop(emp_num))
+                        clock.add("write", time.perf_counter() - t)
+                writer.writerow(row)
+                out.flush()
+
+        # Employees on the register but not on the template still go to the JSON
+        while workers_left:
+            take_one()
+    except BaseException:
+        # Unblock the stages before re-raising, or they wait on record_q forever
+        stop.set()
+        while workers_left:
+            if record_q.get() is DONE:
+                workers_left -= 1
+        raise
+    finally:
+        extracted.close()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    if ready:
+        logger(f"⚠️ {len(ready)} employee(s) not on the CSV template: {', '.join(sorted(ready))}")
+    if failed_chunks:
+        with open(failed_path, "w", encoding="utf-8") as f:
+            json.dump(failed_chunks, f, indent=2)
+        logger(f"⚠️ Failed chunks saved to: {failed_path}")
+
+    routing_path = os.path.join(os.path.dirname(success_path), "routing_log.json")
+    with open(routing_path, "w", encoding="utf-8") as f:
+        json.dump(router.decisions, f, indent=2)
+    logger(ModelRouter.summarize(router.decisions))
+    if hasattr(send_fn, "streamer"):
+        logger(send_fn.streamer.report())
+    if hasattr(send_fn, "pool"):
+        logger(send_fn.pool.report())
+
+    wall = time.perf_counter() - started
+    # extraction runs on several threads at once, so its share of the wall clock is busy / workers
+    stages = dict(clock.busy, extract=clock.busy.get("extract", 0.0) / workers)
+    logger(
+        f"🌊 Streamed {stats['success']} employee(s) ({stats['failed']} failed) in {wall:.1f}s | "
+        + " | ".join(f"{name} {seconds:.1f}s" for name, seconds in stages.items())
+        + f" | at most {stats['max_buffered']} record(s) buffered"
+    )
+    return {"json": success_path, "csv": csv_path, "wall_seconds": wall, "stage_seconds": stages, **stats}
@@ -0,0 +1,314 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+
+from src.scheduler import folder_pay_info, grace_cutoff
+
+# === Shared SQLite task queue: one task per (folder, Emp#) ===
+# Any number of worker processes, on this node or on others that mount the
+# same volume, claim tasks under a lease. Workers heartbeat to extend their
+# leases; a lease that runs out (crashed or partitioned worker) makes the task
+# claimable again. Results are committed once per (folder, Emp#): the first
+# commit wins, so a task that ran twice never produces two records.
+#
+# Claims follow src/scheduler.py: payrolls that are due go earliest pay date
+# first; past-due backfill is shared between clients by how many of each
+# client's tasks are already leased.
+#
+# Uses the rollback journal rather than WAL: WAL needs shared memory and does
+# not work across machines on a network volume.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    folder TEXT NOT NULL,
+    emp_id TEXT NOT NULL,
+    block TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    enqueued REAL NOT NULL,
+    updated REAL NOT NULL,
+    error TEXT,
+    client TEXT,
+    pay_date TEXT,
+    position INTEGER,
+    PRIMARY KEY (folder, emp_id)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, lease_expires, enqueued);
+CREATE INDEX IF NOT EXISTS tasks_client ON tasks (client, status);
+CREATE TABLE IF NOT EXISTS results (
+    folder TEXT NOT NULL,
+    emp_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    source TEXT,
+    routing TEXT,
+    data TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    committed REAL NOT NULL,
+    PRIMARY KEY (folder, emp_id)
+);
+CREATE INDEX IF NOT EXISTS results_committed ON results (committed);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    started REAL NOT NULL,
+    last_heartbeat REAL NOT NULL,
+    committed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+DEFAULT_DB = "Data/queue/tasks.sqlite"
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+
+def worker_identity():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TaskQueue:
+    def __init__(self, path=DEFAULT_DB, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across threads and processes
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return _Transaction(db)
+
+    # === Producer side ===
+    def enqueue(self, folder, employees, force=False):
+        # employees: [{"Emp#", "Block"}] in register order; already-known (folder, Emp#) pairs are left
+        # alone, unless force: then they go back to pending with fresh attempts and their old result is dropped
+        now = time.time()
+        client, pay_date = folder_pay_info(folder)
+        pay_date = pay_date.isoformat() if pay_date else None
+        rows = [
+            (folder, str(emp.get("Emp#", "unknown")), emp.get("Block", ""), now, now, client, pay_date, position)
+            for position, emp in enumerate(employees)
+        ]
+        with self._connect() as db:
+            before = db.total_changes
+            if force:
+                db.executemany(
+                    """INSERT INTO tasks (folder, emp_id, block, enqueued, updated, client, pay_date, position)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (folder, emp_id) DO UPDATE SET
+                           block = excluded.block, position = excluded.position, status = 'pending', attempts = 0, lease_owner = NULL,
+                           lease_expires = NULL, error = NULL, enqueued = excluded.enqueued, updated = excluded.updated""",
+                    rows,
+                )
+                queued = db.total_changes - before
+                db.executemany("DELETE FROM results WHERE folder = ? AND emp_id = ?", [row[:2] for row in rows])
+                return queued
+            db.executemany(
+                """INSERT OR IGNORE INTO tasks (folder, emp_id, block, enqueued, updated, client, pay_date, position)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            return db.total_changes - before
+
+    # === Worker side ===
+    def register_worker(self, worker_id):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, host, started, last_heartbeat) VALUES (?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), now, now),
+            )
+
+    def claim(self, worker_id, limit=1):
+        # Pending tasks, or leased ones whose lease ran out, in scheduler order:
+        # tier (due, backfill, unknown) → due: earliest pay date, then the client
+        # with the fewest live leases; backfill: fewest live leases, then oldest
+        now = time.time()
+        cutoff = grace_cutoff().isoformat()
+        with self._connect() as db:
+            # A lease that ran out on its last allowed attempt is given up, not handed out again
+            db.execute(
+                """UPDATE tasks SET status = 'failed', lease_owner = NULL, lease_expires = NULL, updated = ?,
+                   error = COALESCE(error, 'lease expired on attempt ' || attempts)
+                   WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                (now, now, self.max_attempts),
+            )
+            rows = db.execute(
+                """SELECT folder, emp_id, block, attempts,
+                          CASE WHEN pay_date IS NULL THEN 2 WHEN pay_date >= ? THEN 0 ELSE 1 END AS tier,
+                          (SELECT COUNT(*) FROM tasks AS held WHERE held.client = tasks.client
+                             AND held.status = 'leased' AND held.lease_expires >= ?) AS in_flight
+                   FROM tasks
+                   WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                   ORDER BY tier, CASE WHEN tier = 0 THEN pay_date END, in_flight, pay_date,
+                            enqueued, folder, emp_id
+                   LIMIT ?""",
+                (cutoff, now, now, limit),
+            ).fetchall()
+            for row in rows:
+                db.execute(
+                    """UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?,
+                       attempts = attempts + 1, updated = ? WHERE folder = ? AND emp_id = ?""",
+                    (worker_id, now + self.lease_seconds, now, row["folder"], row["emp_id"]),
+                )
+        return [
+            {"folder": r["folder"], "Emp#": r["emp_id"], "Block": r["block"], "attempt": r["attempts"] + 1}
+            for r in rows
+        ]
+
+    def heartbeat(self, worker_id):
+        # Extends every lease this worker holds; returns how many are still held
+        now = time.time()
+        with self._connect() as db:
+            db.execute("UPDATE workers SET last_heartbeat = ? WHERE worker_id = ?", (now, worker_id))
+            cur = db.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE lease_owner = ? AND status = 'leased'",
+                (now + self.lease_seconds, worker_id),
+            )
+            return cur.rowcount
+
+    def commit(self, worker_id, folder, emp_id, status, data, source=None, routing=None):
+        # Idempotent per (folder, Emp#): returns False when another attempt already committed.
+        # routing: the ModelRouter decision behind this record, kept for the folder's routing_log.json
+        now = time.time()
+        with self._connect() as db:
+            cur = db.execute(
+                """INSERT OR IGNORE INTO results (folder, emp_id, status, source, routing, data, worker, committed)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (folder, emp_id, status, source, json.dumps(routing) if routing else None, json.dumps(data), worker_id, now),
+            )
+            landed = cur.rowcount == 1
+            db.execute(
+                """UPDATE tasks SET status = 'done', lease_owner = NULL, lease_expires = NULL, error = NULL,
+                   updated = ? WHERE folder = ? AND emp_id = ?""",
+                (now, folder, emp_id),
+            )
+            if landed:
+                db.execute("UPDATE workers SET committed = committed + 1 WHERE worker_id = ?", (worker_id,))
+            return landed
+
+    def release(self, worker_id, folder, emp_id, error):
+        # Transport-level failure: retry later, or give up after max_attempts
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                """UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                   lease_owner = NULL, lease_expires = NULL, error = ?, updated = ?
+                   WHERE folder = ? AND emp_id = ? AND lease_owner = ?""",
+                (self.max_attempts, error, now, folder, emp_id, worker_id),
+            )
+
+    # === Folder assembly ===
+    def folder_complete(self, folder):
+        with self._connect() as db:
+            open_tasks = db.execute(
+                "SELECT COUNT(*) FROM tasks WHERE folder = ? AND status IN ('pending', 'leased')", (folder,)
+            ).fetchone()[0]
+        return open_tasks == 0
+
+    def folder_results(self, folder):
+        # In register order (the folder's employee_data.json), like the other extraction paths
+        with self._connect() as db:
+            rows = db.execute(
+                """SELECT results.emp_id, results.status, results.routing, results.data FROM results
+                   LEFT JOIN tasks USING (folder, emp_id)
+                   WHERE results.folder = ? ORDER BY tasks.position, results.rowid""",
+                (folder,),
+            ).fetchall()
+            given_up = db.execute(
+                "SELECT emp_id, block, error FROM tasks WHERE folder = ? AND status = 'failed' ORDER BY position",
+                (folder,),
+            ).fetchall()
+        grouped = {"success": [], "failed": [], "skipped": [], "routing": []}
+        for row in rows:
+            grouped[row["status"]].append(json.loads(row["data"]))
+            if row["routing"]:
+                grouped["routing"].append(json.loads(row["routing"]))
+        for row in given_up:
+            grouped["failed"].append({"Emp#": row["emp_id"], "error": row["error"], "raw_input": row["block"]})
+        return grouped
+
+    def requeue_failed(self, folder=None):
+        now = time.time()
+        with self._connect() as db:
+            cur = db.execute(
+                """UPDATE tasks SET status = 'pending', attempts = 0, error = NULL, updated = ?
+                   WHERE status = 'failed' AND (? IS NULL OR folder = ?)""",
+                (now, folder, folder),
+            )
+            return cur.rowcount
+
+    # === Status ===
+    def status(self, window_seconds=300, heartbeat_grace=None):
+        now = time.time()
+        heartbeat_grace = heartbeat_grace or self.lease_seconds
+        with self._connect() as db:
+            by_status = dict(db.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+            expired = db.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = 'leased' AND lease_expires < ?", (now,)
+            ).fetchone()[0]
+            oldest = db.execute("SELECT MIN(enqueued) FROM tasks WHERE status = 'pending'").fetchone()[0]
+            recent = db.execute(
+                "SELECT COUNT(*) FROM results WHERE committed >= ?", (now - window_seconds,)
+            ).fetchone()[0]
+            folders = db.execute(
+                """SELECT folder, COUNT(*) AS total, SUM(status = 'done') AS done, SUM(status = 'failed') AS failed
+                   FROM tasks GROUP BY folder ORDER BY folder"""
+            ).fetchall()
+            workers = db.execute(
+                "SELECT worker_id, last_heartbeat, committed FROM workers WHERE last_heartbeat >= ? ORDER BY worker_id",
+                (now - heartbeat_grace,),
+            ).fetchall()
+        return {
+            "pending": by_status.get("pending", 0),
+            "leased": by_status.get("leased", 0) - expired,
+            "expired_leases": expired,
+            "done": by_status.get("done", 0),
+            "failed": by_status.get("failed", 0),
+            "oldest_pending_seconds": round(now - oldest, 1) if oldest else 0.0,
+            "throughput_per_min": round(recent / (window_seconds / 60), 2),
+            "folders": [dict(row) for row in folders],
+            "workers": [
+                {"worker": w["worker_id"], "committed": w["committed"], "seen_seconds_ago": round(now - w["last_heartbeat"], 1)}
+                for w in workers
+            ],
+        }
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front so two claimers never pick the same rows
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.db.close()
+
+
+def format_status(status):
+    lines = [
+        f"📊 Queue: {status['pending']} pending | {status['leased']} leased | "
+        f"{status['expired_leases']} expired leases | {status['done']} done | {status['failed']} failed",
+        f"   ⏱️ {status['throughput_per_min']}/min over the last window | oldest pending {status['oldest_pending_seconds']}s",
+    ]
+    for f in status["folders"]:
+        lines.append(f"   📂 {f['folder']}: {f['done']}/{f['total']} done, {f['failed']} failed")
+    for w in status["workers"]:
+        lines.append(f"   👷 {w['worker']}: {w['committed']} committed, last heartbeat {w['seen_seconds_ago']}s ago")
+    if not status["workers"]:
+        lines.append("   👷 no live workers")
+    return "\n".join(lines)
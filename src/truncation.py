@@ -0,0 +1,275 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from src.block_normalizer import estimate_tokens
+from src.json_repair import loads_tolerant, locate_json_object, strip_code_fences, build_reask_prompt
+
+# === Responses cut at the output-token limit ===
+# A response that stops on MAX_TOKENS is not retried as-is: the same prompt
+# would be cut at the same place again. The members that were complete before
+# the cut are kept and only the missing keys are asked for, in requests sized
+# to fit under the limit (halved again if one is still cut). Per client, recent
+# cuts (output tokens, keys received, block size) and recent full responses that
+# fit are kept as samples, so later wide employees are asked in parts up front
+# instead of failing at full size first. Samples expire, so a raised limit or a
+# changed register layout is picked up again.
+CEILINGS_PATH = os.path.join("Data", "output_ceilings.json")
+HEADROOM = 0.8  # plan parts to use at most this share of the learned ceiling
+MIN_KEYS_PER_REQUEST = 4
+MIN_CUTS = 3  # cuts needed before employees are split up front
+MAX_SAMPLES = 50  # per client and kind; the oldest go first
+SAMPLE_TTL_SECONDS = 14 * 24 * 3600
+TRUNCATED_REASONS = {"MAX_TOKENS"}
+
+
+class Completion(str):
+    # Response text that also says why generation stopped and how many tokens it produced.
+    # runaway: the stream checker had to abort this call (src/stream_extract.py), so its
+    # length says nothing about the output limit
+    def __new__(cls, text, finish_reason=None, output_tokens=None, runaway=False):
+        self = super().__new__(cls, text or "")
+        self.finish_reason = finish_reason
+        self.output_tokens = output_tokens
+        self.runaway = runaway
+        return self
+
+    def strip(self, chars=None):
+        return Completion(str.strip(self, chars), self.finish_reason, self.output_tokens, self.runaway)
+
+
+def finish_reason_name(reason):
+    # SDK enum (FinishReason.MAX_TOKENS), REST string ("MAX_TOKENS") or None
+    if reason is None:
+        return None
+    return (getattr(reason, "name", None) or str(reason)).rsplit(".", 1)[-1]
+
+
+def completion_from_rest(data):
+    candidate = (data.get("candidates") or [{}])[0]
+    text = "".join(part.get("text", "") for part in candidate.get("content", {}).get("parts", []))
+    usage = data.get("usageMetadata") or {}
+    return Completion(text, finish_reason_name(candidate.get("finishReason")), usage.get("candidatesTokenCount"))
+
+
+def completion_from_sdk(response):
+    candidates = getattr(response, "candidates", None) or []
+    reason = finish_reason_name(getattr(candidates[0], "finish_reason", None)) if candidates else None
+    try:
+        text = response.text
+    except ValueError:
+        # .text refuses responses that stopped early; read the parts that did arrive
+        parts = getattr(getattr(candidates[0], "content", None), "parts", []) if candidates else []
+        text = "".join(getattr(part, "text", "") for part in parts)
+    usage = getattr(response, "usage_metadata", None)
+    return Completion(text, reason, getattr(usage, "candidates_token_count", None))
+
+
+def is_truncated(output):
+    reason = getattr(output, "finish_reason", None)
+    if reason is not None:
+        return reason in TRUNCATED_REASONS
+    # No metadata (plain text, e.g. a replayed response): an object that opens but never closes was cut
+    located = locate_json_object(strip_code_fences(str(output)))
+    return located is not None and not located.rstrip().endswith("}")
+
+
+def _loads_or_empty(output):
+    try:
+        parsed = loads_tolerant(output)
+    except json.JSONDecodeError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+# === What each client's employees cost in output tokens ===
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[int((len(values) - 1) * q)] if values else None
+
+
+class OutputCeilings:
+    def __init__(self, path=CEILINGS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.clients = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                # Entries from before samples were kept (single min/max values) are dropped
+                self.clients = {c: e for c, e in json.load(f).items() if "cuts" in e}
+        self.stats = Counter()
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.clients, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def _entry(self, client, now=None):
+        # The client's samples, without the expired ones; None when there are none
+        entry = self.clients.get(client or "default")
+        if not entry:
+            return None
+        cutoff = (now or time.time()) - SAMPLE_TTL_SECONDS
+        for kind in ("cuts", "fits"):
+            entry[kind] = [sample for sample in entry[kind] if sample["at"] >= cutoff]
+        return entry if entry["cuts"] or entry["fits"] else None
+
+    def observe(self, client, output, keys_received, chunk, full=True):
+        # One response: output tokens (from usage metadata) vs. the members it held.
+        # full: the response to the whole schema (its block size says whether the
+        # employee fits); part requests only teach what a key costs.
+        truncated = is_truncated(output)
+        tokens = getattr(output, "output_tokens", None)
+        with self._lock:
+            self.stats["responses"] += 1
+            if truncated:
+                self.stats["truncated"] += 1
+            if getattr(output, "runaway", False):
+                self.stats["runaway"] += 1
+                return  # aborted for running away, not for the limit
+            now = time.time()
+            entry = self._entry(client, now)
+            if not truncated:
+                # A fit only counts against cuts of narrower blocks (see is_wide)
+                narrowest = min((c["block"] for c in entry["cuts"] if c["block"]), default=None) if entry else None
+                block = estimate_tokens(chunk) if full and narrowest else None
+                if block is None or block < narrowest:
+                    return
+                entry["fits"].append({"at": now, "block": block})
+            else:
+                entry = entry or {"cuts": [], "fits": []}
+                self.clients[client or "default"] = entry
+                entry["cuts"].append({
+                    "at": now, "tokens": tokens, "keys": keys_received or None,
+                    "block": estimate_tokens(chunk) if full else None,
+                })
+            for kind in ("cuts", "fits"):
+                entry[kind] = entry[kind][-MAX_SAMPLES:]
+            self._save()
+
+    def keys_per_request(self, client):
+        # Keys one request can ask for under the learned ceiling; None when nothing was cut lately
+        entry = self._entry(client)
+        cuts = entry["cuts"] if entry else []
+        ceiling = _median([c["tokens"] for c in cuts if c["tokens"]])
+        per_key = _median([c["tokens"] / c["keys"] for c in cuts if c["tokens"] and c["keys"]])
+        if ceiling and per_key:
+            fit = ceiling / per_key
+        elif any(c["keys"] for c in cuts):
+            fit = _quantile([c["keys"] for c in cuts if c["keys"]], 0.25)
+        else:
+            return None
+        return max(MIN_KEYS_PER_REQUEST, int(fit * HEADROOM))
+
+    def is_wide(self, client, chunk):
+        # At least MIN_CUTS recent full responses for blocks no wider than this one
+        # were cut, and more of them than fit for blocks at least this wide
+        entry = self._entry(client)
+        if not entry:
+            return False
+        block = estimate_tokens(chunk)
+        cut = sum(1 for c in entry["cuts"] if c["block"] and c["block"] <= block)
+        fit = sum(1 for f in entry["fits"] if f["block"] >= block)
+        return cut >= MIN_CUTS and cut > fit
+
+    def report(self):
+        s = self.stats
+        learned = []
+        for client in sorted(self.clients):
+            entry = self._entry(client)
+            if entry and entry["cuts"]:
+                ceiling = _median([c["tokens"] for c in entry["cuts"] if c["tokens"]]) or "?"
+                learned.append(
+                    f"{client}: {len(entry['cuts'])} cut(s) lately at ~{ceiling} tok, {self.keys_per_request(client)} keys/request"
+                )
+        runaway = f", {s['runaway']} runaway response(s) not learned from" if s["runaway"] else ""
+        return (
+            f"✂️ Output limit: {s['truncated']}/{s['responses']} responses cut{runaway}, {s['split_up_front']} wide employee(s) "
+            f"asked in parts up front, {s['part_requests']} part request(s), {s['halved']} part(s) halved | "
+            f"{', '.join(learned) or 'no ceilings learned'}"
+        )
+
+
+_ceilings = None
+_ceilings_lock = threading.Lock()
+
+
+def get_output_ceilings():
+    # One shared instance per process, so both pipelines update the same file
+    global _ceilings
+    with _ceilings_lock:
+        if _ceilings is None:
+            _ceilings = OutputCeilings()
+        return _ceilings
+
+
+# === Ask for a set of keys in parts that fit ===
+def extract_in_parts(ask, chunk, keys, per_request, ceilings=None, client=None):
+    # ask(prompt) -> response text (ideally a Completion). Returns {key: value}
+    # for every key asked; keys still missing at the end are None, like a re-ask.
+    per_request = max(MIN_KEYS_PER_REQUEST, per_request or len(keys))
+    pending = [keys[i:i + per_request] for i in range(0, len(keys), per_request)]
+    parsed = {}
+    while pending:
+        part = pending.pop(0)
+        output = ask(build_reask_prompt(chunk, part))
+        try:
+            patch = loads_tolerant(output)
+        except json.JSONDecodeError:
+            if not is_truncated(output):
+                raise  # a complete answer that is not JSON: the call failed, not the limit
+            patch = {}
+        if ceilings is not None:
+            ceilings.observe(client, output, len(patch), chunk, full=False)
+            with ceilings._lock:
+                ceilings.stats["part_requests"] += 1
+        for key in part:
+            if key in patch:
+                parsed[key] = patch[key]
+        rest = [key for key in part if key not in patch]
+        if rest and is_truncated(output) and len(rest) > 1:
+            # Still cut: what is left goes again as two halves
+            half = (len(rest) + 1) // 2
+            pending[:0] = [rest[:half], rest[half:]]
+            if ceilings is not None:
+                with ceilings._lock:
+                    ceilings.stats["halved"] += 1
+            continue
+        for key in rest:
+            parsed[key] = None
+    return parsed
+
+
+def extract_with_ceiling(ask_full, ask, chunk, expected_keys, ceilings, client=None, strict=False):
+    # ask_full() -> response to the full-schema prompt; ask(prompt) -> response.
+    # Wide employees of a client that has been cut before are asked in parts
+    # right away; otherwise the full response is used and, when it was cut,
+    # only the keys it did not finish are asked for, in parts. strict: a response
+    # that was not cut is decoded as-is (errors raise, no re-ask for missing keys).
+    if ceilings.is_wide(client, chunk):
+        with ceilings._lock:
+            ceilings.stats["split_up_front"] += 1
+        return extract_in_parts(ask, chunk, list(expected_keys), ceilings.keys_per_request(client), ceilings, client)
+
+    output = ask_full()
+    if strict and not is_truncated(output):
+        ceilings.observe(client, output, None, chunk)
+        return loads_tolerant(output)
+    parsed = _loads_or_empty(output)
+    ceilings.observe(client, output, len(parsed), chunk)
+    missing = [key for key in expected_keys if key not in parsed]
+    if missing:
+        per_request = ceilings.keys_per_request(client) if is_truncated(output) else len(missing)
+        parsed.update(extract_in_parts(ask, chunk, missing, per_request, ceilings, client))
+    return parsed
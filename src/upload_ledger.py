@@ -0,0 +1,214 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# === Upload ledger: what was submitted to Payroll Relief, and how it went ===
+# One row per (client, pay period, pay date, CSV content hash). A period whose
+# current CSV was already uploaded is skipped on the next run; a CSV that was
+# regenerated with different content counts as new and goes up again. Failed
+# uploads wait out a backoff (doubling per attempt) and are given up after
+# MAX_ATTEMPTS until `cli.py uploads --retry-failed`. Same SQLite setup as the
+# task queue (src/task_queue.py): short-lived connections, rollback journal.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    client TEXT NOT NULL,
+    pay_period TEXT NOT NULL,
+    pay_date TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    next_attempt REAL,
+    error TEXT,
+    PRIMARY KEY (client, pay_period, pay_date, content_hash)
+);
+CREATE INDEX IF NOT EXISTS uploads_period ON uploads (client, pay_period, pay_date, status);
+"""
+
+DEFAULT_DB = "Data/queue/uploads.sqlite"
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 60  # after the first failure; doubles per attempt
+MAX_BACKOFF_SECONDS = 3600
+STALE_SECONDS = 1800  # an upload still 'uploading' this long after it started was interrupted
+
+
+def content_hash(path):
+    # Line endings are normalized: a CSV regenerated on another OS is the same upload
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read().replace(b"\r\n", b"\n")).hexdigest()
+
+
+def backoff_seconds(attempts):
+    return min(BACKOFF_SECONDS * 2 ** max(attempts - 1, 0), MAX_BACKOFF_SECONDS)
+
+
+def _key(rec):
+    return (rec["CLIENT"], rec["PAY_PERIOD"], rec["PAY_DATE"], rec["HASH"])
+
+
+class UploadLedger:
+    def __init__(self, path=DEFAULT_DB, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    def _connect(self):
+        from src.task_queue import _Transaction
+
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return _Transaction(db)
+
+    # === Which records still need the browser ===
+    def plan(self, records, now=None, force=False, record=True):
+        # Returns (to_run, skipped); to_run records gain "HASH", skipped ones also "REASON".
+        # force: nothing is skipped; record=False: look only (dry runs)
+        now = now or time.time()
+        to_run, skipped = [], []
+        with self._connect() as db:
+            for rec in records:
+                rec = dict(rec, HASH=content_hash(rec["FILE_PATH"]))
+                row = db.execute(
+                    "SELECT * FROM uploads WHERE client = ? AND pay_period = ? AND pay_date = ? AND content_hash = ?",
+                    _key(rec),
+                ).fetchone()
+                reason = None if force else self._skip_reason(row, now)
+                if reason:
+                    skipped.append(dict(rec, REASON=reason))
+                    continue
+                if row is None:
+                    uploaded_before = db.execute(
+                        "SELECT 1 FROM uploads WHERE client = ? AND pay_period = ? AND pay_date = ? AND status = 'uploaded'",
+                        _key(rec)[:3],
+                    ).fetchone()
+                    if uploaded_before:
+                        rec["CHANGED"] = True  # an earlier version of this period went up; this one differs
+                if row is None and record:
+                    db.execute(
+                        """INSERT INTO uploads (client, pay_period, pay_date, content_hash, file_path, first_seen)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        _key(rec) + (rec["FILE_PATH"], now),
+                    )
+                to_run.append(rec)
+        return to_run, skipped
+
+    def _skip_reason(self, row, now):
+        if row is None:
+            return None
+        if row["status"] == "uploaded":
+            return f"already uploaded {datetime.fromtimestamp(row['finished']):%Y-%m-%d %H:%M}"
+        if row["status"] == "uploading" and now - (row["started"] or 0) < STALE_SECONDS:
+            return "upload in progress elsewhere"
+        if row["status"] == "failed":
+            if row["attempts"] >= self.max_attempts:
+                return f"gave up after {row['attempts']} attempts (--retry-failed to try again): {row['error']}"
+            if row["next_attempt"] and row["next_attempt"] > now:
+                return f"failed {row['attempts']}×, next attempt in {row['next_attempt'] - now:.0f}s"
+        return None
+
+    # === One upload ===
+    def start(self, rec):
+        with self._connect() as db:
+            db.execute(
+                """UPDATE uploads SET status = 'uploading', attempts = attempts + 1, started = ?, error = NULL
+                   WHERE client = ? AND pay_period = ? AND pay_date = ? AND content_hash = ?""",
+                (time.time(),) + _key(rec),
+            )
+
+    def succeed(self, rec):
+        with self._connect() as db:
+            db.execute(
+                """UPDATE uploads SET status = 'uploaded', finished = ?, next_attempt = NULL
+                   WHERE client = ? AND pay_period = ? AND pay_date = ? AND content_hash = ?""",
+                (time.time(),) + _key(rec),
+            )
+
+    def unconfirmed(self, rec, note):
+        # The bot finished without confirming the upload: nothing is recorded as
+        # uploaded and the period stays due for the next run
+        with self._connect() as db:
+            db.execute(
+                """UPDATE uploads SET status = 'pending', finished = ?, next_attempt = NULL, error = ?
+                   WHERE client = ? AND pay_period = ? AND pay_date = ? AND content_hash = ?""",
+                (time.time(), note) + _key(rec),
+            )
+
+    def fail(self, rec, error):
+        # Returns when the record may be tried again, or None once it has run out of attempts
+        now = time.time()
+        with self._connect() as db:
+            attempts = db.execute(
+                "SELECT attempts FROM uploads WHERE client = ? AND pay_period = ? AND pay_date = ? AND content_hash = ?",
+                _key(rec),
+            ).fetchone()[0]
+            retry_at = now + backoff_seconds(attempts) if attempts < self.max_attempts else None
+            db.execute(
+                """UPDATE uploads SET status = 'failed', finished = ?, next_attempt = ?, error = ?
+                   WHERE client = ? AND pay_period = ? AND pay_date = ? AND content_hash = ?""",
+                (now, retry_at, error) + _key(rec),
+            )
+        return retry_at
+
+    def mark_uploaded(self, rec):
+        # Record a CSV as uploaded without running the bot (submitted by hand)
+        rec = dict(rec, HASH=content_hash(rec["FILE_PATH"]))
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                """INSERT INTO uploads (client, pay_period, pay_date, content_hash, file_path, status, first_seen, finished)
+                   VALUES (?, ?, ?, ?, ?, 'uploaded', ?, ?)
+                   ON CONFLICT DO UPDATE SET status = 'uploaded', finished = excluded.finished, error = NULL""",
+                _key(rec) + (rec["FILE_PATH"], now, now),
+            )
+        return rec
+
+    def retry_failed(self, pay_date=None):
+        with self._connect() as db:
+            cur = db.execute(
+                """UPDATE uploads SET status = 'pending', attempts = 0, next_attempt = NULL, error = NULL
+                   WHERE status IN ('failed', 'uploading') AND (? IS NULL OR pay_date = ?)""",
+                (pay_date, pay_date),
+            )
+            return cur.rowcount
+
+    def is_empty(self):
+        with self._connect() as db:
+            return db.execute("SELECT 1 FROM uploads LIMIT 1").fetchone() is None
+
+    def rows(self):
+        with self._connect() as db:
+            return [dict(row) for row in db.execute(
+                "SELECT * FROM uploads ORDER BY client, pay_date, first_seen"
+            ).fetchall()]
+
+
+def format_ledger(rows):
+    icons = {"uploaded": "✅", "failed": "❌", "uploading": "⏳", "pending": "🕓"}
+    lines = []
+    for row in rows:
+        when = datetime.fromtimestamp(row["finished"] or row["started"] or row["first_seen"])
+        error = f" | {row['error']}" if row["error"] else ""
+        lines.append(
+            f"{icons.get(row['status'], '•')} {row['client']} | {row['pay_period']} → {row['pay_date']} | "
+            f"{row['content_hash'][:10]} | {row['status']} ({row['attempts']} attempt(s)) {when:%Y-%m-%d %H:%M}{error}"
+        )
+    counts = {}
+    for row in rows:
+        counts[row["status"]] = counts.get(row["status"], 0) + 1
+    lines.append("📒 Upload ledger: " + (", ".join(f"{n} {s}" for s, n in sorted(counts.items())) or "empty"))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_ledger(UploadLedger(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB).rows()))
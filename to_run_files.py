@@ -1,7 +1,9 @@
 import os
 import re
+import time
 from datetime import datetime
-from agent_project.agents import run_upload_bot  # 👈 Your existing bot
+
+from src.profiling import profiled_stage
 
 BASE_DIR = "Extracted"
 CLIENT = "NewBaltimo"
@@ -43,14 +45,37 @@ def log_failure(record, error):
     with open(LOG_FILE, "a") as f:
         f.write(f"❌ Failed for {record['PAY_DATE']} ({record['PAY_PERIOD']}): {error}\n")
 
-if __name__ == "__main__":
-    records = get_records_to_run()
-
-    # Skip the first record (index 0)
-    records_to_run = records[1:]
+@profiled_stage("upload")
+def run_uploads(records_to_run, profile_name=None, ledger=None, force=False):
+    # Only records the upload ledger has not seen succeed (same period, same CSV
+    # content) go to the browser; failures go back in the queue after a backoff.
+    # force: upload everything given, whatever the ledger says.
+    from agent_project.agents import run_upload_bot  # 👈 Your existing bot (imports Playwright)
+    from src.scheduler import order_records
+    from src.upload_ledger import UploadLedger
 
-    for rec in records_to_run:
-        print(f"\n▶️ Running upload for: {rec['PAY_PERIOD']} → {rec['PAY_DATE']}")
+    ledger = ledger or UploadLedger()
+    if ledger.is_empty() and not force:
+        # Before the ledger, one period (records[1:]) was always left out because it
+        # had been submitted by hand; an empty ledger does not know which, so nothing
+        # goes up until the periods already submitted are recorded
+        print("⛔ The upload ledger is empty: record the periods already submitted with "
+              "`python cli.py uploads --mark-uploaded MM/DD/YYYY` first (or upload with --force)")
+        return
+    # Due payrolls first (earliest pay date), then backfill alternating between clients
+    queue, skipped = ledger.plan(order_records(records_to_run), force=force)
+    for rec in skipped:
+        print(f"⏭️ Skipping {rec['PAY_PERIOD']} → {rec['PAY_DATE']}: {rec['REASON']}")
+    queue = [(0.0, rec) for rec in queue]  # (not before, record)
+    while queue:
+        not_before, rec = queue.pop(0)
+        wait = not_before - time.time()
+        if wait > 0:
+            print(f"⏳ Waiting {wait:.0f}s before retrying {rec['PAY_DATE']}")
+            time.sleep(wait)
+        changed = " (changed since the last upload)" if rec.get("CHANGED") else ""
+        print(f"\n▶️ Running upload for: {rec['PAY_PERIOD']} → {rec['PAY_DATE']}{changed}")
+        ledger.start(rec)
         try:
             # Set environment variables for the bot
             os.environ["FILENAME"] = rec["FILENAME"]
@@ -59,7 +84,38 @@ if __name__ == "__main__":
             os.environ["PAY_DATE"] = rec["PAY_DATE"]
             os.environ["FILE_PATH"] = rec["FILE_PATH"]
 
-            run_upload_bot()
+            uploaded = run_upload_bot(profile_name)
         except Exception as e:
             print(f"Failed for {rec['PAY_DATE']}: {e}")
             log_failure(rec, str(e))
+            retry_at = ledger.fail(rec, str(e))
+            if retry_at is not None:
+                # Back of the queue: the other periods go first while this one backs off
+                queue.append((retry_at, rec))
+                queue.sort(key=lambda item: item[0])
+            continue
+        if uploaded:
+            ledger.succeed(rec)
+            continue
+        # The bot's select/upload/review steps are switched off (agents.run_upload_bot):
+        # logging in is not an upload, so nothing is marked uploaded and the rest wait too
+        ledger.unconfirmed(rec, "bot did not confirm the upload")
+        print(f"⚠️ The upload bot did not confirm {rec['PAY_DATE']}; left it pending. Stopping here.")
+        break
+
+if __name__ == "__main__":
+    from src.csv_validator import validate_folder, format_validation
+
+    records = get_records_to_run()
+    # Only CSVs that pass the local pre-upload check go to the browser
+    valid = []
+    for rec in records:
+        report = validate_folder(os.path.dirname(rec["FILE_PATH"]))
+        if report["ok"]:
+            valid.append(rec)
+        else:
+            print(format_validation(report))
+    records = valid
+
+    # Periods already uploaded are skipped by the upload ledger (src/upload_ledger.py)
+    run_uploads(records)